@@ -0,0 +1,157 @@
+"""
+So sánh đường đọc kết quả truy vấn của DataChatbot (llm/fastapi/data_chatbot.py)
+trên DB DuckDB giả kiểu Shopee (benchmarks/shopee_synthetic.py):
+
+- legacy: fetchall + dict mỗi dòng + DataFrame + tabulate (trước thay đổi này)
+- arrow: LIMIT DATA_MAX_RESULT_ROWS đẩy xuống SQL, đọc dần RecordBatch Arrow,
+  xem trước/tóm tắt cắt lát từ kết quả dạng cột (ArrowResult)
+- arrow_unlimited: như arrow nhưng giữ toàn bộ kết quả (so với legacy cùng số dòng)
+
+    python benchmarks/arrow_result_bench.py --products 2000000 --rows 10000 100000 1000000 2000000
+
+Mỗi phép đo chạy trong một process riêng để đo RSS đỉnh (VmHWM) tăng thêm
+so với lúc vừa mở DB. `first_rows_ms` là thời điểm client có được các dòng xem
+trước. Mỗi dòng kết quả là một JSON.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [BE_DIR, os.path.dirname(os.path.abspath(__file__))]
+
+QUERY = "SELECT id, title, price_actual, item_rating, total_sold, shop_id FROM products WHERE id <= {rows}"
+
+
+class FakeModel:
+    """Model giả: trả về kế hoạch cố định cho bước sinh truy vấn và một câu cho bước tóm tắt."""
+
+    def __init__(self, query: str):
+        self.query = query
+
+    def invoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        if "\nUser Question: " in messages[-1].content:
+            return AIMessage(content=json.dumps({"database": "duckdb", "query": self.query, "explanation": "bench"}))
+        return AIMessage(content="summary")
+
+
+def peak_rss_mb() -> float:
+    # VmHWM là đỉnh của riêng process này; ru_maxrss giữ cả đỉnh của process cha qua fork/exec
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_legacy(conn, query: str) -> dict:
+    import pandas as pd
+    from tabulate import tabulate
+
+    start = time.perf_counter()
+    cursor = conn.execute(query)
+    cols = [desc[0] for desc in cursor.description]
+    result_data = [dict(zip(cols, row)) for row in cursor.fetchall()]
+    json.dumps(result_data[:20], indent=2, ensure_ascii=False, default=str)
+    df = pd.DataFrame(result_data)
+    tabulate(df.head(10), headers='keys', tablefmt='grid', showindex=False)
+    elapsed = (time.perf_counter() - start) * 1000
+    return {"result_rows": len(result_data), "first_rows_ms": round(elapsed, 1), "total_ms": round(elapsed, 1)}
+
+
+def run_arrow(conn, query: str, max_rows: int, batch_rows: int) -> dict:
+    from llm.fastapi.data_chatbot import DataChatbot
+
+    bot = DataChatbot(conn, FakeModel(query), max_rows=max_rows, batch_rows=batch_rows)
+    captured = {}
+    original = bot._execute_query
+
+    def execute(plan):
+        result, error = original(plan)
+        captured["result"] = result
+        return result, error
+
+    bot._execute_query = execute
+    start = time.perf_counter()
+    first_rows = None
+    for part in bot.ask("bench"):
+        if first_rows is None and part.startswith("| "):
+            first_rows = time.perf_counter()
+    elapsed = (time.perf_counter() - start) * 1000
+    result = captured["result"]
+    return {
+        "result_rows": result.num_rows,
+        "truncated": result.truncated,
+        "result_mb": round(result.nbytes / 2 ** 20, 1),
+        "first_rows_ms": round((first_rows - start) * 1000, 1),
+        "total_ms": round(elapsed, 1),
+    }
+
+
+def child(args):
+    import duckdb
+
+    # Import trước khi lấy mốc để RSS chỉ phản ánh phần đọc kết quả
+    import pandas  # noqa: F401
+    import tabulate  # noqa: F401
+    import llm.fastapi.data_chatbot  # noqa: F401
+
+    conn = duckdb.connect(args.db, read_only=True)
+    conn.execute("SELECT count(*) FROM products").fetchall()
+    baseline = peak_rss_mb()
+    query = QUERY.format(rows=args.child_rows)
+    if args.child == "legacy":
+        result = run_legacy(conn, query)
+    elif args.child == "arrow":
+        result = run_arrow(conn, query, args.max_rows, args.batch_rows)
+    else:
+        result = run_arrow(conn, query, args.child_rows, args.batch_rows)
+    result.update(variant=args.child, rows=args.child_rows, peak_rss_mb=round(peak_rss_mb() - baseline, 1))
+    print(json.dumps(result))
+
+
+def main(args) -> list:
+    from shopee_synthetic import build_database
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "shopee.db")
+        build_database(db, products=max(args.products, max(args.rows)), seed=args.seed)
+        for rows in args.rows:
+            for variant in ("legacy", "arrow", "arrow_unlimited"):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--db", db, "--child", variant,
+                     "--child-rows", str(rows), "--max-rows", str(args.max_rows), "--batch-rows", str(args.batch_rows)],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(json.dumps(result))
+                results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1000000)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--max-rows", type=int, default=100000, help="DATA_MAX_RESULT_ROWS")
+    parser.add_argument("--batch-rows", type=int, default=2048, help="DATA_ARROW_BATCH_ROWS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-rows", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
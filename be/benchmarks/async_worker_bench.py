@@ -0,0 +1,152 @@
+"""
+So sánh worker prefork (mỗi process một luồng sinh đồng bộ) với WORKER_MODE
+"async" (một process, nhiều luồng trên một event loop) khi có N luồng cùng
+lúc. LLM là FakeStreamingChatModel, Redis là fakeredis trong từng process
+(không có subscriber nên chi phí publish gần với một round trip thật).
+
+    python benchmarks/async_worker_bench.py --streams 200 --processes 4 --max-in-flight 200
+
+Đo: thời gian tới khi xong toàn bộ, luồng/giây, độ trễ mỗi luồng (submit ->
+completed) p50/p99, CPU và RSS tổng của các process worker.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def configure(args):
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_TTFT_MS": str(args.fake_ttft_ms),
+        "FAKE_LLM_TOKENS_PER_SEC": str(args.fake_tokens_per_sec),
+        "FAKE_LLM_JITTER": "0.2",
+        "FAKE_LLM_LENGTH": str(args.fake_length),
+        "WORKER_MAX_IN_FLIGHT": str(args.max_in_flight),
+        "METRICS_PUSH_INTERVAL_SECONDS": "3600",
+        "LOG_SAMPLE_RATE": "0",
+    })
+    if BE_DIR not in sys.path:
+        sys.path.insert(0, BE_DIR)
+
+
+def load_task():
+    import fakeredis
+    from llm.fastapi import task
+
+    task.init_worker_resources(fakeredis.FakeRedis(decode_responses=True))
+    task._async_redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return task
+
+
+def percentile_ms(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+
+def process_usage(pids: list) -> dict:
+    import psutil
+
+    cpu = rss = 0.0
+    for pid in pids:
+        proc = psutil.Process(pid)
+        times = proc.cpu_times()
+        cpu += times.user + times.system
+        rss += proc.memory_info().rss
+    return {"cpu_seconds": round(cpu, 2), "rss_mb": round(rss / 2 ** 20, 1)}
+
+
+_worker_task = None
+
+
+def _init_prefork(args):
+    global _worker_task
+    configure(args)
+    _worker_task = load_task()
+
+
+def _run_prefork(index: int) -> tuple:
+    _worker_task.process_chatbot_request.run(f"bench question {index}", f"bench-{index}")
+    return os.getpid(), time.time()
+
+
+def run_prefork(args) -> dict:
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(args.processes, initializer=_init_prefork, initargs=(args,)) as pool:
+        # Khởi động (import, dựng model) trước khi bấm giờ
+        pids = {pid for pid, _ in pool.map(_run_prefork, range(-args.processes, 0), chunksize=1)}
+        submitted = time.time()
+        results = pool.map(_run_prefork, range(args.streams), chunksize=1)
+        wall = time.time() - submitted
+        usage = process_usage(list(pids))
+
+    latencies = [done - submitted for _, done in results]
+    return {"mode": "prefork", "processes": args.processes, "wall_seconds": round(wall, 3), "latencies": latencies, **usage}
+
+
+def run_async(args) -> dict:
+    configure(args)
+    task = load_task()
+
+    warmup = task.stream_runner.submit("warmup", "bench-warmup", None)
+    warmup.result()
+
+    submitted = time.time()
+    latencies = []
+
+    def on_done(_):
+        latencies.append(time.time() - submitted)
+
+    futures = []
+    for index in range(args.streams):
+        future = task.stream_runner.submit(f"bench question {index}", f"bench-{index}", None)
+        future.add_done_callback(on_done)
+        futures.append(future)
+    for future in futures:
+        future.result()
+    wall = time.time() - submitted
+
+    return {
+        "mode": "async",
+        "processes": 1,
+        "max_in_flight": args.max_in_flight,
+        "wall_seconds": round(wall, 3),
+        "latencies": latencies,
+        **process_usage([os.getpid()])
+    }
+
+
+def summarize(result: dict, streams: int) -> dict:
+    latencies = result.pop("latencies")
+    return {
+        **result,
+        "streams": streams,
+        "streams_per_sec": round(streams / result["wall_seconds"], 2),
+        "latency_p50_ms": percentile_ms(latencies, 0.50),
+        "latency_p99_ms": percentile_ms(latencies, 0.99),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["prefork", "async", "both"], default="both")
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=4, help="số process của pool prefork")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--fake-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--fake-length", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.mode == "both":
+        # Mỗi chế độ chạy trong process riêng để RSS/CPU không lẫn nhau
+        for mode in ("prefork", "async"):
+            subprocess.run([sys.executable, *sys.argv, "--mode", mode], check=True)
+    else:
+        result = run_prefork(args) if args.mode == "prefork" else run_async(args)
+        print(json.dumps(summarize(result, args.streams)))
@@ -0,0 +1,88 @@
+"""
+Microbenchmark requests/sec cho một route cần xác thực, gọi app ASGI trực tiếp
+(không qua socket) để chỉ đo chi phí middleware:
+
+- none:   không có middleware xác thực
+- legacy: @app.middleware("http") + jwt.decode mỗi request (cách cũ)
+- asgi:   AuthMiddleware với cache claims
+
+    python benchmarks/auth_middleware_bench.py --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../llm/fastapi'))
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+
+from endpoints.helper.jwt_handler import create_access_token, settings
+from endpoints.helper.middleware import ALLOW_PATH, AuthMiddleware
+
+
+def build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/protected")
+    async def protected():
+        return {"ok": True}
+
+    if mode == "legacy":
+        @app.middleware("http")
+        async def check_valid_token(request: Request, call_next):
+            if request.url.path in ALLOW_PATH:
+                return await call_next(request)
+            token = request.headers.get("authorization", "").partition(" ")[2]
+            try:
+                request.state.user = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            except JWTError:
+                return JSONResponse(status_code=401, content={"detail": "Invalid token"})
+            return await call_next(request)
+    elif mode == "asgi":
+        app.add_middleware(AuthMiddleware)
+    return app
+
+
+async def run(mode: str, requests: int, token: str) -> dict:
+    app = build_app(mode)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/api/protected", "raw_path": b"/api/protected",
+        "query_string": b"", "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+    statuses.clear()
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    elapsed = time.perf_counter() - start
+
+    assert all(status == 200 for status in statuses), set(statuses)
+    return {"mode": mode, "requests": requests, "req_per_sec": round(requests / elapsed), "us_per_req": round(elapsed / requests * 1e6, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token({"sub": "bench@example.com", "username": "bench@example.com"})
+    for mode in ("none", "legacy", "asgi"):
+        print(json.dumps(asyncio.run(run(mode, args.requests, token))))
@@ -0,0 +1,193 @@
+"""
+Đo lịch sử hội thoại kiểu write-behind (endpoints/helper/history_store.py):
+
+1. insert: ghi --turns lượt từ hàng đợi Redis xuống SQLite tạm với từng
+   --batch-sizes (1 = mỗi lượt một transaction, như ghi thẳng từ worker).
+2. redis: dung lượng Redis khi chạy liên tục --rate task/giây trong
+   --seconds giây: result backend của Celery (RedisBackend thật, ghi lên
+   fakeredis hoặc --redis-url) với kết quả cũ (có câu trả lời, hết hạn sau 1
+   ngày - mặc định của Celery), kết quả mới (không có câu trả lời, hết hạn sau
+   CELERY_RESULT_EXPIRES_SECONDS), ignore_result; và độ dài tối đa của hàng
+   đợi lịch sử khi writer chạy song song.
+
+    python benchmarks/history_bench.py --turns 20000 --rate 200 --seconds 10
+
+Với fakeredis, byte được tính bằng độ dài khoá + giá trị (không gồm overhead
+của Redis cho mỗi khoá); với --redis-url là chênh lệch INFO used_memory.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [BE_DIR, os.path.join(BE_DIR, 'llm/fastapi')]
+
+RESPONSE = ("The product ships in two days and the shop has a high rating. " * 40)[:2000]
+
+
+def redis_client(args):
+    if args.redis_url:
+        import redis
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+        client.flushdb()
+        return client
+    import fakeredis
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def stored_bytes(client, args) -> int:
+    if args.redis_url:
+        return int(client.info("memory")["used_memory"])
+    total = 0
+    for key in client.scan_iter(count=1000):
+        kind = client.type(key)
+        if kind == "string":
+            total += len(key) + client.strlen(key)
+        elif kind == "list":
+            total += len(key) + sum(len(item.encode("utf-8")) for item in client.lrange(key, 0, -1))
+    return total
+
+
+def make_turns(count: int) -> list:
+    from core.history import turn_record
+
+    return [
+        turn_record(f"conv-{i % 500}", f"bench question {i}", RESPONSE, turn_id=f"turn-{i}")
+        for i in range(count)
+    ]
+
+
+def bench_insert(args) -> list:
+    from sqlalchemy import create_engine
+    from sqlmodel import SQLModel
+    from endpoints.helper import db_init  # noqa: F401  (đăng ký các bảng)
+    from endpoints.helper.history_store import HistoryWriter
+
+    turns = make_turns(args.turns)
+    results = []
+    for batch_size in args.batch_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/history.db")
+            SQLModel.metadata.create_all(engine)
+            client = redis_client(args)
+            client.rpush("history:pending", *turns)
+            writer = HistoryWriter(client, engine, "history:pending", batch_size=batch_size)
+
+            start = time.perf_counter()
+            while writer.drain_once():
+                pass
+            elapsed = time.perf_counter() - start
+            engine.dispose()
+        results.append({
+            "bench": "insert",
+            "batch_size": batch_size,
+            "turns": args.turns,
+            "seconds": round(elapsed, 3),
+            "turns_per_sec": round(args.turns / elapsed, 1),
+        })
+    return results
+
+
+def result_backend(client, expires, ignore_result: bool):
+    from celery import Celery
+
+    app = Celery("history_bench", backend="redis://localhost/0")
+    app.conf.update(result_expires=expires, task_ignore_result=ignore_result)
+    backend = app.backend
+    backend.__dict__["client"] = client
+    return app, backend
+
+
+def bench_redis(args) -> list:
+    from sqlalchemy import create_engine
+    from sqlmodel import SQLModel
+    from endpoints.helper import db_init  # noqa: F401
+    from endpoints.helper.history_store import HistoryWriter
+
+    configs = [
+        ("broker_result_with_response", 86400, False, {"status": "success", "response": RESPONSE, "conversation_id": "c"}),
+        ("result_without_response", args.result_expires, False, {"status": "success", "response_chars": len(RESPONSE), "conversation_id": "c"}),
+        ("ignore_result", args.result_expires, True, None),
+    ]
+    tasks = int(args.rate * args.seconds)
+    results = []
+    for name, expires, ignore_result, result in configs:
+        client = redis_client(args)
+        baseline = stored_bytes(client, args)
+        app, backend = result_backend(client, expires, ignore_result)
+        if not ignore_result:
+            for _ in range(tasks):
+                backend.store_result(str(uuid.uuid4()), result, "SUCCESS")
+        per_task = (stored_bytes(client, args) - baseline) / tasks
+        retained = min(expires, 86400) * args.rate
+        results.append({
+            "bench": "redis_results",
+            "config": name,
+            "bytes_per_task": round(per_task, 1),
+            "result_expires_seconds": expires,
+            "steady_state_mb": round(per_task * retained / 2 ** 20, 1),
+        })
+
+    # Hàng đợi lịch sử khi worker đẩy đều `rate` lượt/giây và writer chạy song song
+    client = redis_client(args)
+    turns = make_turns(tasks)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/history.db")
+        SQLModel.metadata.create_all(engine)
+        writer = HistoryWriter(client, engine, "history:pending", batch_size=500, interval=args.flush_interval)
+        stop = threading.Event()
+
+        def drain():
+            while not stop.is_set() or client.llen("history:pending"):
+                if writer.drain_once() < writer.batch_size:
+                    time.sleep(writer.interval)
+
+        thread = threading.Thread(target=drain, daemon=True)
+        thread.start()
+        max_len = max_bytes = 0
+        start = time.perf_counter()
+        for index, turn in enumerate(turns):
+            delay = start + index / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            client.rpush("history:pending", turn)
+            if index % 50 == 0:
+                length = client.llen("history:pending")
+                if length > max_len:
+                    max_len, max_bytes = length, stored_bytes(client, args)
+        stop.set()
+        thread.join()
+        engine.dispose()
+    results.append({
+        "bench": "history_queue",
+        "rate": args.rate,
+        "turns": tasks,
+        "written": writer.written,
+        "max_queue_len": max_len,
+        "max_queue_kb": round(max_bytes / 1024, 1),
+    })
+    return results
+
+
+def main(args) -> list:
+    results = bench_insert(args) + bench_redis(args)
+    for result in results:
+        print(json.dumps(result))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--rate", type=float, default=200.0, help="task/giây cho phần đo Redis")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--result-expires", type=int, default=3600)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--redis-url", help="đo trên Redis thật (DB sẽ bị FLUSHDB)")
+    main(parser.parse_args())
@@ -0,0 +1,292 @@
+"""
+Load test end-to-end cho luồng /api/chat -> Celery -> Redis -> Socket.IO.
+
+Mỗi client Socket.IO join một conversation, gửi chat qua /api/chat rồi đo:
+- ttft: từ lúc gửi POST tới sự kiện gen_token đầu tiên
+- inter-token gap: khoảng cách giữa các sự kiện gen_token liên tiếp
+- e2e: từ lúc gửi POST tới sự kiện completed
+Kết quả (p50/p95/p99) được in ra dạng JSON.
+
+Chạy toàn bộ stack trong một process, không cần Redis/Gemini thật:
+
+    python benchmarks/load_test.py --local --clients 20 --chats 3 \\
+        --fake-ttft-ms 200 --fake-tokens-per-sec 50 --fake-length 200
+
+Hoặc bắn vào stack đang chạy (docker compose, LLM_PROVIDER tuỳ cấu hình):
+
+    python benchmarks/load_test.py --api-url http://localhost:8000 --socket-url http://localhost:9000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": pick(1.0)}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalStack:
+    """
+    Dựng stack trong process: Redis giả (fakeredis), Celery broker `memory://`
+    với worker thread trong process, Socket.IO server chạy uvicorn trên cổng
+    ngẫu nhiên và FastAPI gọi trực tiếp qua ASGI.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.socket_url = None
+        self.api_transport = None
+        self._worker_cm = None
+        self._uvicorn = None
+        self._tasks = []
+
+    def configure_env(self):
+        os.environ.update({
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_TTFT_MS": str(self.args.fake_ttft_ms),
+            "FAKE_LLM_TOKENS_PER_SEC": str(self.args.fake_tokens_per_sec),
+            "FAKE_LLM_JITTER": str(self.args.fake_jitter),
+            "FAKE_LLM_LENGTH": str(self.args.fake_length),
+            # Mọi client đi từ cùng một IP và broker là memory://
+            "CHAT_RATE_LIMIT_CAPACITY": "0",
+            "CHAT_MAX_QUEUE_DEPTH": "0",
+            # Celery ưu tiên CELERY_BROKER_URL/CELERY_RESULT_BACKEND trong env hơn
+            # app.conf, nên broker Redis từ môi trường phải được thay ở đây
+            "CELERY_BROKER_URL": "memory://",
+            "CELERY_RESULT_BACKEND": "cache+memory://",
+            # Lịch sử ghi vào file tạm, không đụng app.db
+            "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='load_test_'), 'app.db')}",
+        })
+        sys.path[:0] = [BE_DIR, os.path.join(BE_DIR, 'llm/fastapi'), os.path.join(BE_DIR, 'socket_server')]
+
+    async def start(self):
+        self.configure_env()
+
+        import fakeredis
+        import httpx
+        import uvicorn
+        from celery.contrib.testing.worker import start_worker
+        from fakeredis import aioredis as fake_aioredis
+        from socketio import ASGIApp
+
+        import celery_app as api_celery
+        import server as socket_server
+        from core.metrics import make_metrics_app, registry
+        from endpoints import chatbot_api
+        from endpoints.helper.db_init import init_db
+        from fastapi_main import app as api_app
+        from llm.fastapi import celery_app as worker_celery
+        from llm.fastapi import task
+
+        # Worker (sync) và Socket.IO server (async) dùng chung một Redis giả
+        redis_server = fakeredis.FakeServer()
+        task.init_worker_resources(fakeredis.FakeRedis(server=redis_server, decode_responses=True))
+        chatbot_api.init_resources(fakeredis.FakeRedis(server=redis_server, decode_responses=True))
+        socket_server.init_redis(fake_aioredis.FakeRedis(server=redis_server))
+        # FastAPI được gọi qua ASGITransport, lifespan (init_db) không chạy
+        init_db()
+
+        # chatbot_api import `celery_app` như module top-level, worker dùng
+        # `llm.fastapi.celery_app`; cả hai cùng trỏ vào broker memory:// của process
+        for app in (api_celery.celery_app, worker_celery.celery_app):
+            # memory:// mặc định poll mỗi 1s, làm sai lệch TTFT
+            app.conf.update(
+                broker_url="memory://",
+                result_backend="cache+memory://",
+                broker_transport_options={"polling_interval": 0.005}
+            )
+        self._worker_cm = start_worker(
+            worker_celery.celery_app,
+            pool="threads",
+            concurrency=self.args.worker_concurrency,
+            perform_ping_check=False,
+            loglevel="WARNING"
+        )
+        threading.Thread(target=self._worker_cm.__enter__, daemon=True).start()
+
+        port = free_port()
+        self._uvicorn = uvicorn.Server(uvicorn.Config(ASGIApp(socket_server.sio, other_asgi_app=make_metrics_app(registry.render)), host="127.0.0.1", port=port, log_level="warning"))
+        self._tasks = [
+            asyncio.create_task(socket_server.redis_listener(socket_server.sio)),
+            asyncio.create_task(self._uvicorn.serve())
+        ]
+        while not self._uvicorn.started:
+            await asyncio.sleep(0.05)
+
+        self.socket_url = f"http://127.0.0.1:{port}"
+        self.api_transport = httpx.ASGITransport(app=api_app)
+
+    async def stop(self):
+        if self._uvicorn is not None:
+            self._uvicorn.should_exit = True
+            await self._tasks[-1]
+        for task in self._tasks[:-1]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._worker_cm is not None:
+            with contextlib.suppress(Exception):
+                self._worker_cm.__exit__(None, None, None)
+
+
+async def run_client(index: int, args, http_client, socket_url: str, results: dict):
+    import socketio
+
+    client = socketio.AsyncClient(reconnection=False)
+    state = {}
+    joined = asyncio.Event()
+
+    @client.on("room_joined")
+    async def on_joined(payload):
+        joined.set()
+
+    @client.on("gen_token")
+    async def on_token(payload):
+        state["tokens"].append(time.perf_counter())
+        state["chars"] += len(payload.get("data", ""))
+
+    @client.on("completed")
+    async def on_completed(payload):
+        state["completed_at"] = time.perf_counter()
+        state["done"].set()
+
+    @client.on("error")
+    async def on_error(payload):
+        state["error"] = payload
+        state["done"].set()
+
+    # Frame v2 "2|<event_id>|<seq>|<code>|<body>" (core/wire.py) khi client báo auth {"wire": 2}
+    @client.on("f")
+    async def on_frame(frame):
+        _, _, _, code, body = frame.split("|", 4)
+        if code == "t":
+            await on_token({"data": body})
+        elif code == "c":
+            await on_completed(json.loads(body))
+        elif code == "e":
+            await on_error(json.loads(body))
+
+    await client.connect(socket_url, transports=["websocket"], auth={"wire": args.wire})
+    try:
+        for chat in range(args.chats):
+            conversation_id = str(uuid.uuid4())
+            joined.clear()
+            await client.emit("join_room", {"conversation_id": {"conversation_id": conversation_id}})
+            await asyncio.wait_for(joined.wait(), timeout=10)
+
+            state.update(tokens=[], chars=0, done=asyncio.Event(), error=None, completed_at=None)
+            sent_at = time.perf_counter()
+            response = await http_client.post("/api/chat", json={
+                "message": f"load test question {index}-{chat}",
+                "conversation_id": conversation_id
+            })
+            if response.status_code != 200:
+                results["errors"].append({"status": response.status_code, "body": response.text[:200]})
+                continue
+
+            try:
+                await asyncio.wait_for(state["done"].wait(), timeout=args.timeout)
+            except asyncio.TimeoutError:
+                results["errors"].append({"conversation_id": conversation_id, "error": "timeout"})
+                continue
+            if state["error"]:
+                results["errors"].append({"conversation_id": conversation_id, "error": state["error"]})
+                continue
+
+            tokens = state["tokens"]
+            if tokens:
+                results["ttft"].append(tokens[0] - sent_at)
+                results["gap"].extend(b - a for a, b in zip(tokens, tokens[1:]))
+            e2e = state["completed_at"] - sent_at
+            results["e2e"].append(e2e)
+            results["chars_per_sec"].append(state["chars"] / e2e if e2e else 0.0)
+            await client.emit("leave_room", {"conversation_id": conversation_id})
+    finally:
+        await client.disconnect()
+
+
+async def main(args):
+    import httpx
+
+    stack = None
+    if args.local:
+        stack = LocalStack(args)
+        await stack.start()
+        socket_url = stack.socket_url
+        http_client = httpx.AsyncClient(transport=stack.api_transport, base_url="http://local", timeout=30)
+    else:
+        socket_url = args.socket_url
+        http_client = httpx.AsyncClient(base_url=args.api_url, timeout=30)
+
+    results = {"ttft": [], "gap": [], "e2e": [], "chars_per_sec": [], "errors": []}
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_client(i, args, http_client, socket_url, results) for i in range(args.clients)))
+    finally:
+        await http_client.aclose()
+        if stack is not None:
+            await stack.stop()
+    elapsed = time.perf_counter() - started
+
+    rates = sorted(results["chars_per_sec"])
+    return {
+        "mode": "local" if args.local else "remote",
+        "clients": args.clients,
+        "chats_per_client": args.chats,
+        "completed": len(results["e2e"]),
+        "errors": len(results["errors"]),
+        "error_samples": results["errors"][:5],
+        "wall_seconds": round(elapsed, 3),
+        "chats_per_sec": round(len(results["e2e"]) / elapsed, 3),
+        "ttft": percentiles(results["ttft"]),
+        "inter_token_gap": percentiles(results["gap"]),
+        "e2e": percentiles(results["e2e"]),
+        "chars_per_sec_p50": round(rates[len(rates) // 2], 1) if rates else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--local", action="store_true", help="dựng toàn bộ stack trong process (fakeredis + memory broker + fake LLM)")
+    parser.add_argument("--api-url", default="http://localhost:8000")
+    parser.add_argument("--socket-url", default="http://localhost:9000")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--chats", type=int, default=3, help="số chat tuần tự mỗi client")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--worker-concurrency", type=int, default=8)
+    parser.add_argument("--fake-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--fake-jitter", type=float, default=0.2)
+    parser.add_argument("--fake-length", type=int, default=200)
+    parser.add_argument("--wire", type=int, default=1, help="phiên bản giao thức client báo khi connect (2 = nhận frame)")
+    parser.add_argument("--output", help="ghi kết quả JSON ra file thay vì stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report))
@@ -0,0 +1,160 @@
+"""
+Đo throughput của /api/login và /api/register chạy đồng thời, cùng độ trễ của
+event loop trong lúc đó.
+
+    python benchmarks/login_bench.py --requests 200 --concurrency 50
+    python benchmarks/login_bench.py --requests 2000 --register-ratio 0.2 --bcrypt-rounds 4
+    python benchmarks/login_bench.py --no-user-cache   # mọi lượt tra user đều xuống DB
+    python benchmarks/login_bench.py --inline          # chạy bcrypt ngay trên event loop để so sánh
+
+Chạy app trong process qua httpx.ASGITransport với một SQLite tạm (WAL). Trong
+`--requests` request, tỉ lệ `--register-ratio` là register user mới; còn lại
+là login: đúng mật khẩu của một user đã có (kể cả user vừa register), sai mật
+khẩu, hoặc username không tồn tại. `--bcrypt-rounds` nhỏ để phần DB/cache
+không bị bcrypt (mặc định 12 vòng, ~200 ms) che mất. Kết quả là một dòng JSON,
+gồm số request trả về mã khác mong đợi (`unexpected`) và thống kê cache user.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+FASTAPI_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../llm/fastapi'))
+sys.path.append(FASTAPI_DIR)
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float, samples: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000)
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 1)
+
+
+async def run(args) -> dict:
+    import httpx
+    from endpoints import authen_api
+    from endpoints.helper import password_checker
+    from endpoints.helper.db_init import get_async_engine, init_db
+    from fastapi_main import app
+
+    if args.bcrypt_rounds:
+        password_checker.pwd_context.update(bcrypt__rounds=args.bcrypt_rounds)
+    # App được gọi qua ASGITransport, lifespan không chạy
+    init_db()
+    authen_api.init_resources()
+    store = password_checker.get_user_store()
+    hashed_password = password_checker.gen_hashed_password("correct-password")
+    users = [f"user{i}@example.com" for i in range(args.users)]
+    for username in users:
+        await store.create(username, hashed_password)
+    # Cache nguội như lúc process vừa khởi động
+    password_checker._user_store = None
+    store = password_checker.get_user_store()
+
+    if args.inline:
+        async def run_inline(fn, *args):
+            return fn(*args)
+        authen_api.auth_executor.run = run_inline
+
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = {"login": [], "register": []}
+    unexpected = []
+
+    def next_request(i: int):
+        if rng.random() < args.register_ratio:
+            username = f"new{i}@example.com"
+            return "register", {"email": username, "password": "correct-password"}, 201, username
+        kind = rng.random()
+        if kind < 0.6:
+            return "login", {"email": rng.choice(users), "password": "correct-password"}, 200, None
+        if kind < 0.8:
+            return "login", {"email": rng.choice(users), "password": "wrong-password"}, 401, None
+        return "login", {"email": f"nobody{rng.randrange(1000)}@example.com", "password": "whatever"}, 401, None
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def call(i: int):
+            async with semaphore:
+                op, body, expected, registered = next_request(i)
+                start = time.perf_counter()
+                response = await client.post(f"/api/{op}", json=body)
+                latencies[op].append((time.perf_counter() - start) * 1000)
+                if response.status_code != expected:
+                    unexpected.append(f"{op}:{response.status_code}")
+                elif registered:
+                    # User vừa register phải login được ngay
+                    users.append(registered)
+                return response.status_code
+
+        stop = asyncio.Event()
+        lag_samples = []
+        lag_task = asyncio.create_task(measure_loop_lag(stop, 0.01, lag_samples))
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(call(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await lag_task
+
+    return {
+        "mode": "inline" if args.inline else "executor",
+        "user_cache": not args.no_user_cache,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "register_ratio": args.register_ratio,
+        "bcrypt_rounds": args.bcrypt_rounds or "default",
+        "requests_per_sec": round(args.requests / elapsed, 1),
+        "logins_per_sec": round(len(latencies["login"]) / elapsed, 1),
+        "registers_per_sec": round(len(latencies["register"]) / elapsed, 1),
+        "login_ms_p50": percentile(latencies["login"], 0.5),
+        "login_ms_p99": percentile(latencies["login"], 0.99),
+        "register_ms_p50": percentile(latencies["register"], 0.5),
+        "register_ms_p99": percentile(latencies["register"], 0.99),
+        "loop_lag_ms_p50": round(statistics.median(lag_samples), 2) if lag_samples else None,
+        "loop_lag_ms_max": round(max(lag_samples), 2) if lag_samples else None,
+        "status_counts": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "unexpected": len(unexpected),
+        "user_store": store.stats(),
+        "pool": get_async_engine().pool.status(),
+    }
+
+
+async def main(args) -> dict:
+    from endpoints.helper.db_init import dispose_engines
+    try:
+        return await run(args)
+    finally:
+        # Kết nối aiosqlite chạy trong thread riêng, không đóng thì process không thoát
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--register-ratio", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=100, help="số user có sẵn trước khi đo")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="mặc định: của passlib (12)")
+    parser.add_argument("--no-user-cache", action="store_true")
+    parser.add_argument("--inline", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.no_user_cache:
+        os.environ.update(AUTH_USER_CACHE_SIZE="0", AUTH_NEGATIVE_CACHE_SIZE="0")
+    # DATABASE_URL mặc định trỏ tới ./app.db nên chạy trong thư mục tạm
+    os.chdir(tempfile.mkdtemp(prefix="login_bench_"))
+    print(json.dumps(asyncio.run(main(args))))
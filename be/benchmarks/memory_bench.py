@@ -0,0 +1,66 @@
+"""
+So sánh kích thước prompt và thời gian dựng prompt theo độ dài hội thoại:
+dán toàn bộ lịch sử (cách người dùng đang làm) vs ConversationMemory.
+
+    python benchmarks/memory_bench.py --turns 1 10 50 200 1000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../llm/fastapi'))
+from langchain.schema import SystemMessage
+from memory import ConversationMemory, ExtractiveSummarizer, InMemoryStore, estimate_tokens
+
+SYSTEM = SystemMessage(content="You are a helpful Assistant, your task is to answer user questions the best you can.")
+
+
+def fake_turn(rng: random.Random, words: int) -> str:
+    sentence = " ".join(f"w{rng.randint(0, 5000)}" for _ in range(words))
+    return f"{sentence}. Follow up detail {rng.randint(0, 99)}."
+
+
+def prompt_tokens(messages) -> int:
+    return sum(estimate_tokens(message.content) for message in messages)
+
+
+def run(turns: int, budget: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    memory = ConversationMemory(InMemoryStore(), ExtractiveSummarizer(), budget, summary_max_tokens=300)
+    history = []
+    record_seconds = 0.0
+
+    for _ in range(turns):
+        question, answer = fake_turn(rng, 20), fake_turn(rng, 120)
+        history.append(f"user: {question}\nassistant: {answer}")
+        start = time.perf_counter()
+        memory.record_turn("bench", memory.load("bench"), question, answer)
+        record_seconds += time.perf_counter() - start
+
+    question = fake_turn(rng, 20)
+    naive_prompt = "\n".join(history + [question])
+
+    start = time.perf_counter()
+    messages = memory.build_messages(memory.load("bench"), SYSTEM, question)
+    assemble_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "turns": turns,
+        "naive_prompt_tokens": estimate_tokens(SYSTEM.content) + estimate_tokens(naive_prompt),
+        "memory_prompt_tokens": prompt_tokens(messages),
+        "assemble_ms": round(assemble_ms, 4),
+        "record_turn_ms_mean": round(record_seconds / turns * 1000, 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 10, 50, 200, 1000])
+    parser.add_argument("--budget", type=int, default=2000)
+    args = parser.parse_args()
+
+    for turns in args.turns:
+        print(json.dumps(run(turns, args.budget)))
@@ -0,0 +1,98 @@
+"""
+Đo ModelPool (llm/fastapi/model_pool.py) với các backend giả: TTFT p50/p99
+và tỉ lệ lỗi của luồng chat khi dùng một backend, pool chỉ fallback, và pool
+có hedging. Mỗi cấu hình là một chuỗi LLM_POOL, ví dụ backend nhanh nhưng có
+đuôi chậm + lỗi, cạnh một backend chậm hơn nhưng ổn định:
+
+    python benchmarks/model_pool_bench.py --requests 200 --concurrency 20 \\
+        --primary "fake:primary?ttft_ms=150&ttft_tail_rate=0.05&ttft_tail_ms=3000&fail_rate=0.05" \\
+        --secondary "fake:secondary?ttft_ms=300" --hedge-after-ms 400
+
+Mỗi request là một luồng `astream` trên cùng event loop; mỗi dòng kết quả là
+một JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BE_DIR not in sys.path:
+    sys.path.insert(0, BE_DIR)
+
+
+def percentile_ms(values: list, q: float) -> float:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+
+async def run_config(name: str, pool, requests: int, concurrency: int) -> dict:
+    from langchain_core.messages import HumanMessage
+
+    slots = asyncio.Semaphore(concurrency)
+    ttfts, errors = [], 0
+
+    async def one(index: int):
+        nonlocal errors
+        async with slots:
+            start = time.monotonic()
+            try:
+                async for _ in pool.astream([HumanMessage(content=f"bench question {index}")]):
+                    if len(ttfts) < requests and start is not None:
+                        ttfts.append(time.monotonic() - start)
+                        start = None
+            except Exception:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    return {
+        "config": name,
+        "requests": requests,
+        "wall_seconds": round(time.monotonic() - started, 2),
+        "error_rate": round(errors / requests, 3),
+        "ttft_p50_ms": percentile_ms(ttfts, 0.50),
+        "ttft_p99_ms": percentile_ms(ttfts, 0.99),
+        **pool.stats(),
+    }
+
+
+def main(args) -> list:
+    from core.config import settings
+    from llm.fastapi.model_pool import build_model_pool
+
+    configs = [
+        ("single", args.primary, 0.0),
+        ("fallback", f"{args.primary},{args.secondary}", 0.0),
+        ("hedged", f"{args.primary},{args.secondary}", args.hedge_after_ms),
+    ]
+    results = []
+    for name, spec, hedge_after_ms in configs:
+        pool_settings = settings.model_copy(update={
+            "LLM_POOL": spec,
+            "LLM_HEDGE_AFTER_MS": hedge_after_ms,
+            "FAKE_LLM_LENGTH": args.fake_length,
+            "FAKE_LLM_TOKENS_PER_SEC": args.fake_tokens_per_sec,
+        })
+        result = asyncio.run(run_config(name, build_model_pool(pool_settings), args.requests, args.concurrency))
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--primary", default="fake:primary?ttft_ms=150&ttft_tail_rate=0.05&ttft_tail_ms=3000&fail_rate=0.05"
+    )
+    parser.add_argument("--secondary", default="fake:secondary?ttft_ms=300")
+    parser.add_argument("--hedge-after-ms", type=float, default=400.0)
+    parser.add_argument("--fake-length", type=int, default=20)
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=200.0)
+    main(parser.parse_args())
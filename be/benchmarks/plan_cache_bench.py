@@ -0,0 +1,198 @@
+"""
+Đo cache kế hoạch truy vấn của DataChatbot (llm/fastapi/plan_cache.py) trên
+DB DuckDB giả kiểu Shopee (benchmarks/shopee_synthetic.py): độ trễ lập kế
+hoạch + thực thi, số lần gọi LLM sinh truy vấn và tỉ lệ hit, khi không có cache
+và khi có cache, với các câu hỏi cùng dạng khác số liệu/cách viết.
+
+    python benchmarks/plan_cache_bench.py --products 200000 --questions 500 --llm-ms 800
+
+LLM sinh truy vấn là model giả (trả về kế hoạch JSON sau --llm-ms ms). Giữa
+lượt chạy có cache, DB được thêm một bảng để kiểm tra việc bỏ cache khi schema
+đổi. Mỗi dòng kết quả là một JSON.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [BE_DIR, os.path.dirname(os.path.abspath(__file__))]
+
+from shopee_synthetic import CATEGORIES, ITEMS, build_database  # noqa: E402
+
+# (các cách hỏi, hàm sinh giá trị, SQL mà model giả trả về)
+QUESTION_KINDS = [
+    (
+        ["What are the top {0} best-selling products?", "top {0} best selling products please",
+         "Show me the top {0} best-selling products"],
+        lambda rng: [rng.randint(3, 50)],
+        "SELECT title, total_sold FROM products ORDER BY total_sold DESC LIMIT {0};",
+    ),
+    (
+        ["Products with rating above {0} and price under {1}", "products with rating above {0} and price under {1}?"],
+        lambda rng: [rng.choice(["4.5", "4.2", "4.8"]), rng.choice([50000, 100000, 200000])],
+        "SELECT title, price_actual, item_rating FROM products WHERE item_rating > {0} AND price_actual < {1} ORDER BY total_sold DESC LIMIT 20",
+    ),
+    (
+        ["How many products are in category '{0}'?", "how many products are in category \"{0}\""],
+        lambda rng: [rng.choice(CATEGORIES)],
+        "SELECT count(*) AS products FROM product_categories pc JOIN categories c ON c.id = pc.category_id WHERE c.name = '{0}'",
+    ),
+    (
+        ["Top {0} shops by revenue", "list the top {0} shops by revenue"],
+        lambda rng: [rng.randint(3, 20)],
+        "SELECT s.seller_name, sum(p.price_actual * p.total_sold) AS revenue FROM products p JOIN shops s ON s.id = p.shop_id GROUP BY 1 ORDER BY 2 DESC LIMIT {0}",
+    ),
+    (
+        ["Best-selling products whose title contains '{0}'"],
+        lambda rng: [rng.choice(ITEMS)],
+        "SELECT title, total_sold FROM products WHERE title ILIKE '%{0}%' ORDER BY total_sold DESC LIMIT 10",
+    ),
+]
+
+
+class FakePlanner:
+    """Model giả cho `_generate_query_plan`: tra câu hỏi về SQL tương ứng, chờ `latency` giây."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._patterns = []
+        for phrasings, _, sql in QUESTION_KINDS:
+            for phrasing in phrasings:
+                pattern = re.escape(phrasing).replace(r"\{0\}", "(.+?)").replace(r"\{1\}", "(.+?)")
+                self._patterns.append((re.compile(pattern + "$"), sql))
+
+    def invoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        with self._lock:
+            self.calls += 1
+        question = messages[-1].content.rsplit("User Question: ", 1)[-1]
+        time.sleep(self.latency)
+        for pattern, sql in self._patterns:
+            match = pattern.match(question)
+            if match:
+                plan = {"database": "duckdb", "query": sql.format(*match.groups()), "explanation": "Analytical query."}
+                return AIMessage(content="```json\n" + json.dumps(plan) + "\n```")
+        raise ValueError(f"unknown question: {question}")
+
+
+def make_questions(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        phrasings, values, _ = rng.choice(QUESTION_KINDS)
+        questions.append(rng.choice(phrasings).format(*values(rng)))
+    return questions
+
+
+def percentile_ms(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+
+def run(name: str, conn, questions: list, args, use_cache: bool) -> dict:
+    from llm.fastapi.data_chatbot import DataChatbot
+    from llm.fastapi.plan_cache import PlanCache
+
+    planner = FakePlanner(args.llm_ms / 1000)
+    plan_cache = PlanCache(conn, schema_check_interval=0.05) if use_cache else None
+    bot = DataChatbot(conn, planner, plan_cache=plan_cache)
+    plan_times, execute_times, errors = [], [], 0
+
+    def one(question):
+        start = time.perf_counter()
+        plan = bot._plan(question)
+        planned = time.perf_counter()
+        _, error = bot._execute_query(plan)
+        return planned - start, time.perf_counter() - planned, error
+
+    half = len(questions) // 2
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for part, batch in enumerate((questions[:half], questions[half:])):
+            if part == 1 and use_cache:
+                # Schema đổi giữa chừng: kế hoạch cũ phải bị bỏ
+                conn.execute("CREATE OR REPLACE TABLE bench_schema_change(id INTEGER)")
+                time.sleep(plan_cache.schema_check_interval)
+            for plan_time, execute_time, error in pool.map(one, batch):
+                plan_times.append(plan_time)
+                execute_times.append(execute_time)
+                errors += error is not None
+    if use_cache:
+        conn.execute("DROP TABLE IF EXISTS bench_schema_change")
+
+    result = {
+        "variant": name,
+        "questions": len(questions),
+        "llm_calls": planner.calls,
+        "errors": errors,
+        "plan_p50_ms": percentile_ms(plan_times, 0.5),
+        "plan_p99_ms": percentile_ms(plan_times, 0.99),
+        "execute_p50_ms": percentile_ms(execute_times, 0.5),
+        "plan_total_s": round(sum(plan_times), 2),
+    }
+    if plan_cache is not None:
+        stats = plan_cache.stats()
+        result.update(
+            hit_rate=round(stats["hits"] / max(1, stats["hits"] + stats["misses"]), 3),
+            plans=stats["plans"],
+            invalidations=stats["invalidations"],
+        )
+    return result
+
+
+def execute_only(conn, args) -> list:
+    """Thời gian thực thi một truy vấn nhỏ: SQL thô mỗi lần vs EXECUTE prepared statement."""
+    cursor = conn.cursor()
+    sql = "SELECT title, total_sold FROM products WHERE id = {0}"
+    cursor.execute("PREPARE bench_point AS " + sql.format("$1"))
+    variants = {"raw_sql": sql, "prepared": "EXECUTE bench_point({0})"}
+    best = dict.fromkeys(variants, float("inf"))
+    # Xen kẽ hai cách qua nhiều vòng, lấy vòng nhanh nhất của mỗi cách
+    for _ in range(5):
+        for name, statement in variants.items():
+            start = time.perf_counter()
+            for i in range(args.execute_runs):
+                cursor.execute(statement.format(i % args.products + 1)).fetchall()
+            best[name] = min(best[name], time.perf_counter() - start)
+    return [
+        {"variant": f"execute_{name}", "runs": args.execute_runs, "us_per_query": round(best[name] / args.execute_runs * 1e6, 1)}
+        for name in variants
+    ]
+
+
+def main(args) -> list:
+    import duckdb
+
+    questions = make_questions(args.questions, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shopee.db")
+        build_database(path, products=args.products, seed=args.seed)
+        conn = duckdb.connect(path)
+        results = [
+            run("no_cache", conn, questions, args, use_cache=False),
+            run("plan_cache", conn, questions, args, use_cache=True),
+        ] + execute_only(conn, args)
+        conn.close()
+    for result in results:
+        print(json.dumps(result))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--llm-ms", type=float, default=800.0, help="độ trễ của LLM sinh truy vấn")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--execute-runs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
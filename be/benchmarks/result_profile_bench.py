@@ -0,0 +1,111 @@
+"""
+So sánh phần kết quả trong prompt tóm tắt của DataChatbot:
+
+- legacy: json.dumps(20 dòng đầu, indent=2) (trước thay đổi này)
+- profile: thống kê theo cột + dòng mẫu phân tầng trong ngân sách token
+  (llm/fastapi/result_profile.py)
+
+Kết quả truy vấn giả kiểu Shopee (sản phẩm JOIN shop JOIN danh mục, cột lấy
+từ benchmarks/shopee_synthetic.py) được dựng thẳng bằng Arrow với số dòng từ
+--rows. Với mỗi kích thước: số token (ước lượng ~4 ký tự/token), số dòng mà
+phần tóm tắt phản ánh, thời gian dựng và độ trễ tóm tắt với model giả có chi
+phí prefill --llm-base-ms + --llm-ms-per-1k-tokens.
+
+    python benchmarks/result_profile_bench.py --rows 10 1000 100000 1000000 10000000
+
+Mỗi dòng kết quả là một JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [BE_DIR, os.path.dirname(os.path.abspath(__file__))]
+
+from shopee_synthetic import BRANDS, CATEGORIES, ITEMS, VARIANTS  # noqa: E402
+
+
+def make_result(rows: int, seed: int):
+    """ArrowResult `rows` dòng: id, title, price_actual, item_rating, total_sold, seller_name, category."""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    from llm.fastapi.arrow_result import ArrowResult
+
+    rng = np.random.default_rng(seed)
+
+    def pick(values):
+        return pc.take(pa.array(values), pa.array(rng.integers(0, len(values), rows)))
+
+    title = pc.binary_join_element_wise(
+        pick(BRANDS), pick(ITEMS), pick(VARIANTS), pc.cast(pa.array(rng.integers(1, 100, rows)), pa.string()), " "
+    )
+    rating = np.round(rng.uniform(3.0, 5.0, rows), 1)
+    table = pa.table({
+        "id": pa.array(np.arange(1, rows + 1)),
+        "title": title,
+        "price_actual": pa.array(np.round(rng.lognormal(12, 1, rows), -3)),
+        "item_rating": pa.array(rating, mask=rng.random(rows) < 0.1),
+        "total_sold": pa.array(rng.zipf(1.6, rows).clip(0, 500000)),
+        "seller_name": pc.binary_join_element_wise("shop_", pc.cast(pa.array(rng.integers(1, 2001, rows)), pa.string()), ""),
+        "category": pick(CATEGORIES),
+    })
+    return ArrowResult(schema=table.schema, batches=table.to_batches(max_chunksize=2048))
+
+
+def legacy_prompt(result, rows: int) -> str:
+    return json.dumps(result.rows(rows), indent=2, ensure_ascii=False, default=str)
+
+
+def main(args) -> list:
+    from llm.fastapi.memory import estimate_tokens
+    from llm.fastapi.result_profile import ResultProfiler
+
+    profiler = ResultProfiler(
+        top_k=args.top_k, sample_rows=args.sample_rows, token_budget=args.token_budget, sample_limit=args.sample_limit
+    )
+    results = []
+    for rows in args.rows:
+        result = make_result(rows, args.seed)
+        variants = {
+            "legacy": (lambda: legacy_prompt(result, 20), min(rows, 20)),
+            "profile": (lambda: profiler.summarize(result), rows),
+        }
+        for name, (build, covered) in variants.items():
+            build()
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                text = build()
+                timings.append((time.perf_counter() - start) * 1000)
+            build_ms = min(timings)
+            tokens = estimate_tokens(text)
+            output = {
+                "variant": name,
+                "rows": rows,
+                "result_mb": round(result.nbytes / 2 ** 20, 1),
+                "prompt_tokens": tokens,
+                "rows_covered": covered,
+                "build_ms": round(build_ms, 2),
+                "summary_latency_ms": round(build_ms + args.llm_base_ms + args.llm_ms_per_1k_tokens * tokens / 1000, 1),
+            }
+            print(json.dumps(output))
+            results.append(output)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100000, 1000000, 10000000])
+    parser.add_argument("--token-budget", type=int, default=600, help="DATA_SUMMARY_TOKEN_BUDGET")
+    parser.add_argument("--sample-rows", type=int, default=12, help="DATA_SUMMARY_ROWS")
+    parser.add_argument("--top-k", type=int, default=5, help="DATA_PROFILE_TOP_K")
+    parser.add_argument("--sample-limit", type=int, default=200000, help="DATA_PROFILE_SAMPLE_LIMIT")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-base-ms", type=float, default=300.0)
+    parser.add_argument("--llm-ms-per-1k-tokens", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
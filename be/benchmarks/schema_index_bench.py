@@ -0,0 +1,131 @@
+"""
+Đo prompt sinh truy vấn của DataChatbot khi schema lớn dần: toàn bộ schema
+(như _CODE_GENERATION_PROMPT_TEMPLATE) so với prompt tối giản từ chỉ mục schema
+(llm/fastapi/schema_index.py).
+
+DB là DB giả kiểu Shopee (benchmarks/shopee_synthetic.py) thêm --extra-tables
+bảng phụ (voucher, đổi trả, quảng cáo, ...). Với mỗi kích thước:
+số token prompt (ước lượng ~4 ký tự/token), recall (tỉ lệ câu hỏi mà prompt có
+đủ các bảng cần), thời gian dựng chỉ mục và tra cứu, và độ trễ lập kế hoạch với
+model giả có chi phí prefill --llm-base-ms + --llm-ms-per-1k-tokens.
+
+    python benchmarks/schema_index_bench.py --extra-tables 0 20 100 400
+
+Mỗi dòng kết quả là một JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [BE_DIR, os.path.dirname(os.path.abspath(__file__))]
+
+TOPICS = [
+    "voucher", "return_request", "ad_campaign", "flash_sale", "review", "warehouse", "payment", "refund",
+    "livestream", "affiliate", "coupon_usage", "seller_penalty", "cart_item", "wishlist", "search_log",
+    "banner", "loyalty_point", "chat_message", "dispute", "inventory_snapshot",
+]
+COLUMNS = ["code", "amount", "status", "created_at", "updated_at", "note", "channel", "region", "score", "quantity", "discount", "currency"]
+
+# (câu hỏi, các bảng mà truy vấn đúng cần)
+QUESTIONS = [
+    ("What are the top 5 best-selling products?", {"products"}),
+    ("Which 10 shops have the highest revenue?", {"products", "shops"}),
+    ("Average rating of products in each category", {"products", "categories", "product_categories"}),
+    ("Which delivery carrier is the fastest?", {"delivery"}),
+    ("How many products does each carrier deliver?", {"delivery", "product_delivery"}),
+    ("Cửa hàng nào có doanh thu cao nhất?", {"products", "shops"}),
+    ("Sản phẩm bán chạy nhất trong danh mục Điện thoại", {"products", "categories", "product_categories"}),
+    ("Most expensive products with a rating above 4.5", {"products"}),
+    ("How many shops are there?", {"shops"}),
+    ("Total units sold per category", {"products", "categories", "product_categories"}),
+]
+
+
+def add_extra_tables(conn, count: int, seed: int):
+    rng = random.Random(seed)
+    for index in range(count):
+        topic = TOPICS[index % len(TOPICS)]
+        name = f"{topic}s" if index < len(TOPICS) else f"{topic}_{index // len(TOPICS)}s"
+        columns = ["id INTEGER"] + [f"{column} VARCHAR" for column in rng.sample(COLUMNS, rng.randint(4, 9))]
+        columns += [f"{ref} INTEGER" for ref in rng.sample(["shop_id", "product_id", "category_id"], rng.randint(0, 2))]
+        conn.execute(f"CREATE TABLE {name} ({', '.join(columns)})")
+
+
+class FakePlanner:
+    """Độ trễ như một LLM thật: cố định + tỉ lệ với số token prompt (prefill)."""
+
+    def __init__(self, base_ms: float, ms_per_1k_tokens: float):
+        self.base_ms = base_ms
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+
+    def latency_ms(self, prompt_tokens: int) -> float:
+        return self.base_ms + self.ms_per_1k_tokens * prompt_tokens / 1000
+
+
+def measure(index, planner: FakePlanner, mode: str) -> dict:
+    from llm.fastapi.memory import estimate_tokens
+
+    tokens, hits, lookup_ms = [], 0, []
+    for question, needed in QUESTIONS:
+        start = time.perf_counter()
+        if mode == "full":
+            prompt = index.full_prompt(question)
+            tables = {doc["name"] for doc in index.docs}
+        else:
+            docs, examples = index.retrieve(question)
+            prompt = index.render(docs, examples, question)
+            tables = {doc["name"] for doc in docs}
+        lookup_ms.append((time.perf_counter() - start) * 1000)
+        tokens.append(estimate_tokens(prompt))
+        hits += needed <= tables
+    mean_tokens = sum(tokens) / len(tokens)
+    mean_lookup = sum(lookup_ms) / len(lookup_ms)
+    return {
+        "mode": mode,
+        "prompt_tokens": round(mean_tokens),
+        "max_prompt_tokens": max(tokens),
+        "recall": round(hits / len(QUESTIONS), 2),
+        "prompt_build_ms": round(mean_lookup, 2),
+        "plan_latency_ms": round(mean_lookup + planner.latency_ms(mean_tokens), 1),
+    }
+
+
+def main(args) -> list:
+    import duckdb
+
+    from core.config import settings
+    from llm.fastapi.data_chatbot import build_schema_index
+    from shopee_synthetic import build_database
+
+    planner = FakePlanner(args.llm_base_ms, args.llm_ms_per_1k_tokens)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for extra in args.extra_tables:
+            path = os.path.join(tmp, f"shopee_{extra}.db")
+            build_database(path, products=1000, shops=50, seed=args.seed)
+            conn = duckdb.connect(path)
+            add_extra_tables(conn, extra, args.seed)
+
+            start = time.perf_counter()
+            index = build_schema_index(settings, conn.cursor())
+            build_ms = (time.perf_counter() - start) * 1000
+            for mode in ("full", "pruned"):
+                result = {"tables": len(index.docs), "index_build_ms": round(build_ms, 1), **measure(index, planner, mode)}
+                print(json.dumps(result))
+                results.append(result)
+            conn.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--extra-tables", type=int, nargs="+", default=[0, 20, 100, 400])
+    parser.add_argument("--llm-base-ms", type=float, default=300.0)
+    parser.add_argument("--llm-ms-per-1k-tokens", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+"""
+Đo độ trễ lookup của SemanticCache theo số entry.
+
+    python benchmarks/semantic_cache_bench.py --entries 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../llm/fastapi'))
+from semantic_cache import HashingEmbedder, SemanticCache
+
+WORDS = (
+    "price shipping order refund product shop category rating delivery discount "
+    "voucher phone laptop shoes bag account password payment return warranty "
+    "best cheap fast top seller review size color stock today week month"
+).split()
+
+
+def random_question(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 12)))
+
+
+def run(entries: int, dim: int, lookups: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    embedder = HashingEmbedder(dim)
+    cache = SemanticCache(embedder, capacity=entries, threshold=0.92)
+
+    # Ghi thẳng vào ma trận để phần chuẩn bị không chi phối thời gian chạy
+    vectors = np.random.default_rng(seed).standard_normal((entries, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    cache._vectors[:] = vectors
+    cache._answers[:] = ["cached answer"] * entries
+    cache._size = entries
+
+    queries = [random_question(rng) for _ in range(lookups)]
+    embed_start = time.perf_counter()
+    for query in queries:
+        embedder.embed(query)
+    embed_ms = (time.perf_counter() - embed_start) / lookups * 1000
+
+    for query in queries:
+        cache.lookup("", query)
+
+    stats = cache.stats()
+    return {
+        "entries": entries,
+        "dim": dim,
+        "matrix_mb": round(cache._vectors.nbytes / 1e6, 1),
+        "embed_ms_mean": round(embed_ms, 4),
+        "lookup_ms_p50": round(stats["lookup_ms_p50"], 4),
+        "lookup_ms_p99": round(stats["lookup_ms_p99"], 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    for entries in args.entries:
+        print(json.dumps(run(entries, args.dim, args.lookups)))
@@ -0,0 +1,108 @@
+"""
+Sinh một file DuckDB dữ liệu giả kiểu Shopee, cùng schema với
+shopee_ecommerce_final.db mà DataChatbot (llm/fastapi/data_chatbot.py) dùng:
+
+    products(id, original_id, title, price_actual, item_rating, total_sold, shop_id)
+    shops(id, seller_name)
+    categories(id, name)
+    delivery(id, name, w_date)
+    product_categories(product_id, category_id)
+    product_delivery(product_id, delivery_id)
+
+    python benchmarks/shopee_synthetic.py --out /tmp/shopee.db --products 200000
+
+Các benchmark khác import `build_database` để tạo DB tạm.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+BRANDS = ["Apple", "Samsung", "Xiaomi", "Oppo", "Anker", "Sony", "Logitech", "Unilever", "Vinamilk", "Biti's", "Canifa", "Sunhouse"]
+ITEMS = ["iPhone", "Galaxy", "tai nghe", "sạc dự phòng", "chuột", "bàn phím", "áo thun", "giày", "nồi cơm", "sữa tươi", "ốp lưng", "cáp sạc"]
+VARIANTS = ["Pro", "Max", "Mini", "Lite", "Plus", "2024", "chính hãng", "giá rẻ", "cao cấp", "size L"]
+CATEGORIES = [
+    "Điện thoại", "Phụ kiện", "Máy tính", "Thời trang nam", "Thời trang nữ", "Giày dép",
+    "Nhà cửa", "Đồ gia dụng", "Sức khoẻ", "Sắc đẹp", "Mẹ và bé", "Thực phẩm",
+]
+DELIVERY = ["Giao Hàng Nhanh", "Giao Hàng Tiết Kiệm", "SPX Express", "J&T Express", "Ninja Van", "Viettel Post"]
+
+
+def make_tables(products: int, shops: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    titles = (
+        np.array(BRANDS)[rng.integers(0, len(BRANDS), products)].astype(object) + " "
+        + np.array(ITEMS)[rng.integers(0, len(ITEMS), products)].astype(object) + " "
+        + np.array(VARIANTS)[rng.integers(0, len(VARIANTS), products)].astype(object) + " "
+        + rng.integers(1, 100, products).astype(str).astype(object)
+    )
+    # Lượt bán và giá lệch phải như dữ liệu thật; sản phẩm chưa có đánh giá để NULL
+    rating = np.round(rng.uniform(3.0, 5.0, products), 1)
+    rating[rng.random(products) < 0.1] = np.nan
+    product_ids = np.arange(1, products + 1)
+
+    categories_per_product = rng.integers(1, 3, products)
+    delivery_per_product = rng.integers(1, 4, products)
+    return {
+        "shops": pd.DataFrame({
+            "id": np.arange(1, shops + 1),
+            "seller_name": [f"shop_{i:05d}" for i in range(1, shops + 1)],
+        }),
+        "categories": pd.DataFrame({"id": np.arange(1, len(CATEGORIES) + 1), "name": CATEGORIES}),
+        "delivery": pd.DataFrame({
+            "id": np.arange(1, len(DELIVERY) + 1),
+            "name": DELIVERY,
+            "w_date": rng.integers(1, 7, len(DELIVERY)),
+        }),
+        "products": pd.DataFrame({
+            "id": product_ids,
+            "original_id": rng.integers(10 ** 9, 10 ** 10, products),
+            "title": titles,
+            "price_actual": np.round(rng.lognormal(12, 1, products), -3),
+            "item_rating": rating,
+            "total_sold": (rng.pareto(1.2, products) * 50).astype(np.int64),
+            "shop_id": rng.integers(1, shops + 1, products),
+        }),
+        "product_categories": pd.DataFrame({
+            "product_id": np.repeat(product_ids, categories_per_product),
+            "category_id": rng.integers(1, len(CATEGORIES) + 1, int(categories_per_product.sum())),
+        }).drop_duplicates(),
+        "product_delivery": pd.DataFrame({
+            "product_id": np.repeat(product_ids, delivery_per_product),
+            "delivery_id": rng.integers(1, len(DELIVERY) + 1, int(delivery_per_product.sum())),
+        }).drop_duplicates(),
+    }
+
+
+def build_database(path: str, products: int = 100000, shops: int = 2000, seed: int = 0) -> dict:
+    """Ghi đè `path` bằng DB giả; trả về số dòng mỗi bảng."""
+    import duckdb
+
+    if os.path.exists(path):
+        os.remove(path)
+    tables = make_tables(products, shops, seed)
+    conn = duckdb.connect(path)
+    try:
+        for name, frame in tables.items():
+            conn.register("frame", frame)
+            conn.execute(f"CREATE TABLE {name} AS SELECT * FROM frame")
+            conn.unregister("frame")
+    finally:
+        conn.close()
+    return {name: len(frame) for name, frame in tables.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default="shopee_ecommerce_final.db")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--shops", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = build_database(args.out, args.products, args.shops, args.seed)
+    print(json.dumps({"path": args.out, "rows": rows, "seconds": round(time.perf_counter() - start, 2)}))
@@ -0,0 +1,225 @@
+"""
+Đo CPU mỗi node Socket.IO khi scale ngang: "pattern" (mọi node PSUBSCRIBE
+chat:*) so với "rooms" (node chỉ SUBSCRIBE room có client của nó, xem
+socket_server/subscriptions.py).
+
+    python benchmarks/socket_scale_bench.py --nodes 1 2 4
+    python benchmarks/socket_scale_bench.py --modes rooms --nodes 4 --redis-manager
+
+Process cha chạy Redis giả qua TCP (fakeredis TcpFakeServer), rồi với mỗi chế
+độ và mỗi số node N: khởi động N process node (server.py + uvicorn), mỗi node
+có `--rooms-per-node` client, mỗi client join một room riêng. Khi mọi client
+đã nhận room_joined, cha publish `--tokens` sự kiện gen_token vào từng room
+(tổng lưu lượng tăng theo N) và chờ mọi client nhận đủ. CPU (process_time) của
+mỗi node chỉ tính pha publish. Mỗi (chế độ, N) in một dòng JSON; "rooms" giữ
+CPU mỗi node gần như không đổi khi N tăng, "pattern" tăng theo N vì mỗi node
+nhận và giải mã sự kiện của mọi room.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TOKEN = "x"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_node(args):
+    """Process node: Socket.IO server như socketio_main, báo CPU khi nhận SIGTERM."""
+    sys.path[:0] = [BE_DIR, os.path.join(BE_DIR, 'socket_server')]
+    import uvicorn
+    from socketio import ASGIApp
+
+    import server
+
+    state = {}
+
+    def mark(*_):
+        state["cpu"] = time.process_time()
+        state["received"] = server.fanout.stats.received
+        state["emitted"] = server.fanout.stats.emitted
+
+    def report(*_):
+        print(json.dumps({
+            "cpu_seconds": round(time.process_time() - state.get("cpu", 0.0), 3),
+            "received": server.fanout.stats.received - state.get("received", 0),
+            "emitted": server.fanout.stats.emitted - state.get("emitted", 0),
+            "subscribed_rooms": server.subscriptions.rooms() if server.subscriptions else None,
+        }), flush=True)
+        os._exit(0)
+
+    signal.signal(signal.SIGUSR1, mark)
+    signal.signal(signal.SIGTERM, report)
+
+    async def main():
+        server.init_redis()
+        uvicorn_server = uvicorn.Server(uvicorn.Config(ASGIApp(server.sio), host="127.0.0.1", port=args.port, log_level="warning"))
+        tasks = [asyncio.create_task(server.redis_listener(server.sio)), asyncio.create_task(uvicorn_server.serve())]
+        while not uvicorn_server.started:
+            await asyncio.sleep(0.05)
+        print("ready", flush=True)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+
+def start_nodes(args, mode: str, count: int, redis_url: str) -> list:
+    env = dict(
+        os.environ,
+        REDIS_URL=redis_url,
+        SOCKET_SUBSCRIPTION_MODE=mode,
+        SOCKET_REDIS_MANAGER=str(args.redis_manager),
+        SOCKET_STATS_INTERVAL_SECONDS="3600",
+        LOG_SAMPLE_RATE="0",
+    )
+    nodes = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--node", "--port", str(port)],
+            env=env, cwd=BE_DIR, stdout=subprocess.PIPE, text=True
+        )
+        nodes.append((process, port))
+    for process, _ in nodes:
+        # Node in log của listener trước dòng "ready"
+        for line in process.stdout:
+            if line.strip() == "ready":
+                break
+        else:
+            for other, _ in nodes:
+                other.kill()
+            raise RuntimeError(f"node exited with {process.wait()}")
+    return nodes
+
+
+async def connect_client(url: str, room: str, received: dict, done: asyncio.Event, expected: int):
+    import socketio
+
+    client = socketio.AsyncClient(reconnection=False)
+    joined = asyncio.Event()
+
+    @client.on("room_joined")
+    async def on_joined(payload):
+        joined.set()
+
+    @client.on("gen_token")
+    async def on_token(payload):
+        # Client chậm có thể nhận nhiều token đã gộp: đếm theo độ dài
+        received[room] += len(payload.get("data", ""))
+        if received[room] >= expected and all(count >= expected for count in received.values()):
+            done.set()
+
+    await client.connect(url, transports=["websocket"])
+    await client.emit("join_room", {"conversation_id": room})
+    await asyncio.wait_for(joined.wait(), timeout=30)
+    return client
+
+
+async def run_case(args, mode: str, count: int, redis_url: str) -> dict:
+    from redis import asyncio as aioredis
+
+    sys.path.insert(0, BE_DIR)
+    from core.wire import JsonCodec
+
+    nodes = start_nodes(args, mode, count, redis_url)
+    clients = []
+    try:
+        received, done = {}, asyncio.Event()
+        rooms = []
+        for _, port in nodes:
+            for _ in range(args.rooms_per_node):
+                room = str(uuid.uuid4())
+                received[room] = 0
+                rooms.append(room)
+                clients.append(await connect_client(f"http://127.0.0.1:{port}", room, received, done, args.tokens))
+        for process, _ in nodes:
+            process.send_signal(signal.SIGUSR1)
+        await asyncio.sleep(0.2)
+
+        codec = JsonCodec()
+        publisher = aioredis.from_url(redis_url)
+        start = time.perf_counter()
+        for seq in range(args.tokens):
+            pipe = publisher.pipeline(transaction=False)
+            for room in rooms:
+                pipe.publish(f"chat:{room}", codec.encode("gen_token", seq, {"data": TOKEN}))
+            await pipe.execute()
+        try:
+            await asyncio.wait_for(done.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - start
+        await publisher.aclose()
+        for client in clients:
+            await client.disconnect()
+    finally:
+        reports = []
+        for process, _ in nodes:
+            process.send_signal(signal.SIGTERM)
+        for process, _ in nodes:
+            output = process.communicate(timeout=30)[0].strip().splitlines()
+            reports.append(json.loads(output[-1]) if output else {})
+
+    cpu = [report.get("cpu_seconds", 0.0) for report in reports]
+    return {
+        "mode": mode,
+        "redis_manager": args.redis_manager,
+        "nodes": count,
+        "rooms_per_node": args.rooms_per_node,
+        "tokens": args.tokens,
+        "published": len(rooms) * args.tokens,
+        "complete": all(value >= args.tokens for value in received.values()),
+        "elapsed_seconds": round(elapsed, 2),
+        "node_cpu_seconds_avg": round(sum(cpu) / len(cpu), 3),
+        "node_cpu_seconds_max": max(cpu),
+        "node_received_avg": round(sum(report.get("received", 0) for report in reports) / len(reports)),
+        "node_emitted_avg": round(sum(report.get("emitted", 0) for report in reports) / len(reports)),
+        "node_subscribed_rooms_after": [report.get("subscribed_rooms") for report in reports],
+    }
+
+
+def main(args):
+    from fakeredis import TcpFakeServer
+
+    port = free_port()
+    redis_server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=redis_server.serve_forever, daemon=True).start()
+    redis_url = f"redis://127.0.0.1:{port}/0"
+    try:
+        for mode in args.modes:
+            for count in args.nodes:
+                print(json.dumps(asyncio.run(run_case(args, mode, count, redis_url))), flush=True)
+    finally:
+        # Thread của TcpFakeServer giữ process lại sau khi xong
+        sys.stdout.flush()
+        os._exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["pattern", "rooms"], choices=["pattern", "rooms"])
+    parser.add_argument("--nodes", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--rooms-per-node", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--redis-manager", action="store_true", help="bật SOCKET_REDIS_MANAGER trên các node")
+    parser.add_argument("--node", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.node:
+        run_node(args)
+    else:
+        main(args)
@@ -0,0 +1,231 @@
+"""
+Đo khởi động của từng entry point:
+
+- api: `fastapi_main` (uvicorn), lifespan rồi request /api/chat/stream đầu tiên
+- worker: `llm.fastapi.celery_app` + task như process cha của worker prefork,
+  worker_init, fork, worker_process_init rồi task đầu tiên trong process con
+- socket: `socketio_main`, khởi tạo như main()
+
+Mỗi lần đo là một process mới; Redis là fakeredis TcpFakeServer do process
+này mở, LLM là FakeStreamingChatModel. Với mỗi entry point, không và có
+warm-up (STARTUP_WARMUP + STARTUP_WARMUP_PROMPT): thời gian import, khởi tạo (lifespan / worker_process_init),
+request/task đầu tiên, tổng tới lúc xong request đầu tiên (tính cả khởi động
+interpreter), số client đã tạo trước fork và các module bị import hai lần
+dưới hai tên (do sys.path). Kèm báo cáo `python -X importtime`: các gói tốn
+nhiều thời gian import nhất.
+
+    python benchmarks/startup_bench.py --runs 3
+
+Mỗi dòng kết quả là một JSON.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+ENTRY_POINTS = {
+    "api": ("fastapi_main", [BE_DIR, os.path.join(BE_DIR, "llm/fastapi")]),
+    "worker": ("llm.fastapi.task", [BE_DIR]),
+    "socket": ("socketio_main", [BE_DIR, os.path.join(BE_DIR, "socket_server")]),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def duplicate_modules() -> list:
+    """Module có cùng file nhưng nạp dưới hai tên (vd. `chatbot` và `llm.fastapi.chatbot`)."""
+    by_file = defaultdict(list)
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path and path.startswith(BE_DIR) and name not in ("__main__", "__mp_main__"):
+            by_file[os.path.realpath(path)].append(name)
+    return sorted(" = ".join(sorted(names)) for names in by_file.values() if len(names) > 1)
+
+
+def child_api(result: dict):
+    import asyncio
+
+    import httpx
+
+    start = time.perf_counter()
+    import fastapi_main
+    result["import_ms"] = (time.perf_counter() - start) * 1000
+
+    async def run():
+        app = fastapi_main.app
+        start = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            result["init_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api") as client:
+                async with client.stream("POST", "/api/chat/stream", json={"message": "hello", "conversation_id": "bench"}) as response:
+                    async for line in response.aiter_lines():
+                        if line.startswith("event: gen_token"):
+                            break
+            result["first_request_ms"] = (time.perf_counter() - start) * 1000
+
+    asyncio.run(run())
+
+
+def child_worker(result: dict):
+    from celery.signals import worker_init, worker_process_init
+
+    start = time.perf_counter()
+    import llm.fastapi.celery_app  # noqa: F401
+    from llm.fastapi import task
+    result["import_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    worker_init.send(sender=None)
+    result["preload_ms"] = (time.perf_counter() - start) * 1000
+    result["clients_before_fork"] = sum(value is not None for value in (task.redis_client, task.chatbot))
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        child = {}
+        start = time.perf_counter()
+        worker_process_init.send(sender=None)
+        child["init_ms"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        task.process_chatbot_request.run("hello", "bench")
+        child["first_request_ms"] = (time.perf_counter() - start) * 1000
+        os.write(write_fd, json.dumps(child).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result.update(json.loads(pipe.read()))
+    os.waitpid(pid, 0)
+
+
+def child_socket(result: dict):
+    import asyncio
+
+    start = time.perf_counter()
+    import socketio_main  # noqa: F401
+    from core.config import settings
+    from core.startup import StartupReport
+    from server import init_redis
+    result["import_ms"] = (time.perf_counter() - start) * 1000
+
+    async def run():
+        start = time.perf_counter()
+        report = StartupReport("socket")
+        redis_conn = init_redis()
+        if settings.STARTUP_WARMUP:
+            await report.awarm_up("redis", redis_conn.ping)
+        result["init_ms"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        await redis_conn.publish("chat:bench", "{}")
+        result["first_request_ms"] = (time.perf_counter() - start) * 1000
+
+    asyncio.run(run())
+
+
+def child(args):
+    started = float(os.environ.pop("STARTUP_BENCH_SPAWNED_AT"))
+    module, paths = ENTRY_POINTS[args.child]
+    sys.path[:0] = paths
+    result = {"entry_point": args.child, "warmup": os.environ.get("STARTUP_WARMUP") == "true"}
+    {"api": child_api, "worker": child_worker, "socket": child_socket}[args.child](result)
+    result["ready_ms"] = (time.time() - started) * 1000
+    result["duplicate_modules"] = duplicate_modules()
+    for key, value in result.items():
+        if key.endswith("_ms"):
+            result[key] = round(value, 1)
+    print("RESULT " + json.dumps(result))
+
+
+def import_report(entry_point: str, env: dict, top: int) -> dict:
+    """Các gói top-level tốn nhiều thời gian import nhất (tổng self time của `-X importtime`)."""
+    module, paths = ENTRY_POINTS[entry_point]
+    code = f"import sys; sys.path[:0] = {paths!r}; import {module}"
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True).stderr
+    packages, total = defaultdict(float), 0.0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total = int(line.split("|")[1]) / 1000
+    ranked = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {
+        "entry_point": entry_point,
+        "report": "importtime",
+        "import_ms": round(total, 1),
+        "top_packages_ms": {name: round(ms, 1) for name, ms in ranked},
+    }
+
+
+def main(args) -> list:
+    from fakeredis import TcpFakeServer
+
+    port = free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            "REDIS_URL": f"redis://127.0.0.1:{port}/0",
+            "CELERY_BROKER_URL": f"redis://127.0.0.1:{port}/1",
+            "LLM_PROVIDER": "fake",
+            "LLM_POOL": "",
+            "FAKE_LLM_TTFT_MS": "0",
+            "FAKE_LLM_TOKENS_PER_SEC": "100000",
+            "FAKE_LLM_LENGTH": "5",
+            "LOG_SAMPLE_RATE": "0",
+            "METRICS_PUSH_INTERVAL_SECONDS": "3600",
+        })
+        for entry_point in args.entry_points:
+            for warmup in (False, True):
+                runs = []
+                for _ in range(args.runs):
+                    env.update(
+                        STARTUP_WARMUP=str(warmup).lower(),
+                        STARTUP_WARMUP_PROMPT="warm up" if warmup else "",
+                        STARTUP_BENCH_SPAWNED_AT=str(time.time())
+                    )
+                    output = subprocess.run(
+                        [sys.executable, os.path.abspath(__file__), "--child", entry_point],
+                        env=env, cwd=tmp, check=True, capture_output=True, text=True
+                    ).stdout
+                    runs.append(json.loads(next(line for line in output.splitlines() if line.startswith("RESULT "))[7:]))
+                # Trung vị theo ready_ms
+                result = sorted(runs, key=lambda run: run["ready_ms"])[len(runs) // 2]
+                print(json.dumps(result, ensure_ascii=False))
+                results.append(result)
+            env.pop("STARTUP_BENCH_SPAWNED_AT", None)
+            report = import_report(entry_point, env, args.top)
+            print(json.dumps(report))
+            results.append(report)
+    server.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entry-points", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="số gói trong báo cáo importtime")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
@@ -0,0 +1,123 @@
+"""
+So sánh định dạng sự kiện trên đường worker -> Redis -> socket server -> client
+(core/wire.py): byte mỗi token và CPU mỗi sự kiện.
+
+- v1_stdlib: envelope JSON bằng `json` chuẩn, listener decode rồi Socket.IO
+  encode lại (trước thay đổi này)
+- v1_orjson: cùng envelope nhưng encode/decode bằng orjson
+- v2_compact: frame "2|id|seq|code|body", listener chỉ tách header
+
+    python benchmarks/wire_bench.py --events 20000 --response-chars 2000
+
+CPU đo bằng process_time cho: encode ở worker, xử lý ở listener (tới payload
+cần emit) và encode packet Socket.IO. `completed_bytes` là kích thước sự kiện
+`completed` cho câu trả lời dài --response-chars ký tự.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path[:0] = [BE_DIR, os.path.join(BE_DIR, 'socket_server')]
+
+# Token mẫu: nửa tiếng Anh, nửa tiếng Việt (ký tự có dấu bị json chuẩn escape)
+SAMPLE_TOKENS = (
+    " the product ships in two days and the shop has a high rating"
+    " sản phẩm được giao trong hai ngày và cửa hàng có đánh giá cao"
+).split(" ")
+STREAM_ID = "1792292187337-0"
+
+
+def stream_id_splice(payload: str) -> str:
+    """Giống script Lua của EventLog: chèn ID của Redis Stream vào bản tin."""
+    if payload.startswith("2|"):
+        return "2|" + STREAM_ID + payload[2:]
+    return '{"id":"' + STREAM_ID + '",' + payload[1:]
+
+
+def make_variants():
+    from socketio.packet import EVENT, Packet
+
+    from core.wire import CompactCodec, FRAME_EVENT, Frame, JsonCodec, OrjsonModule
+    from fanout import decode_event, event_payload
+
+    class StdlibPacket(Packet):
+        json = json
+
+    class OrjsonPacket(Packet):
+        json = OrjsonModule
+
+    def v1_stdlib_encode(event_type, seq, data):
+        return json.dumps({"type": event_type, "data": data})
+
+    def v1_stdlib_listen(data):
+        event_data = json.loads(data)
+        return event_data["type"], event_payload(event_data)
+
+    def emit_packet(packet_class):
+        def encode(event_name, payload):
+            if isinstance(payload, Frame):
+                return packet_class(EVENT, data=[FRAME_EVENT, payload.encode()]).encode()
+            return packet_class(EVENT, data=[event_name, payload]).encode()
+        return encode
+
+    return {
+        "v1_stdlib": (v1_stdlib_encode, v1_stdlib_listen, emit_packet(StdlibPacket)),
+        "v1_orjson": (JsonCodec().encode, decode_event, emit_packet(OrjsonPacket)),
+        "v2_compact": (CompactCodec().encode, decode_event, emit_packet(OrjsonPacket)),
+    }
+
+
+def cpu_per_event_us(fn, items) -> float:
+    start = time.process_time()
+    for item in items:
+        fn(*item)
+    return round((time.process_time() - start) / len(items) * 1e6, 2)
+
+
+def run_variant(name, encode, listen, emit, tokens, response) -> dict:
+    payloads = [stream_id_splice(encode("gen_token", seq, {"data": token})) for seq, token in enumerate(tokens, 1)]
+    received = [(payload.encode("utf-8"),) for payload in payloads]
+    decoded = [listen(data) for (data,) in received]
+    packets = [emit(event_name, payload) for event_name, payload in decoded]
+
+    completed = stream_id_splice(encode("completed", len(tokens) + 1, {"response": response}))
+    completed_packet = emit(*listen(completed.encode("utf-8")))
+    return {
+        "variant": name,
+        "events": len(tokens),
+        "redis_bytes_per_token": round(sum(len(data) for (data,) in received) / len(tokens), 1),
+        "socket_bytes_per_token": round(sum(len(packet.encode("utf-8")) for packet in packets) / len(tokens), 1),
+        "completed_redis_bytes": len(completed.encode("utf-8")),
+        "completed_socket_bytes": len(completed_packet.encode("utf-8")),
+        "worker_encode_us": cpu_per_event_us(
+            lambda seq, token: encode("gen_token", seq, {"data": token}), list(enumerate(tokens, 1))
+        ),
+        "listener_us": cpu_per_event_us(listen, received),
+        "socket_encode_us": cpu_per_event_us(emit, decoded),
+    }
+
+
+def main(args) -> list:
+    rng = random.Random(args.seed)
+    tokens = [" " + rng.choice(SAMPLE_TOKENS) for _ in range(args.events)]
+    response = "".join(tokens)[:args.response_chars]
+
+    results = []
+    for name, (encode, listen, emit) in make_variants().items():
+        result = run_variant(name, encode, listen, emit, tokens, response)
+        result["total_us"] = round(result["worker_encode_us"] + result["listener_us"] + result["socket_encode_us"], 2)
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--response-chars", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
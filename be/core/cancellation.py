@@ -0,0 +1,14 @@
+import time
+
+
+def cancel_key(conversation_id: str) -> str:
+    return f"cancel:{conversation_id}"
+
+
+def request_cancel(redis_client, conversation_id: str, ttl_seconds: int):
+    """
+    Đánh dấu huỷ các lượt sinh của conversation đã được gửi trước thời điểm
+    này. Giá trị là timestamp nên tin nhắn mới gửi sau đó không bị huỷ theo.
+    Trả về coroutine nếu dùng client redis.asyncio.
+    """
+    return redis_client.set(cancel_key(conversation_id), time.time(), ex=ttl_seconds)
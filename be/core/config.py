@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -18,16 +19,235 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Model dùng cho Chatbot; LLM_PROVIDER="fake" dùng FakeStreamingChatModel
+    # (fake_llm.py) với tốc độ/độ dài cấu hình bằng các biến FAKE_LLM_*
+    LLM_PROVIDER: str = "google_genai"
+    LLM_MODEL: str = "gemini-2.0-flash"
+    FAKE_LLM_TTFT_MS: float = 200.0
+    FAKE_LLM_TOKENS_PER_SEC: float = 50.0
+    FAKE_LLM_JITTER: float = 0.2
+    FAKE_LLM_LENGTH: int = 200
+    FAKE_LLM_SEED: int = 0
+    # Pool nhiều model (model_pool.py), phân cách bằng dấu phẩy, mỗi mục
+    # "provider:model?tham_số=giá_trị", vd. "google_genai:gemini-2.0-flash,
+    # google_genai:gemini-1.5-flash" hoặc "fake:fast,fake:slow?ttft_ms=800&fail_rate=0.2".
+    # Rỗng = một model theo LLM_PROVIDER/LLM_MODEL. LLM_HEDGE_AFTER_MS = 0 tắt hedging.
+    LLM_POOL: str = ""
+    LLM_HEDGE_AFTER_MS: float = 0.0
+    LLM_POOL_WINDOW: int = 50
+    LLM_POOL_ERROR_THRESHOLD: float = 0.5
+    LLM_POOL_MIN_SAMPLES: int = 5
+    LLM_POOL_COOLDOWN_SECONDS: float = 30.0
+    LLM_POOL_EXPLORE_RATE: float = 0.05
+
+    # Gom token trước khi publish lên Redis: flush khi quá khoảng thời gian
+    # hoặc khi lượng dữ liệu chờ vượt ngưỡng byte (0 = flush từng chunk)
+    TOKEN_FLUSH_INTERVAL_MS: int = 50
+    TOKEN_FLUSH_MAX_BYTES: int = 512
+
+    # "pubsub": chỉ PUBLISH (mất sự kiện nếu client chưa join room)
+    # "streams": ghi thêm vào Redis Stream theo conversation để client replay
+    EVENT_BACKEND: str = "pubsub"
+    EVENT_STREAM_MAXLEN: int = 2000
+    EVENT_STREAM_TTL_SECONDS: int = 3600
+
+    # Định dạng sự kiện (core/wire.py): "json" = envelope v1, "compact" = frame v2
+    # có seq. Với "compact", completed/cancelled chỉ mang độ dài + CRC32 của câu
+    # trả lời; bật WIRE_COMPLETED_RESPONSE khi còn client v1 cần cả câu trả lời.
+    WIRE_PROTOCOL: str = "json"
+    WIRE_COMPLETED_RESPONSE: bool = False
+
+    # Số luồng SSE /api/chat/stream tối đa chạy đồng thời trên một process FastAPI
+    DIRECT_STREAM_MAX_CONCURRENCY: int = 32
+
+    # Cache câu trả lời khớp chính xác: "none" | "memory" | "redis"
+    RESPONSE_CACHE_BACKEND: str = "none"
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    RESPONSE_CACHE_REPLAY_CHUNK_CHARS: int = 40
+
+    # Cache theo độ tương đồng ngữ nghĩa (cosine) của câu hỏi
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_EMBEDDER: str = "hashing"  # "hashing" | "google"
+    SEMANTIC_CACHE_DIM: int = 128
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 100000
+    SEMANTIC_CACHE_PATH: str = ""
+
+    # Bộ nhớ hội thoại: "none" | "memory" | "redis"
+    MEMORY_BACKEND: str = "none"
+    MEMORY_TOKEN_BUDGET: int = 2000
+    MEMORY_SUMMARY_MAX_TOKENS: int = 300
+    MEMORY_SUMMARIZER: str = "llm"  # "llm" | "extractive"
+    MEMORY_TTL_SECONDS: int = 86400
+
+    # Socket.IO fan-out: số shard theo room, hàng đợi mỗi shard, bộ đệm mỗi client
+    SOCKET_FANOUT_SHARDS: int = 8
+    SOCKET_FANOUT_QUEUE_SIZE: int = 10000
+    SOCKET_CLIENT_BUFFER_SIZE: int = 256
+    SOCKET_STATS_INTERVAL_SECONDS: float = 30.0
+    # Nhiều node Socket.IO: "pattern" = mỗi node PSUBSCRIBE chat:* và nhận mọi
+    # sự kiện; "rooms" = node chỉ SUBSCRIBE kênh của các room đang có client trên
+    # node đó (socket_server/subscriptions.py), join_room chờ Redis xác nhận tối
+    # đa SOCKET_SUBSCRIBE_TIMEOUT_SECONDS. SOCKET_REDIS_MANAGER dùng
+    # AsyncRedisManager để emit từ handler tới được client ở node khác
+    SOCKET_SUBSCRIPTION_MODE: str = "pattern"
+    SOCKET_SUBSCRIBE_TIMEOUT_SECONDS: float = 2.0
+    SOCKET_REDIS_MANAGER: bool = False
+
+    # Thread pool cho bcrypt của login & register
+    AUTH_THREADS: int = 4
+    AUTH_MAX_CONCURRENCY: int = 32
+    AUTH_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    AUTH_NEGATIVE_CACHE_SIZE: int = 10000
+    AUTH_NEGATIVE_CACHE_TTL_SECONDS: float = 30.0
+    # Cache đọc xuyên bảng user cho login/register (user_store.py), entry được
+    # thay khi register (0 = tắt)
+    AUTH_USER_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 60.0
+
+    # DB user/lịch sử (db_init.py): SQLite ở chế độ WAL (đọc không chờ ghi),
+    # pool kết nối cho cả engine đồng bộ lẫn engine async (aiosqlite)
+    DATABASE_URL: str = "sqlite:///./app.db"
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_BUSY_TIMEOUT_MS: int = 5000
+
+    # Cache claims của JWT đã xác thực (dùng chung cho middleware và jwt_handler)
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_MAX_TTL_SECONDS: float = 300.0
+
+    # POST /api/chat lặp lại với cùng Idempotency-Key (header) hoặc message_id
+    # trong khoảng này trả về task_id cũ thay vì tạo task mới (0 = tắt). Request
+    # không có khoá không bị gộp, kể cả khi trùng nội dung
+    CHAT_IDEMPOTENCY_TTL_SECONDS: int = 60
+
+    # Admission control cho /api/chat: token bucket theo user (0 = tắt), giới
+    # hạn độ dài hàng đợi trên broker (0 = tắt) và định tuyến fast/bulk
+    CHAT_RATE_LIMIT_CAPACITY: float = 20
+    CHAT_RATE_LIMIT_REFILL_PER_SEC: float = 0.5
+    CHAT_MAX_QUEUE_DEPTH: int = 1000
+    CHAT_QUEUE_RETRY_AFTER_SECONDS: float = 5.0
+    CHAT_QUEUE_ROUTING: bool = True
+    CHAT_FAST_QUEUE: str = "chat_fast"
+    CHAT_BULK_QUEUE: str = "chat_bulk"
+    CHAT_FAST_MAX_CHARS: int = 500
+    # Result backend của Celery (rỗng = dùng CELERY_BROKER_URL). Câu trả lời
+    # không còn nằm trong kết quả task (đã có lịch sử hội thoại), kết quả chỉ
+    # giữ CELERY_RESULT_EXPIRES_SECONDS; CELERY_IGNORE_RESULT bỏ hẳn việc ghi
+    CELERY_RESULT_BACKEND: str = ""
+    CELERY_RESULT_EXPIRES_SECONDS: int = 3600
+    CELERY_IGNORE_RESULT: bool = False
+    # Số task mỗi process worker lấy trước; 1 để task dài không giữ chỗ của
+    # task khác trong bộ đệm của một process đang bận (xem celery_app.py)
+    CELERY_PREFETCH_MULTIPLIER: int = 1
+
+    # Gộp các câu hỏi giống hệt nhau đang được sinh đồng thời thành một lần gọi
+    # LLM; TTL giới hạn thời gian follower chờ nếu leader chết
+    SINGLE_FLIGHT_ENABLED: bool = False
+    SINGLE_FLIGHT_TTL_SECONDS: int = 120
+
+    # "prefork": mỗi slot Celery chạy một luồng sinh đồng bộ (mặc định)
+    # "async": mỗi process chạy tối đa WORKER_MAX_IN_FLIGHT luồng trên một event
+    # loop (astream + redis.asyncio); nên chạy worker với --pool=solo hoặc
+    # --pool=threads và concurrency nhỏ, mỗi core một process
+    WORKER_MODE: str = "prefork"
+    WORKER_MAX_IN_FLIGHT: int = 200
+    WORKER_DRAIN_TIMEOUT_SECONDS: float = 30.0
+
+    # Khởi động: client Redis/model/DB chỉ được tạo sau fork (worker_process_init
+    # của Celery, lifespan của FastAPI, main() của Socket.IO). WORKER_PRELOAD_IMPORTS:
+    # process cha của worker prefork import sẵn thư viện model để các process con
+    # dùng chung (copy-on-write). STARTUP_WARMUP gọi thử các client trước khi nhận
+    # request (ping Redis, dựng model, nạp embedder); STARTUP_WARMUP_PROMPT khác
+    # rỗng thì gọi model thật một lần để mở sẵn kết nối
+    WORKER_PRELOAD_IMPORTS: bool = True
+    STARTUP_WARMUP: bool = False
+    STARTUP_WARMUP_PROMPT: str = ""
+
+    # Huỷ lượt sinh khi room không còn client: chờ CANCEL_GRACE_SECONDS để
+    # client kịp reconnect rồi mới gửi tín hiệu huỷ (sống CANCEL_SIGNAL_TTL_SECONDS).
+    # Với SOCKET_SUBSCRIPTION_MODE="rooms", client reconnect vào node khác cũng được tính
+    CANCEL_GRACE_SECONDS: float = 10.0
+    CANCEL_SIGNAL_TTL_SECONDS: int = 600
+
+    # Lịch sử hội thoại: worker đẩy lượt đã xong vào list Redis HISTORY_QUEUE_KEY,
+    # API ghi xuống DB (db_init.py) theo lô tối đa HISTORY_BATCH_SIZE, nghỉ
+    # HISTORY_FLUSH_INTERVAL_SECONDS khi hàng đợi trống. Chủ hội thoại (kiểm tra
+    # ở /api/chat) được cache tối đa HISTORY_OWNER_CACHE_SIZE hội thoại mỗi process
+    HISTORY_ENABLED: bool = True
+    HISTORY_QUEUE_KEY: str = "history:pending"
+    HISTORY_BATCH_SIZE: int = 500
+    HISTORY_FLUSH_INTERVAL_SECONDS: float = 1.0
+    HISTORY_OWNER_CACHE_SIZE: int = 100000
+    HISTORY_PAGE_SIZE: int = 50
+    HISTORY_MAX_PAGE_SIZE: int = 200
+
+    # DataChatbot (llm/fastapi/data_chatbot.py): file DuckDB chỉ đọc, Neo4j tuỳ
+    # chọn (NEO4J_URI rỗng = tắt) và cache kế hoạch truy vấn theo dạng câu hỏi;
+    # schema được kiểm tra lại mỗi PLAN_CACHE_SCHEMA_CHECK_SECONDS giây
+    DATA_DUCKDB_PATH: str = "shopee_ecommerce_final.db"
+    NEO4J_URI: str = ""
+    NEO4J_USER: str = "neo4j"
+    NEO4J_PASSWORD: str = ""
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_MAX_ENTRIES: int = 1000
+    PLAN_CACHE_SCHEMA_CHECK_SECONDS: float = 5.0
+    # Kết quả truy vấn được đọc dần theo batch Arrow DATA_ARROW_BATCH_ROWS dòng,
+    # giữ tối đa DATA_MAX_RESULT_ROWS dòng (LIMIT đẩy xuống SQL); client nhận
+    # trước DATA_PREVIEW_ROWS dòng
+    DATA_MAX_RESULT_ROWS: int = 100000
+    DATA_ARROW_BATCH_ROWS: int = 2048
+    DATA_PREVIEW_ROWS: int = 10
+    # LLM tóm tắt nhận thống kê từng cột (top DATA_PROFILE_TOP_K giá trị; phân vị
+    # và top-k tính trên mẫu DATA_PROFILE_SAMPLE_LIMIT dòng nếu kết quả lớn hơn)
+    # cùng tối đa DATA_SUMMARY_ROWS dòng mẫu, gói trong DATA_SUMMARY_TOKEN_BUDGET token
+    DATA_SUMMARY_ROWS: int = 12
+    DATA_SUMMARY_TOKEN_BUDGET: int = 600
+    DATA_PROFILE_TOP_K: int = 5
+    DATA_PROFILE_SAMPLE_LIMIT: int = 200000
+    # Prompt sinh truy vấn chỉ gồm tối đa SCHEMA_INDEX_TOP_TABLES bảng và
+    # SCHEMA_INDEX_EXAMPLES ví dụ liên quan tới câu hỏi (tắt = toàn bộ schema)
+    SCHEMA_INDEX_ENABLED: bool = True
+    SCHEMA_INDEX_EMBEDDER: str = "hashing"  # "hashing" | "google"
+    SCHEMA_INDEX_DIM: int = 256
+    SCHEMA_INDEX_TOP_TABLES: int = 4
+    SCHEMA_INDEX_EXAMPLES: int = 2
+
+    # Metrics: worker cộng dồn lên Redis mỗi METRICS_PUSH_INTERVAL_SECONDS giây;
+    # LOG_SAMPLE_RATE là tỉ lệ sự kiện hot path được ghi log (0 = tắt)
+    METRICS_PUSH_INTERVAL_SECONDS: float = 5.0
+    LOG_SAMPLE_RATE: float = 0.01
+
     model_config = SettingsConfigDict(
         env_file=BASE_DIR / ".env",
         env_file_encoding='utf-8'
     )
 
-settings = Settings()
 
-LANGSMITH_TRACING = settings.LANGSMITH_TRACING
-LANGSMITH_ENDPOINT = settings.LANGSMITH_ENDPOINT
-LANGSMITH_API_KEY = settings.LANGSMITH_API_KEY
-LANGSMITH_PROJECT = settings.LANGSMITH_PROJECT
-GOOGLE_API_KEY = settings.GOOGLE_API_KEY
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    return Settings()
+
+
+class LazySettings:
+    """
+    `settings` dùng chung: .env và biến môi trường chỉ được đọc ở lần truy cập
+    thuộc tính đầu tiên, không phải lúc import, nên môi trường có thể được đặt
+    sau khi import (benchmark, process con) và import core.config không tốn gì.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+
+settings = LazySettings()
+
+
+def __getattr__(name):
+    # LANGSMITH_*, GOOGLE_API_KEY ở cấp module cũng chỉ đọc khi được dùng
+    if name in ("LANGSMITH_TRACING", "LANGSMITH_ENDPOINT", "LANGSMITH_API_KEY", "LANGSMITH_PROJECT", "GOOGLE_API_KEY"):
+        return getattr(get_settings(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
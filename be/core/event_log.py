@@ -0,0 +1,63 @@
+# Ghi sự kiện vào stream và publish trong cùng một lệnh nguyên tử, để bản tin
+# live mang đúng ID của stream (client dùng ID này làm mốc replay). Envelope
+# JSON được chèn trường `id`, frame v2 (core/wire.py) được điền ô event_id.
+_APPEND_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'event', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if string.sub(ARGV[1], 1, 2) == '2|' then
+  redis.call('PUBLISH', KEYS[2], '2|' .. id .. string.sub(ARGV[1], 3))
+else
+  redis.call('PUBLISH', KEYS[2], '{"id":"' .. id .. '",' .. string.sub(ARGV[1], 2))
+end
+return id
+"""
+
+
+def stream_key(channel_name: str) -> str:
+    return f"log:{channel_name}"
+
+
+class EventLog:
+    """
+    Nhật ký sự kiện có thể replay cho từng conversation, dựa trên Redis Streams.
+
+    Mỗi sự kiện được XADD vào `log:chat:{conversation_id}` (giới hạn bởi MAXLEN
+    xấp xỉ và TTL gia hạn sau mỗi lần ghi) rồi publish lên `chat:{conversation_id}`
+    với trường `id` là ID của entry trong stream.
+    """
+
+    def __init__(self, redis_client, maxlen: int, ttl_seconds: int):
+        self.maxlen = maxlen
+        self.ttl_seconds = ttl_seconds
+        self._append = redis_client.register_script(_APPEND_SCRIPT)
+
+    def append(self, pipeline, channel_name: str, payload: str):
+        """
+        Xếp lệnh ghi vào pipeline; payload là envelope JSON hoặc frame v2 đã encode. Với
+        client redis.asyncio, kết quả trả về là coroutine và phải được await.
+        """
+        return self._append(
+            keys=[stream_key(channel_name), channel_name],
+            args=[payload, self.maxlen, self.ttl_seconds],
+            client=pipeline
+        )
+
+
+async def replay_events(redis_conn, channel_name: str, last_event_id: str, count: int = 1000):
+    """
+    Đọc các sự kiện sau `last_event_id` (không bao gồm) từ stream của room.
+    Trả về list (id, payload) với payload là nội dung thô đã ghi (envelope JSON
+    hoặc frame v2), để socket server xử lý giống bản tin live.
+    """
+    start = "-" if last_event_id in (None, "", "0", "0-0") else f"({last_event_id}"
+    entries = await redis_conn.xrange(stream_key(channel_name), min=start, max="+", count=count)
+
+    events = []
+    for entry_id, fields in entries:
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode("utf-8")
+        raw = fields.get(b"event") or fields.get("event")
+        if raw is None:
+            continue
+        events.append((entry_id, raw))
+    return events
@@ -0,0 +1,36 @@
+import time
+import uuid
+
+from core.wire import dumps
+
+
+def turn_record(
+    conversation_id: str,
+    message: str,
+    response: str,
+    status: str = "completed",
+    turn_id: str = None,
+    owner: str = None,
+    asked_at: float = None,
+    answered_at: float = None
+) -> str:
+    """Một lượt hỏi-đáp đã xong, dạng JSON để xếp vào hàng đợi ghi lịch sử."""
+    answered_at = answered_at or time.time()
+    return dumps({
+        "conversation_id": conversation_id,
+        "turn_id": turn_id or uuid.uuid4().hex,
+        "owner": owner,
+        "message": message,
+        "response": response,
+        "status": status,
+        "asked_at": asked_at or answered_at,
+        "answered_at": answered_at,
+    })
+
+
+def enqueue_turns(redis_client, key: str, records: list):
+    """
+    Đẩy các lượt vào list Redis `key`; HistoryWriter của API ghi chúng xuống
+    DB theo lô. Trả về coroutine nếu dùng client redis.asyncio.
+    """
+    return redis_client.rpush(key, *records)
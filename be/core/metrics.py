@@ -0,0 +1,244 @@
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+
+# Đơn vị giây, phủ từ vài ms (publish Redis) tới vài chục giây (hàng đợi Celery)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Bộ đếm tăng dần; nếu có `fn` thì đọc giá trị từ bộ đếm sẵn có khi scrape."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> list:
+        return [(self.name, self.fn() if self.fn is not None else self.value)]
+
+    def drain(self) -> list:
+        with self._lock:
+            samples, self.value = self.samples(), 0.0
+        return samples
+
+
+class Gauge:
+    """Giá trị tức thời; nếu có `fn` thì giá trị được tính lại mỗi lần scrape."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def samples(self) -> list:
+        return [(self.name, self.fn() if self.fn is not None else self.value)]
+
+
+class Histogram:
+    """
+    Histogram với bucket cố định kiểu Prometheus. `observe` chỉ là một lần
+    bisect + cộng dưới lock, đủ rẻ để gọi trên hot path.
+    """
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def samples(self) -> list:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self._counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket{{le="{_format_value(bound)}"}}', cumulative))
+        samples.append((f"{self.name}_sum", self._sum))
+        samples.append((f"{self.name}_count", cumulative))
+        return samples
+
+    def drain(self) -> list:
+        with self._lock:
+            samples = self.samples()
+            self._counts = [0] * len(self._counts)
+            self._sum = 0.0
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        # Module có thể bị import hai lần (theo package và top-level), nên trả
+        # về metric đã đăng ký thay vì tạo trùng tên
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, fn=None) -> Counter:
+        return self.register(Counter(name, help_text, fn))
+
+    def gauge(self, name: str, help_text: str, fn=None) -> Gauge:
+        return self.register(Gauge(name, help_text, fn))
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, buckets))
+
+    def metrics(self) -> list:
+        return list(self._metrics.values())
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(f"{name} {_format_value(value)}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Registry mặc định của process (mỗi process: API, worker, Socket.IO có bản riêng)
+registry = Registry()
+
+
+class RedisMetricsPusher:
+    """
+    Đẩy counter/histogram của worker Celery lên một Redis hash dùng chung để
+    FastAPI render lại ở /metrics (worker không có HTTP server, và prefork có
+    nhiều process). Chỉ cộng dồn phần tăng thêm (HINCRBYFLOAT) nên nhiều
+    worker ghi cùng một key mà không ghi đè nhau; flush tối đa mỗi `interval`
+    giây trong một round trip.
+    """
+
+    def __init__(self, registry: Registry, redis_client, key: str = "metrics:worker", interval: float = 5.0):
+        self.registry = registry
+        self.redis_client = redis_client
+        self.key = key
+        self.interval = interval
+        self._last_flush = time.monotonic()
+        self._meta_written = False
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        pipeline = self.redis_client.pipeline(transaction=False)
+        if not self._meta_written:
+            pipeline.hset(f"{self.key}:meta", mapping={
+                metric.name: json.dumps([metric.type_name, metric.help])
+                for metric in self.registry.metrics() if hasattr(metric, "drain")
+            })
+            self._meta_written = True
+        for metric in self.registry.metrics():
+            if not hasattr(metric, "drain"):
+                continue
+            # Ghi cả bucket bằng 0 để mọi bucket luôn có mặt khi render
+            for index, (name, value) in enumerate(metric.drain()):
+                pipeline.hincrbyfloat(self.key, f"{metric.name}|{index:03d}|{name}", value)
+        pipeline.execute()
+
+
+def render_redis_metrics(redis_client, key: str = "metrics:worker") -> str:
+    """Render các metric mà RedisMetricsPusher đã cộng dồn, theo định dạng Prometheus."""
+    meta = redis_client.hgetall(f"{key}:meta")
+    values = redis_client.hgetall(key)
+    if not meta:
+        return ""
+
+    samples = {}
+    for field, value in values.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        metric_name, index, sample_name = field.split("|", 2)
+        samples.setdefault(metric_name, []).append((index, sample_name, float(value)))
+
+    lines = []
+    for metric_name, raw in sorted(meta.items()):
+        metric_name = metric_name.decode() if isinstance(metric_name, bytes) else metric_name
+        type_name, help_text = json.loads(raw)
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} {type_name}")
+        lines.extend(
+            f"{sample_name} {_format_value(value)}"
+            for _, sample_name, value in sorted(samples.get(metric_name, []))
+        )
+    return "\n".join(lines) + "\n"
+
+
+def read_redis_counters(redis_client, names, key: str = "metrics:worker") -> dict:
+    """Giá trị đã cộng dồn của các counter `names` (0 nếu worker chưa đẩy lần nào)."""
+    values = redis_client.hmget(key, [f"{name}|000|{name}" for name in names])
+    return {name: float(value or 0) for name, value in zip(names, values)}
+
+
+def make_metrics_app(render):
+    """ASGI app tối giản trả về `render()` tại GET /metrics (dùng cho Socket.IO server)."""
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] != "/metrics":
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        body = render().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+class SampledLog:
+    """
+    Log có cấu trúc (một dòng JSON) thay cho print trên hot path: chỉ ghi một
+    phần `rate` số sự kiện; lỗi và sự kiện quan trọng nên gọi với `force=True`.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+
+    def __call__(self, event: str, force: bool = False, **fields):
+        if force or (self.rate > 0 and random.random() < self.rate):
+            print(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, default=str))
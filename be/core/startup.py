@@ -0,0 +1,56 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+class StartupReport:
+    """
+    Thời gian từng bước khởi động của một process (dựng client, warm-up),
+    in ra một dòng "startup {...}" khi xong để so sánh giữa các lần chạy
+    (benchmarks/startup_bench.py đọc dòng này).
+    """
+
+    def __init__(self, entry_point: str):
+        self.entry_point = entry_point
+        self.steps = {}
+        self.errors = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def warm_up(self, name: str, fn, *args):
+        """Gọi thử `fn`; lỗi chỉ được ghi lại, process vẫn khởi động."""
+        with self.step(f"warmup_{name}"):
+            try:
+                fn(*args)
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"Warm-up {name} failed: {e}")
+
+    async def awarm_up(self, name: str, fn, *args):
+        """Như `warm_up` với coroutine function."""
+        with self.step(f"warmup_{name}"):
+            try:
+                await fn(*args)
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"Warm-up {name} failed: {e}")
+
+    def done(self) -> dict:
+        report = {
+            "entry_point": self.entry_point,
+            "pid": os.getpid(),
+            "total_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "steps": self.steps,
+        }
+        if self.errors:
+            report["errors"] = self.errors
+        print("startup " + json.dumps(report))
+        return report
@@ -0,0 +1,122 @@
+import zlib
+
+import orjson
+
+# Giao thức sự kiện giữa worker -> Redis -> socket server -> client.
+#
+# v1 ("json"): envelope {"type": ..., "data": {...}}, client nhận sự kiện
+#   Socket.IO cùng tên với `type`.
+# v2 ("compact"): frame văn bản "2|<event_id>|<seq>|<code>|<body>", client nhận
+#   sự kiện Socket.IO `FRAME_EVENT` với nguyên frame. `body` của gen_token là
+#   chính đoạn text (không escape JSON), các sự kiện khác là JSON. `event_id`
+#   để trống khi worker ghi và được EventLog/SingleFlight điền ID của Redis
+#   Stream; `seq` tăng dần trong một lượt sinh (0 = sự kiện do Lua tạo).
+#   `completed`/`cancelled` chỉ mang độ dài (byte UTF-8) và CRC32 của câu trả
+#   lời đã stream, trừ khi bật WIRE_COMPLETED_RESPONSE.
+WIRE_VERSION = 2
+FRAME_PREFIX = f"{WIRE_VERSION}|"
+FRAME_EVENT = "f"
+EVENT_CODES = {
+    "processing": "p",
+    "gen_token": "t",
+    "completed": "c",
+    "error": "e",
+    "cancelled": "x",
+}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+
+def dumps(data) -> str:
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+class OrjsonModule:
+    """Thay module `json` của python-socketio/engineio (chỉ dùng dumps/loads)."""
+
+    @staticmethod
+    def dumps(data, **kwargs) -> str:
+        return dumps(data)
+
+    @staticmethod
+    def loads(data, **kwargs):
+        return loads(data)
+
+
+def completion_summary(response: str) -> dict:
+    encoded = response.encode("utf-8")
+    return {"length": len(encoded), "crc32": f"{zlib.crc32(encoded):08x}"}
+
+
+class JsonCodec:
+    """Envelope v1, encode bằng orjson (ngắn hơn và không escape ký tự tiếng Việt)."""
+
+    version = 1
+
+    def encode(self, event_type: str, seq: int, data: dict) -> str:
+        return dumps({"type": event_type, "data": data})
+
+
+class CompactCodec:
+    version = WIRE_VERSION
+
+    def __init__(self, completed_response: bool = False):
+        self.completed_response = completed_response
+
+    def encode(self, event_type: str, seq: int, data: dict) -> str:
+        if event_type == "gen_token":
+            body = data.get("data", "")
+        else:
+            if event_type in ("completed", "cancelled") and not self.completed_response:
+                data = completion_summary(data.get("response", ""))
+            body = dumps(data)
+        return f"{FRAME_PREFIX}|{seq}|{EVENT_CODES[event_type]}|{body}"
+
+
+def build_wire_codec(settings):
+    if settings.WIRE_PROTOCOL == "compact":
+        return CompactCodec(settings.WIRE_COMPLETED_RESPONSE)
+    return JsonCodec()
+
+
+class Frame:
+    """Frame v2 đã tách header; `body` giữ nguyên, chỉ decode khi cần (client v1)."""
+
+    __slots__ = ("event_id", "seq", "code", "body")
+
+    def __init__(self, event_id: str, seq: int, code: str, body: str):
+        self.event_id = event_id
+        self.seq = seq
+        self.code = code
+        self.body = body
+
+    @property
+    def event_name(self) -> str:
+        return EVENT_NAMES.get(self.code)
+
+    def encode(self) -> str:
+        return f"{FRAME_PREFIX}{self.event_id}|{self.seq}|{self.code}|{self.body}"
+
+    def legacy_payload(self) -> dict:
+        """Payload kiểu v1 cho client chưa hỗ trợ frame."""
+        payload = {"data": self.body} if self.code == "t" else loads(self.body)
+        if self.event_id:
+            payload["event_id"] = self.event_id
+        return payload
+
+
+def is_frame(data) -> bool:
+    if isinstance(data, bytes):
+        return data[:2] == FRAME_PREFIX.encode("ascii")
+    return data[:2] == FRAME_PREFIX
+
+
+def parse_frame(data, event_id: str = None) -> Frame:
+    """Tách header của frame (không decode body); `event_id` ghi đè ID trong frame."""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    _, frame_id, seq, code, body = data.split("|", 4)
+    return Frame(event_id if event_id is not None else frame_id, int(seq), code, body)
@@ -0,0 +1,90 @@
+import itertools
+
+import pyarrow as pa
+
+
+def limit_query(query: str, max_rows: int) -> str:
+    """
+    Bọc truy vấn SELECT bằng LIMIT: DuckDB đẩy giới hạn xuống trong kế hoạch
+    (ORDER BY ... bên trong thành TOP_N) nên chỉ đọc/sắp xếp đủ số dòng cần.
+    """
+    return f"SELECT * FROM ({query}) AS result LIMIT {int(max_rows)}"
+
+
+class ArrowResult:
+    """
+    Kết quả truy vấn dạng cột: danh sách RecordBatch của Arrow, đọc dần từ
+    reader của DuckDB qua `stream()` và giữ tối đa `max_rows` dòng (`truncated`
+    cho biết còn dòng phía sau). `head`/`rows` cắt lát không sao chép dữ liệu,
+    chỉ các dòng cần hiển thị mới được chuyển thành object Python.
+    """
+
+    def __init__(self, reader=None, max_rows: int = None, schema=None, batches=None):
+        self._reader = reader
+        self.max_rows = max_rows
+        self.schema = schema if schema is not None else reader.schema
+        self.batches = list(batches or [])
+        self.num_rows = sum(batch.num_rows for batch in self.batches)
+        self.truncated = False
+
+    @classmethod
+    def from_duckdb(cls, cursor, max_rows: int, batch_rows: int):
+        """Reader trên kết quả đang chờ của `cursor` (truy vấn đã giới hạn max_rows + 1 dòng)."""
+        return cls(cursor.fetch_record_batch(batch_rows), max_rows)
+
+    @classmethod
+    def from_records(cls, records, max_rows: int, batch_rows: int):
+        """Từ iterator các dict (vd. kết quả Neo4j), chỉ lấy tối đa max_rows + 1 bản ghi."""
+        rows = list(itertools.islice(records, max_rows + 1))
+        truncated = len(rows) > max_rows
+        table = pa.Table.from_pylist(rows[:max_rows])
+        result = cls(schema=table.schema, batches=table.to_batches(max_chunksize=batch_rows), max_rows=max_rows)
+        result.truncated = truncated
+        return result
+
+    def stream(self):
+        """Các batch đã có rồi các batch đọc thêm từ reader, theo thứ tự, khi chúng tới."""
+        yield from list(self.batches)
+        if self._reader is None:
+            return
+        try:
+            for batch in self._reader:
+                if self.max_rows is not None and self.num_rows + batch.num_rows > self.max_rows:
+                    batch = batch.slice(0, self.max_rows - self.num_rows)
+                    self.truncated = True
+                if batch.num_rows:
+                    self.batches.append(batch)
+                    self.num_rows += batch.num_rows
+                    yield batch
+                if self.truncated:
+                    break
+        finally:
+            self._reader = None
+
+    def consume(self):
+        """Đọc nốt phần còn lại của reader."""
+        for _ in self.stream():
+            pass
+        return self
+
+    @property
+    def columns(self) -> list:
+        return self.schema.names
+
+    @property
+    def nbytes(self) -> int:
+        return sum(batch.nbytes for batch in self.batches)
+
+    @property
+    def table(self):
+        return pa.Table.from_batches(self.batches, schema=self.schema)
+
+    def head(self, n: int):
+        return self.table.slice(0, n)
+
+    def rows(self, n: int) -> list:
+        """n dòng đầu dạng list of dicts."""
+        return self.head(n).to_pylist()
+
+    def __len__(self):
+        return self.num_rows
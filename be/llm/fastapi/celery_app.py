@@ -1,5 +1,6 @@
 import sys
 from celery import Celery
+from kombu import Queue
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
@@ -9,27 +10,53 @@ from core.config import settings
 if os.name == 'nt':  # Windows
     os.environ.setdefault('FORKED_BY_MULTIPROCESSING', '1')
 
-celery_app = Celery(
-    'chatbot_worker',
-    broker=settings.CELERY_BROKER_URL,
-    backend=settings.CELERY_BROKER_URL,
-    include=['llm.fastapi.task'] 
-)
+celery_app = Celery('chatbot_worker', include=['llm.fastapi.task'])
 
-# Windows-specific configuration
-celery_app.conf.update(
-    task_track_started=True,
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
-    timezone='UTC',
-    enable_utc=True,
-)
 
-# Windows-specific pool configuration
-if os.name == 'nt':
-    celery_app.conf.update(
-        worker_pool='solo',  # Use solo pool for Windows
-        worker_concurrency=1,
-        worker_prefetch_multiplier=1,
-    )
\ No newline at end of file
+def celery_config() -> dict:
+    """
+    Cấu hình từ settings; Celery chỉ gọi hàm này khi cần tới cấu hình lần đầu
+    (gửi task, khởi động worker), nên import module không đọc settings.
+    """
+    config = dict(
+        broker_url=settings.CELERY_BROKER_URL,
+        result_backend=settings.CELERY_RESULT_BACKEND or settings.CELERY_BROKER_URL,
+        task_track_started=True,
+        task_serializer='json',
+        accept_content=['json'],
+        result_serializer='json',
+        timezone='UTC',
+        enable_utc=True,
+        # Kết quả task chỉ còn trạng thái (câu trả lời nằm trong lịch sử hội thoại)
+        result_expires=settings.CELERY_RESULT_EXPIRES_SECONDS,
+        task_ignore_result=settings.CELERY_IGNORE_RESULT,
+        # Hàng đợi chat: /api/chat đưa prompt ngắn của user tương tác vào CHAT_FAST_QUEUE,
+        # prompt dài / user gửi dồn vào CHAT_BULK_QUEUE (xem endpoints/helper/admission.py).
+        # Worker không có -Q sẽ nghe cả ba queue; khi tách worker theo queue:
+        #
+        #   celery -A llm.fastapi.celery_app worker -Q chat_fast --concurrency=8
+        #   celery -A llm.fastapi.celery_app worker -Q chat_bulk,celery --concurrency=2
+        #
+        # worker_prefetch_multiplier=1: mỗi process chỉ giữ thêm một task chưa chạy, để
+        # một stream dài không làm kẹt các task đã được prefetch phía sau nó trong khi
+        # worker khác đang rảnh. Không bật task_acks_late: task bị giao lại sau khi
+        # worker chết sẽ stream lại từ đầu lên cùng conversation.
+        task_queues=(
+            Queue(settings.CHAT_FAST_QUEUE),
+            Queue(settings.CHAT_BULK_QUEUE),
+            Queue('celery'),
+        ),
+        task_default_queue='celery',
+        worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER,
+    )
+    # Windows-specific pool configuration
+    if os.name == 'nt':
+        config.update(
+            worker_pool='solo',  # Use solo pool for Windows
+            worker_concurrency=1,
+            worker_prefetch_multiplier=1,
+        )
+    return config
+
+
+celery_app.add_defaults(celery_config)
@@ -0,0 +1,405 @@
+import json
+import os
+import re
+import sys
+import threading
+
+import duckdb
+from langchain.schema import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from llm.fastapi.arrow_result import ArrowResult, limit_query
+from llm.fastapi.plan_cache import build_plan_cache, validate_select
+from llm.fastapi.result_profile import ResultProfiler, build_result_profiler
+from llm.fastapi.schema_index import SchemaIndex
+
+# Mô tả cho chỉ mục schema (schema_index.py): thêm từ đồng nghĩa người dùng
+# hay hỏi để câu hỏi tìm đúng bảng/cột
+DUCKDB_DESCRIPTIONS = {
+    "products": "products / sản phẩm, items listed by shops",
+    "products.title": "product name / tên sản phẩm",
+    "products.price_actual": "price in VND / giá",
+    "products.item_rating": "average rating stars, NULL when not rated / đánh giá",
+    "products.total_sold": "units sold, best selling, sales volume, revenue = price_actual * total_sold / lượt bán, bán chạy, doanh thu",
+    "shops": "shops, sellers, stores / cửa hàng, người bán",
+    "categories": "product categories / danh mục, ngành hàng",
+    "delivery": "delivery / shipping carriers / đơn vị vận chuyển, giao hàng",
+    "delivery.w_date": "delivery time in days / thời gian giao",
+    "product_categories": "which category each product belongs to",
+    "product_delivery": "which carriers deliver each product",
+}
+
+NEO4J_SCHEMA_DOCS = [
+    {
+        "name": "neo4j:nodes",
+        "line": "- Nodes: `(:Product)`, `(:Shop)`, `(:Category)`, `(:Delivery)` with the same properties as the DuckDB columns; "
+                "`total_sold`/`item_rating` may be strings ('14.3k', 'No ratings yet'), use toFloat()/coalesce()",
+        "text": "graph nodes product shop category delivery properties",
+    },
+    {
+        "name": "neo4j:relationships",
+        "line": "- Relationships: `(:Shop)-[:SELLS]->(:Product)`, `(:Product)-[:BELONGS_TO]->(:Category)`, `(:Product)-[:DELIVERED_BY]->(:Delivery)`",
+        "text": "relationships connected related same similar recommend recommendation path community fraud ring "
+                "sells belongs_to delivered_by different shop / liên quan, giống, cùng, gợi ý",
+    },
+]
+
+PLAN_EXAMPLES = [
+    {
+        "question": "What are the top 5 best-selling products?",
+        "plan": {"database": "duckdb", "query": "SELECT title, total_sold FROM products ORDER BY total_sold DESC LIMIT 5;", "explanation": "Ranking task, fast in DuckDB."},
+    },
+    {
+        "question": "Which 10 shops have the highest revenue?",
+        "plan": {"database": "duckdb", "query": "SELECT s.seller_name, SUM(p.price_actual * p.total_sold) AS revenue FROM products p JOIN shops s ON s.id = p.shop_id GROUP BY s.seller_name ORDER BY revenue DESC LIMIT 10;", "explanation": "Aggregation over a join."},
+    },
+    {
+        "question": "Average rating of products in each category",
+        "plan": {"database": "duckdb", "query": "SELECT c.name, AVG(p.item_rating) AS avg_rating FROM products p JOIN product_categories pc ON pc.product_id = p.id JOIN categories c ON c.id = pc.category_id GROUP BY c.name ORDER BY avg_rating DESC;", "explanation": "Grouped aggregation."},
+    },
+    {
+        "question": "Which carriers deliver the most products and how fast are they?",
+        "plan": {"database": "duckdb", "query": "SELECT d.name, d.w_date, COUNT(*) AS products FROM product_delivery pd JOIN delivery d ON d.id = pd.delivery_id GROUP BY d.name, d.w_date ORDER BY products DESC;", "explanation": "Counting over a link table."},
+    },
+    {
+        "question": "Find products that are in the same category as 'iPhone 15 Pro Max' but sold by a different shop.",
+        "database": "neo4j",
+        "plan": {"database": "neo4j", "query": "MATCH (p1:Product {title: 'iPhone 15 Pro Max'})-[:BELONGS_TO]->(c:Category)<-[:BELONGS_TO]-(p2:Product) WHERE p1 <> p2 MATCH (s1:Shop)-[:SELLS]->(p1) MATCH (s2:Shop)-[:SELLS]->(p2) WHERE s1 <> s2 RETURN p2.title, s2.seller_name LIMIT 10;", "explanation": "Connected items through shared relationships."},
+    },
+]
+
+
+class DataChatbot:
+    """
+    Một chatbot phân tích dữ liệu thông minh, có khả năng:
+    1. Lựa chọn giữa DuckDB và Neo4j để trả lời câu hỏi.
+    2. Tự động sinh và thực thi mã truy vấn.
+    3. Diễn giải kết quả thành ngôn ngữ tự nhiên.
+
+    Có `plan_cache` (plan_cache.py) thì câu hỏi cùng dạng với câu đã trả lời
+    dùng lại kế hoạch đã kiểm tra thay vì gọi LLM sinh truy vấn lần nữa.
+    """
+
+    # Zero -shot prompt template cho việc sinh mã truy vấn
+    _CODE_GENERATION_PROMPT_TEMPLATE = """
+    You are an expert data analyst and a master of both SQL (for DuckDB) and Cypher (for Neo4j).
+    Your mission is to act as a "Reasoning and Acting" agent.
+
+    **CONTEXT:**
+    You have access to two databases containing Shopee e-commerce data:
+    1.  **DuckDB (Relational/OLAP):** Extremely fast for analytical queries, aggregations, filtering, and calculations over large columns of data. USE THIS FOR questions about statistics, trends, counting, averaging, and filtering large sets.
+    2.  **Neo4j (Graph Database):** Perfect for understanding relationships, finding paths, discovering patterns, and answering questions about connections. USE THIS FOR questions about recommendations, community detection, fraud rings, or how things are connected.
+
+    **DATABASE SCHEMAS:**
+
+    **1. DuckDB Schema:**
+    - `products(id, original_id, title, price_actual, item_rating, total_sold, shop_id)`
+    - `shops(id, seller_name)`
+    - `categories(id, name)`
+    - `delivery(id, name, w_date)`
+    - `product_categories(product_id, category_id)`
+    - `product_delivery(product_id, delivery_id)`
+    * Note: `total_sold` and `item_rating` are clean numeric types.
+
+    **2. Neo4j Schema:**
+    - Nodes: `(:Product)`, `(:Shop)`, `(:Category)`, `(:Delivery)`
+    - Properties on nodes are the same as DuckDB columns (e.g., `Product` has `id`, `title`, `price_actual`, `item_rating`, `total_sold`).
+    - Relationships:
+        - `(:Shop)-[:SELLS]->(:Product)`
+        - `(:Product)-[:BELONGS_TO]->(:Category)`
+        - `(:Product)-[:DELIVERED_BY]->(:Delivery)`
+    * Note: `total_sold` and `item_rating` might be strings (e.g., '14.3k', 'No ratings yet'). You MUST handle this in your Cypher query using functions like `toFloat()`, `coalesce()`, and string manipulation.
+
+    **YOUR TASK:**
+    Given the user's question, you must:
+    1.  **Think:** Analyze the user's intent. Are they asking an analytical question (DuckDB) or a relational/path-finding question (Neo4j)?
+    2.  **Plan:** Formulate a plan.
+    3.  **Act:** Generate a single, executable query in the chosen language.
+    4.  **Respond:** Output ONLY a single JSON object in the following format. Do not add any other text or explanations outside the JSON block.
+
+    ```json
+    {
+      "database": "duckdb" | "neo4j",
+      "query": "The single, complete, executable SQL or Cypher query string.",
+      "explanation": "A brief, one-sentence explanation of why you chose this database for this specific question."
+    }
+    ```
+
+    **EXAMPLE 1:**
+    User Question: "What are the top 5 best-selling products?"
+    Your JSON Response:
+    ```json
+    {
+      "database": "duckdb",
+      "query": "SELECT title, total_sold FROM products ORDER BY total_sold DESC LIMIT 5;",
+      "explanation": "This is a classic ranking and aggregation task, which is extremely fast in an analytical database like DuckDB."
+    }
+    ```
+
+    **EXAMPLE 2:**
+    User Question: "Find products that are in the same category as 'iPhone 15 Pro Max' but sold by a different shop."
+    Your JSON Response:
+    ```json
+    {
+      "database": "neo4j",
+      "query": "MATCH (p1:Product {title: 'iPhone 15 Pro Max'})-[:BELONGS_TO]->(c:Category)<-[:BELONGS_TO]-(p2:Product) WHERE p1 <> p2 MATCH (s1:Shop)-[:SELLS]->(p1) MATCH (s2:Shop)-[:SELLS]->(p2) WHERE s1 <> s2 RETURN p2.title, s2.seller_name LIMIT 10;",
+      "explanation": "This question is about finding connected items through shared relationships (same category, different shop), which is a core strength of a graph database."
+    }
+    ```
+
+    Now, analyze the following user question and provide your JSON response.
+    """
+
+    # --- Prompt Template cho việc Diễn giải Kết quả ---
+    _SUMMARIZATION_PROMPT_TEMPLATE = """
+    You are a friendly and helpful data analyst.
+    Your task is to summarize the results of a database query in a clear, concise, and easy-to-understand way for a non-technical user.
+
+    **Original User Question:**
+    "{user_question}"
+
+    **Query Result Profile (statistics over all result rows, then a few sample rows):**
+    {query_result}
+
+    **Your Response:**
+    Based on the data, provide a natural language summary.
+    - Start with a direct answer to the user's question.
+    - Use the column statistics for counts, ranges and totals; the sample rows are only examples.
+    - If there's a list, mention a few examples.
+    - Keep it brief and to the point.
+    - Do not mention the database or the query. Just present the facts from the data.
+    """
+
+    def __init__(
+        self,
+        duckdb_conn,
+        model,
+        neo4j_driver=None,
+        plan_cache=None,
+        schema_index=None,
+        max_rows: int = 100000,
+        batch_rows: int = 2048,
+        preview_rows: int = 10,
+        profiler=None
+    ):
+        self.duckdb_conn = duckdb_conn
+        self.neo4j_driver = neo4j_driver
+        self.model = model
+        # None = mỗi câu hỏi đều gọi LLM sinh truy vấn
+        self.plan_cache = plan_cache
+        # None = prompt sinh truy vấn chứa toàn bộ schema (_CODE_GENERATION_PROMPT_TEMPLATE)
+        self.schema_index = schema_index
+        # Số dòng tối đa giữ lại, kích thước mỗi batch Arrow, số dòng xem trước
+        self.max_rows = max_rows
+        self.batch_rows = batch_rows
+        self.preview_rows = preview_rows
+        # Kết quả gửi đi tóm tắt dưới dạng thống kê theo cột + vài dòng mẫu
+        self.profiler = profiler or ResultProfiler()
+        self._local = threading.local()
+
+    def _extract_json(self, text: str) -> dict:
+        """Trích xuất khối JSON đầu tiên từ một chuỗi, kể cả khi có markdown."""
+        # Tìm khối JSON trong markdown ```json ... ```
+        match = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
+        if match:
+            json_str = match.group(1)
+        else:
+            # Nếu không, giả sử toàn bộ chuỗi là JSON hoặc tìm khối JSON đầu tiên
+            match = re.search(r"(\{.*?\})", text, re.DOTALL)
+            if not match:
+                raise ValueError("Không tìm thấy đối tượng JSON hợp lệ trong phản hồi của LLM.")
+            json_str = match.group(1)
+
+        return json.loads(json_str)
+
+    def _generate_query_plan(self, user_input: str) -> dict:
+        """
+        (Component 1) Yêu cầu LLM tạo kế hoạch và sinh mã.
+        """
+        prompt = self._plan_prompt(user_input)
+        messages = [HumanMessage(content=prompt)]
+
+        response = self.model.invoke(messages)
+        plan = self._extract_json(response.content)
+        return plan
+
+    def _plan_prompt(self, user_input: str) -> str:
+        """Prompt sinh truy vấn: chỉ các bảng và ví dụ liên quan nếu có chỉ mục schema."""
+        if self.schema_index is None:
+            return self._CODE_GENERATION_PROMPT_TEMPLATE + "\nUser Question: " + user_input
+        if self.plan_cache is not None and self.schema_index.version != self.plan_cache.schema_version():
+            # Schema đổi (cùng lúc cache kế hoạch bị bỏ) -> dựng lại chỉ mục
+            self.schema_index = self.schema_index.refreshed(self._duckdb_cursor())
+        return self.schema_index.prompt(user_input)
+
+    def _plan(self, user_input: str, use_cache: bool = True) -> dict:
+        """Kế hoạch từ cache nếu có, nếu không thì sinh bằng LLM (rồi kiểm tra và cache)."""
+        if self.plan_cache is None:
+            return self._generate_query_plan(user_input)
+        if use_cache:
+            plan = self.plan_cache.lookup(user_input)
+            if plan is not None:
+                return plan
+        return self.plan_cache.store(user_input, self._generate_query_plan(user_input))
+
+    def _duckdb_cursor(self):
+        # DuckDB connection không dùng chung được giữa các thread, mỗi thread một cursor
+        if self.plan_cache is not None:
+            return self.plan_cache.cursor()
+        if getattr(self._local, "cursor", None) is None:
+            self._local.cursor = self.duckdb_conn.cursor()
+        return self._local.cursor
+
+    def _execute_query(self, plan: dict) -> tuple[ArrowResult | None, str | None]:
+        """
+        (Component 2) Thực thi mã từ kế hoạch và trả về kết quả.
+
+        Truy vấn DuckDB được giới hạn `max_rows` + 1 dòng ngay trong SQL và đọc
+        dần dạng Arrow RecordBatch (`ArrowResult.stream()`), không tạo dict
+        cho từng dòng.
+        """
+        db_choice = plan.get("database")
+        query = plan.get("query")
+
+        try:
+            if db_choice == "duckdb":
+                if "statement" in plan:
+                    print(f"Executing on DuckDB: {query} with {plan['args']}")
+                    cursor = self.plan_cache.execute(plan, max_rows=self.max_rows + 1)
+                else:
+                    print(f"Executing on DuckDB: {query}")
+                    cursor = self._duckdb_cursor()
+                    cursor.execute(limit_query(validate_select(cursor, query), self.max_rows + 1))
+                return ArrowResult.from_duckdb(cursor, self.max_rows, self.batch_rows), None
+
+            elif db_choice == "neo4j":
+                if self.neo4j_driver is None:
+                    return None, "Neo4j chưa được cấu hình (NEO4J_URI)."
+                print(f"Executing on Neo4j: {query}")
+                with self.neo4j_driver.session() as session:
+                    result = session.run(query)
+                    # Bản ghi được kéo dần, chỉ lấy tối đa max_rows + 1
+                    return ArrowResult.from_records((record.data() for record in result), self.max_rows, self.batch_rows), None
+            else:
+                return None, f"Lựa chọn CSDL không hợp lệ: '{db_choice}'"
+        except Exception as e:
+            return None, f"Lỗi thực thi truy vấn: {e}"
+
+    def _summarize_result(self, user_question: str, query_result: ArrowResult) -> str:
+        """
+        (Component 3) Yêu cầu LLM chuyển đổi dữ liệu thành mô tả tự nhiên.
+        """
+        # Thống kê toàn bộ kết quả, gói trong ngân sách token của profiler
+        prompt = self._SUMMARIZATION_PROMPT_TEMPLATE.format(
+            user_question=user_question,
+            query_result=self.profiler.summarize(query_result)
+        )
+        messages = [HumanMessage(content=prompt)]
+
+        response = self.model.invoke(messages)
+        return response.content
+
+    def _preview(self, result: ArrowResult):
+        """
+        Đọc kết quả tới hết, trả về dần bảng markdown của `preview_rows` dòng
+        đầu ngay khi batch chứa chúng tới.
+        """
+        shown = 0
+        for batch in result.stream():
+            if shown >= self.preview_rows:
+                continue
+            rows = batch.slice(0, self.preview_rows - shown).to_pylist()
+            lines = [markdown_row(row.values()) for row in rows]
+            if shown == 0:
+                yield f"\n**🔍 Dữ liệu chi tiết (tối đa {self.preview_rows} dòng đầu):**\n"
+                lines[:0] = [markdown_row(result.columns), markdown_row("---" for _ in result.columns)]
+            shown += len(rows)
+            yield "\n".join(lines) + "\n"
+
+    def ask(self, user_input: str):
+        """
+        Hàm chính điều phối toàn bộ quy trình, sử dụng generator để trả về từng bước.
+        """
+        try:
+            # BƯỚC 1: SUY NGHĨ VÀ LẬP KẾ HOẠCH
+            yield "🤔 Đang suy nghĩ và lựa chọn CSDL phù hợp..."
+            plan = self._plan(user_input)
+
+            explanation = plan.get('explanation', 'Không có giải thích.')
+            db_name = (plan.get('database') or 'Không rõ').upper()
+            source = " (dùng lại kế hoạch đã có)" if plan.get("cached") else ""
+            yield f"\n✅ **Kế hoạch đã sẵn sàng{source}!**\n- **CSDL:** {db_name}\n- **Lý do:** {explanation}\n"
+
+            # BƯỚC 2: HÀNH ĐỘNG - THỰC THI
+            yield "⚙️ Đang thực thi truy vấn..."
+            result, error = self._execute_query(plan)
+
+            if error and plan.get("cached"):
+                # Kế hoạch cache không chạy được với giá trị mới -> sinh lại bằng LLM
+                print(f"Cached plan failed ({error}), regenerating")
+                plan = self._plan(user_input, use_cache=False)
+                result, error = self._execute_query(plan)
+
+            if error:
+                yield f"\n❌ **Đã xảy ra lỗi!**\n- {error}"
+                return
+
+            yield from self._preview(result)
+
+            if not result.num_rows:
+                yield "\n🤷‍♀️ Truy vấn đã chạy thành công nhưng không tìm thấy kết quả nào."
+                return
+
+            count = f"hơn {result.num_rows}" if result.truncated else f"{result.num_rows}"
+            yield f"\n📊 Đã tìm thấy {count} kết quả. Đang tổng hợp..."
+
+            # BƯỚC 3: TỔNG HỢP VÀ TRẢ LỜI
+            summary = self._summarize_result(user_input, result)
+            yield f"\n💬 **Câu trả lời dành cho bạn:**\n{summary}\n"
+
+        except Exception as e:
+            yield f"\n❌ **Đã xảy ra lỗi không mong muốn:** {e}"
+
+
+def build_data_chatbot(settings, model=None):
+    """DataChatbot trên file DuckDB DATA_DUCKDB_PATH (chỉ đọc) và Neo4j nếu có NEO4J_URI."""
+    conn = duckdb.connect(settings.DATA_DUCKDB_PATH, read_only=True)
+    neo4j_driver = None
+    if settings.NEO4J_URI:
+        from neo4j import GraphDatabase
+        neo4j_driver = GraphDatabase.driver(settings.NEO4J_URI, auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD))
+    if model is None:
+        from llm.fastapi.chatbot import create_chat_model
+        model = create_chat_model()
+    return DataChatbot(
+        conn,
+        model,
+        neo4j_driver=neo4j_driver,
+        plan_cache=build_plan_cache(settings, conn),
+        schema_index=build_schema_index(settings, conn.cursor(), neo4j=neo4j_driver is not None),
+        max_rows=settings.DATA_MAX_RESULT_ROWS,
+        batch_rows=settings.DATA_ARROW_BATCH_ROWS,
+        preview_rows=settings.DATA_PREVIEW_ROWS,
+        profiler=build_result_profiler(settings)
+    )
+
+
+def build_schema_index(settings, cursor, neo4j: bool = False):
+    """Chỉ mục schema cho DB hiện tại; phần Neo4j chỉ có khi Neo4j được cấu hình."""
+    if not settings.SCHEMA_INDEX_ENABLED:
+        return None
+    from llm.fastapi.semantic_cache import build_embedder
+    return SchemaIndex.from_duckdb(
+        cursor,
+        descriptions=DUCKDB_DESCRIPTIONS,
+        graph_docs=NEO4J_SCHEMA_DOCS if neo4j else None,
+        examples=[example for example in PLAN_EXAMPLES if neo4j or example.get("database") != "neo4j"],
+        embedder=build_embedder(settings, settings.SCHEMA_INDEX_EMBEDDER, settings.SCHEMA_INDEX_DIM),
+        top_tables=settings.SCHEMA_INDEX_TOP_TABLES,
+        example_count=settings.SCHEMA_INDEX_EXAMPLES
+    )
+
+
+def markdown_row(values) -> str:
+    cells = ("" if value is None else str(value).replace("|", "\\|").replace("\n", " ") for value in values)
+    return "| " + " | ".join(cells) + " |"
@@ -1,21 +1,57 @@
-from fastapi.security import OAuth2PasswordRequestForm
-from grpc import Status
-from fastapi import APIRouter, Depends, HTTPException, Request
+import os
+import sys
 
-from endpoints.helper.db_init import User, get_session
+from fastapi import APIRouter, Request
+
+from endpoints.helper.auth_executor import AuthBusyError, AuthExecutor
 from endpoints.helper.jwt_handler import create_access_token
-from endpoints.helper.password_checker import gen_hashed_password, get_user, verify_password
+from endpoints.helper.password_checker import authenticate_user, create_user
 from fastapi.responses import JSONResponse
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../../'))
+from core.config import settings
+
 router = APIRouter()
 
+# Tạo trong init_resources (lifespan của FastAPI), không phải lúc import
+auth_executor = None
+
+
+def init_resources():
+    """Thread pool bcrypt của process (một lần)."""
+    global auth_executor
+    if auth_executor is None:
+        auth_executor = AuthExecutor(
+            max_workers=settings.AUTH_THREADS,
+            max_concurrency=settings.AUTH_MAX_CONCURRENCY,
+            queue_timeout=settings.AUTH_QUEUE_TIMEOUT_SECONDS
+        )
+
+def busy_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Authentication service is busy, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
+
 @router.post("/login")
 async def login_for_access_token(request: Request):
     request = await request.json()
-    print("Login request:", request )
-    user = get_user(request.get("email"))
-    print("User:", user)
-    if not user or not verify_password(request.get("password"), user["hashed_password"]):
+    username = request.get("email")
+    password = request.get("password")
+    if not username or not password:
+        return JSONResponse(
+            status_code=401,
+            content={"error": "Incorrect username or password"}
+        )
+
+    try:
+        user = await authenticate_user(username, password, auth_executor.run)
+    except AuthBusyError:
+        return busy_response()
+
+    if not user:
         return JSONResponse(
             status_code=401,
             content={"error": "Incorrect username or password"}
@@ -32,7 +68,6 @@ async def login_for_access_token(request: Request):
 @router.post("/register")
 async def register_user(request: Request):
     data = await request.json()
-    print (data)
     username = data.get("email")
     password = data.get("password")
 
@@ -42,33 +77,23 @@ async def register_user(request: Request):
             content={"error": "Username and password are required"}
         )
     
-    existing_user = get_user(username)
-    if existing_user:
+    try:
+        new_user = await create_user(username, password, auth_executor.run)
+    except AuthBusyError:
+        return busy_response()
+
+    if new_user is None:
         return JSONResponse(
             status_code=400,
             content={"error": "Username already exists"}
         )
     
-    hashed_password = gen_hashed_password(password)
-
-    new_user = User(
-        username=username,
-        password=hashed_password
-    )
-
-    session = next(get_session())   
-    session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
-    
     return JSONResponse(
         status_code=201,
         content={
             "message": "User registered successfully",
             "user": {
-                "username": new_user.username,
+                "username": new_user["username"],
             }
         }
     )
-
-
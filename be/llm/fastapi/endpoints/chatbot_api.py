@@ -1,12 +1,33 @@
+import asyncio
+import hashlib
 import json
+import math
 import os
 import sys
+import time
+import uuid
 
+import redis
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from celery_app import celery_app
+from chatbot import Chatbot, extract_content_from_chunk
+from endpoints.helper.admission import AdmissionRejected, build_admission, request_identity
+from endpoints.helper.db_init import get_engine
+from endpoints.helper.history_store import build_conversation_owners
+from memory import build_memory
+from semantic_cache import build_semantic_cache
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../../'))
+from core.config import settings
+from core.history import enqueue_turns, turn_record
+from core.metrics import SampledLog, read_redis_counters, registry
+# Cùng tên module với chatbot.py, để không nạp response_cache.py hai lần
+from llm.fastapi.response_cache import build_response_cache, response_cache_counters
 
 class ChatRequest(BaseModel):
     message: str
@@ -15,54 +36,192 @@ class ChatRequest(BaseModel):
 
 router = APIRouter()
 
+# Tạo trong init_resources (lifespan của FastAPI), không phải lúc import
+redis_client = None
+response_cache = None
+broker_client = None
+admission = None
+conversation_owners = None
+direct_stream_slots = None
+log_sampled = None
+_direct_chatbot = None
+
+enqueue_latency = registry.histogram("chat_enqueue_seconds", "Time spent in send_task for /api/chat")
+direct_ttft = registry.histogram("chat_direct_ttft_seconds", "Time to first chunk for /api/chat/stream")
+rejected_requests = registry.counter("chat_rejected_total", "POST /api/chat answered with 429 by admission control")
+duplicate_requests = registry.counter("chat_duplicate_requests_total", "POST /api/chat answered with an existing task_id")
+active_direct_streams = registry.gauge("chat_direct_active_streams", "SSE streams currently running")
+
+
+def init_resources(client=None):
+    """
+    Dựng client Redis/broker, cache câu trả lời và admission của process API
+    (một lần). `client` thay cho client Redis từ REDIS_URL (benchmark dùng fakeredis).
+    """
+    global redis_client, response_cache, broker_client, admission, conversation_owners, direct_stream_slots, log_sampled
+    if redis_client is not None:
+        return
+    direct_stream_slots = asyncio.Semaphore(settings.DIRECT_STREAM_MAX_CONCURRENCY)
+    log_sampled = SampledLog(settings.LOG_SAMPLE_RATE)
+    redis_client = client if client is not None else redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    response_cache = build_response_cache(settings, redis_client, build_semantic_cache(settings, log_sampled))
+    if response_cache is not None:
+        # Lượt tra của /api/chat/stream; lượt tra của /api/chat nằm ở worker
+        response_cache.register_metrics(registry, "chat_direct_response_cache")
+    broker_client = (
+        redis.Redis.from_url(settings.CELERY_BROKER_URL)
+        if client is None and settings.CELERY_BROKER_URL.startswith(("redis://", "rediss://")) else None
+    )
+    admission = build_admission(settings, redis_client, broker_client)
+    conversation_owners = build_conversation_owners(settings, get_engine())
+
+
+def warm_up(report):
+    """Gọi thử Redis, broker và dựng trước Chatbot của /api/chat/stream (STARTUP_WARMUP)."""
+    report.warm_up("redis", redis_client.ping)
+    if broker_client is not None:
+        report.warm_up("broker", broker_client.ping)
+    report.warm_up("direct_chatbot", lambda: get_direct_chatbot().warm_up(settings.STARTUP_WARMUP_PROMPT))
+
+
+def get_direct_chatbot() -> Chatbot:
+    """Chatbot dùng cho chế độ stream trực tiếp, chỉ khởi tạo khi có request đầu tiên."""
+    global _direct_chatbot
+    if _direct_chatbot is None:
+        _direct_chatbot = Chatbot(response_cache=response_cache)
+        _direct_chatbot.memory = build_memory(settings, redis_client, _direct_chatbot.model)
+    return _direct_chatbot
+
+
+def resolve_conversation_id(data: dict) -> str:
+    conversation_id = None
+
+    # Thứ tự ưu tiên:
+    # 1. Trực tiếp từ data['conversation_id'] hoặc data['new_conversation_id']
+    if 'new_conversation_id' in data and str(data['new_conversation_id']).strip():
+        conversation_id = str(data['new_conversation_id']).strip()
+    elif 'conversation_id' in data and str(data['conversation_id']).strip():
+        conversation_id = str(data['conversation_id']).strip()  
+    # 2. Hoặc từ data['conversation'] (có thể là dict hoặc str JSON)
+    elif 'conversation' in data:
+        conversation = data['conversation']
+        if isinstance(conversation, dict):
+            conversation_id = (
+                str(conversation.get('new_conversation_id') or conversation.get('conversation_id') or '').strip()
+            )
+        elif isinstance(conversation, str):
+            try:
+                parsed = json.loads(conversation)
+                if isinstance(parsed, dict):
+                    conversation_id = (
+                        str(parsed.get('new_conversation_id') or parsed.get('conversation_id') or '').strip()
+                    )
+                else:
+                    conversation_id = conversation.strip()
+            except json.JSONDecodeError:
+                conversation_id = conversation.strip()
+
+    # Kiểm tra cuối cùng
+    if not conversation_id:
+        raise HTTPException(status_code=400, detail="Missing or empty conversation ID")
+
+    return conversation_id
+
+
+def idempotency_key(request: Request, conversation_id: str, data: dict):
+    """
+    Khoá chống gửi lặp từ header Idempotency-Key hoặc `message_id` trong body.
+    None nếu client không gửi: câu hỏi trùng nội dung ("tiếp tục", gửi lại sau
+    khi dừng/lỗi) vẫn là một lượt mới.
+    """
+    client_key = request.headers.get('idempotency-key') or data.get('message_id')
+    client_key = str(client_key).strip() if client_key else ''
+    if not client_key:
+        return None
+    return f"idem:chat:{conversation_id}:{hashlib.sha256(client_key.encode('utf-8')).hexdigest()}"
+
+
+def request_owner(identity: str):
+    """Username khi request có JWT (chủ hội thoại trong lịch sử), None nếu ẩn danh."""
+    return identity[len("user:"):] if identity.startswith("user:") else None
+
+
+async def check_conversation_owner(conversation_id: str, owner: str):
+    """Không cho ghi tiếp vào hội thoại đã lưu của người khác (conversation_id do client chọn)."""
+    if conversation_owners is not None and not await conversation_owners.owns(conversation_id, owner):
+        raise HTTPException(status_code=403, detail="Conversation belongs to another user")
+
+
+def sse_event(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post("/chat")
 async def handle_chat(request: Request):
     try:
-        print('received request:', request )
         data = await request.json()
         message = data.get('message')
         if not message or not message.strip():
             raise HTTPException(status_code=400, detail="Missing or empty 'message' field")
 
-        # Lấy conversation_id
-        conversation_id = None
-
-        # Thứ tự ưu tiên:
-        # 1. Trực tiếp từ data['conversation_id'] hoặc data['new_conversation_id']
-        if 'new_conversation_id' in data and str(data['new_conversation_id']).strip():
-            conversation_id = str(data['new_conversation_id']).strip()
-        elif 'conversation_id' in data and str(data['conversation_id']).strip():
-            conversation_id = str(data['conversation_id']).strip()  
-        # 2. Hoặc từ data['conversation'] (có thể là dict hoặc str JSON)
-        elif 'conversation' in data:
-            conversation = data['conversation']
-            if isinstance(conversation, dict):
-                conversation_id = (
-                    str(conversation.get('new_conversation_id') or conversation.get('conversation_id') or '').strip()
-                )
-            elif isinstance(conversation, str):
-                try:
-                    parsed = json.loads(conversation)
-                    if isinstance(parsed, dict):
-                        conversation_id = (
-                            str(parsed.get('new_conversation_id') or parsed.get('conversation_id') or '').strip()
-                        )
-                    else:
-                        conversation_id = conversation.strip()
-                except json.JSONDecodeError:
-                    conversation_id = conversation.strip()
+        conversation_id = resolve_conversation_id(data)
+        identity = request_identity(request)
+        owner = request_owner(identity)
+        await check_conversation_owner(conversation_id, owner)
 
-        # Kiểm tra cuối cùng
-        if not conversation_id:
-            raise HTTPException(status_code=400, detail="Missing or empty conversation ID")
+        # Giữ chỗ task_id trước khi gửi: request lặp lại cùng khoá (retry,
+        # double click) trên bất kỳ replica nào cũng nhận lại task_id này
+        task_id = str(uuid.uuid4())
+        key = idempotency_key(request, conversation_id, data) if settings.CHAT_IDEMPOTENCY_TTL_SECONDS > 0 else None
+        if key is not None:
+            reserved = await asyncio.to_thread(
+                redis_client.set, key, task_id, nx=True, ex=settings.CHAT_IDEMPOTENCY_TTL_SECONDS
+            )
+            if not reserved:
+                existing_task_id = await asyncio.to_thread(redis_client.get, key)
+                if existing_task_id:
+                    duplicate_requests.inc()
+                    return {
+                        "status": "processing",
+                        "task_id": existing_task_id,
+                        "conversation_id": conversation_id,
+                        "duplicate": True
+                    }
 
-        print("Conversation id:", conversation_id)
+        try:
+            queue = await asyncio.to_thread(admission.admit, identity, message.strip())
+        except AdmissionRejected as e:
+            if key is not None:
+                await asyncio.to_thread(redis_client.delete, key)
+            rejected_requests.inc()
+            log_sampled("chat_rejected", conversation_id=conversation_id, reason=e.reason)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many requests ({e.reason}), retry later",
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+            )
 
-        # Gửi task tới Celery
-        task = celery_app.send_task(
-            'llm.fastapi.task.process_chatbot_request',
-            args=[message.strip(), conversation_id]
-        )
+        # Gửi task tới Celery; header `enqueued_at` để worker đo thời gian chờ trong
+        # hàng đợi, `owner` để gắn hội thoại với user trong lịch sử
+        start = time.monotonic()
+        try:
+            task = celery_app.send_task(
+                'llm.fastapi.task.process_chatbot_request',
+                args=[message.strip(), conversation_id],
+                task_id=task_id,
+                queue=queue,
+                headers={
+                    'enqueued_at': time.time(),
+                    'owner': owner
+                }
+            )
+        except Exception:
+            # Không để retry nhận về task_id chưa từng được gửi
+            if key is not None:
+                await asyncio.to_thread(redis_client.delete, key)
+            raise
+        enqueue_latency.observe(time.monotonic() - start)
+        log_sampled("chat_enqueued", conversation_id=conversation_id, task_id=task.id, queue=queue)
 
         return {
             "status": "processing",
@@ -75,3 +234,102 @@ async def handle_chat(request: Request):
     except Exception as e:
         import traceback; traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.get("/chat/cache/stats")
+async def response_cache_stats():
+    """
+    Hit/miss cộng dồn của các worker (qua RedisMetricsPusher, trễ tối đa
+    METRICS_PUSH_INTERVAL_SECONDS) cộng với lượt tra SSE của process này.
+    """
+    if response_cache is None:
+        return {"enabled": False}
+    names = response_cache_counters()
+    totals = await asyncio.to_thread(read_redis_counters, redis_client, names)
+    exact_hits, semantic_hits, misses = (
+        totals[name] + counter.value
+        for name, counter in zip(names, (response_cache.exact_hits, response_cache.semantic_hits, response_cache.misses))
+    )
+    lookups = exact_hits + semantic_hits + misses
+    return {
+        "enabled": True,
+        "hits": int(exact_hits),
+        "semantic_hits": int(semantic_hits),
+        "misses": int(misses),
+        "hit_ratio": (exact_hits + semantic_hits) / lookups if lookups else 0.0,
+    }
+
+
+@router.post("/chat/stream")
+async def handle_chat_stream(request: Request):
+    """
+    Chế độ độ trễ thấp: stream câu trả lời trực tiếp dưới dạng Server-Sent Events
+    từ process FastAPI, bỏ qua Celery/Redis/Socket.IO. Dùng cho prompt ngắn,
+    tương tác; các tác vụ dài vẫn nên đi qua /api/chat.
+    """
+    data = await request.json()
+    message = data.get('message')
+    if not message or not message.strip():
+        raise HTTPException(status_code=400, detail="Missing or empty 'message' field")
+
+    conversation_id = resolve_conversation_id(data)
+    owner = request_owner(request_identity(request))
+    await check_conversation_owner(conversation_id, owner)
+
+    if direct_stream_slots.locked():
+        raise HTTPException(
+            status_code=429,
+            detail="Too many concurrent streams, retry shortly or use /api/chat",
+            headers={"Retry-After": "1"}
+        )
+    # Giữ slot ngay (semaphore còn chỗ nên không chờ, giữa kiểm tra và acquire
+    # không có await): request đồng thời không cùng lọt qua rồi xếp hàng chờ
+    await direct_stream_slots.acquire()
+    active_direct_streams.inc()
+    released = False
+
+    def release_slot():
+        # Gọi từ finally của generator và từ background task của response
+        # (khi client ngắt trước khi body bắt đầu, generator không chạy)
+        nonlocal released
+        if not released:
+            released = True
+            direct_stream_slots.release()
+            active_direct_streams.dec()
+
+    asked_at = time.time()
+
+    async def event_stream():
+        try:
+            yield sse_event("processing", {})
+            parts = []
+            try:
+                chatbot = get_direct_chatbot()
+                start = time.monotonic()
+                async for chunk in chatbot.astream(message.strip(), conversation_id):
+                    chunk_content = extract_content_from_chunk(chunk)
+                    if chunk_content:
+                        if not parts:
+                            direct_ttft.observe(time.monotonic() - start)
+                        parts.append(chunk_content)
+                        yield sse_event("gen_token", {"data": chunk_content})
+
+                complete_response = "".join(parts)
+                yield sse_event("completed", {"response": complete_response})
+                await asyncio.to_thread(chatbot.remember, conversation_id, message.strip(), complete_response)
+                # Cùng hàng đợi lịch sử với lượt chạy trên worker
+                if settings.HISTORY_ENABLED:
+                    record = turn_record(conversation_id, message.strip(), complete_response, owner=owner, asked_at=asked_at)
+                    await asyncio.to_thread(enqueue_turns, redis_client, settings.HISTORY_QUEUE_KEY, [record])
+            except Exception as e:
+                print(f"Error in direct stream for {conversation_id}: {e}")
+                yield sse_event("error", {"error": str(e)})
+        finally:
+            release_slot()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_slot)
+    )
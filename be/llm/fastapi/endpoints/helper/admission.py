@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import namedtuple
+
+from jose import JWTError
+
+from endpoints.helper.jwt_handler import decode_access_token
+from endpoints.helper.middleware import bearer_token
+
+# Token bucket theo user, tính lại số token theo thời gian trôi qua (dùng TIME
+# của Redis để mọi replica API chung một đồng hồ). Số thực được trả về dạng
+# chuỗi vì Redis cắt số Lua thành số nguyên. `cost` âm là hoàn token (không
+# vượt quá capacity).
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+  tokens = math.min(capacity, tokens - cost)
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+BucketResult = namedtuple("BucketResult", ["allowed", "tokens", "retry_after"])
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Giới hạn tốc độ gửi chat của từng user: `capacity` request, hồi `refill_per_sec` request/giây."""
+
+    def __init__(self, redis_client, capacity: float, refill_per_sec: float, prefix: str = "bucket:chat"):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.prefix = prefix
+        self._take = redis_client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def take(self, identity: str, cost: float = 1.0) -> BucketResult:
+        allowed, tokens, retry_after = self._take(
+            keys=[f"{self.prefix}:{identity}"],
+            args=[self.capacity, self.refill_per_sec, cost]
+        )
+        return BucketResult(bool(allowed), float(tokens), float(retry_after))
+
+    def refund(self, identity: str, cost: float = 1.0):
+        """Trả lại token đã lấy cho request bị từ chối ở bước sau."""
+        self.take(identity, -cost)
+
+
+class QueueDepthProbe:
+    """
+    Đọc độ dài hàng đợi Celery trên broker Redis (mỗi queue là một list cùng
+    tên). Kết quả được giữ `cache_seconds` để không thêm round trip vào mọi request.
+    """
+
+    def __init__(self, broker_client, cache_seconds: float = 0.25):
+        self.broker_client = broker_client
+        self.cache_seconds = cache_seconds
+        self._cached = {}
+        self._lock = threading.Lock()
+
+    def depth(self, queue: str) -> int:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cached.get(queue)
+            if cached is not None and now - cached[1] < self.cache_seconds:
+                return cached[0]
+        depth = self.broker_client.llen(queue)
+        with self._lock:
+            self._cached[queue] = (depth, now)
+        return depth
+
+
+class AdmissionController:
+    """
+    Quyết định một chat có được nhận hay không và đưa vào queue nào.
+
+    1. Token bucket theo user: hết token -> từ chối, Retry-After là thời gian
+       tới khi đủ một token.
+    2. Định tuyến: prompt ngắn của user còn nhiều token (tương tác, chưa dùng
+       nhiều) vào `fast_queue`; prompt dài hoặc user đang gửi dồn vào `bulk_queue`.
+    3. Hàng đợi đích dài quá `max_queue_depth` -> hoàn token đã lấy ở bước 1
+       và từ chối với Retry-After cố định.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket = None,
+        probe: QueueDepthProbe = None,
+        max_queue_depth: int = 0,
+        retry_after_seconds: float = 5.0,
+        fast_queue: str = None,
+        bulk_queue: str = None,
+        fast_max_chars: int = 500
+    ):
+        self.bucket = bucket
+        self.probe = probe
+        self.max_queue_depth = max_queue_depth
+        self.retry_after_seconds = retry_after_seconds
+        self.fast_queue = fast_queue
+        self.bulk_queue = bulk_queue
+        self.fast_max_chars = fast_max_chars
+
+    def route(self, message: str, tokens_left: float = None) -> str:
+        if self.fast_queue is None:
+            return None
+        heavy_user = (
+            self.bucket is not None and tokens_left is not None
+            and tokens_left < self.bucket.capacity / 2
+        )
+        if len(message) <= self.fast_max_chars and not heavy_user:
+            return self.fast_queue
+        return self.bulk_queue
+
+    def admit(self, identity: str, message: str) -> str:
+        """Trả về tên queue (None = queue mặc định) hoặc raise AdmissionRejected."""
+        tokens_left = None
+        if self.bucket is not None:
+            result = self.bucket.take(identity)
+            if not result.allowed:
+                raise AdmissionRejected("rate_limited", result.retry_after)
+            tokens_left = result.tokens
+
+        queue = self.route(message, tokens_left)
+        if self.probe is not None and self.max_queue_depth > 0:
+            if self.probe.depth(queue or "celery") >= self.max_queue_depth:
+                if self.bucket is not None:
+                    self.bucket.refund(identity)
+                raise AdmissionRejected("queue_full", self.retry_after_seconds)
+        return queue
+
+
+def request_identity(request) -> str:
+    """User để tính rate limit: claims từ middleware, Bearer token nếu có, nếu không thì IP."""
+    user = getattr(request.state, "user", None)
+    if user is None:
+        token = bearer_token(request.scope)
+        if token:
+            try:
+                user = decode_access_token(token)
+            except JWTError:
+                user = None
+    if user and user.get("sub"):
+        return f"user:{user['sub']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def build_admission(settings, redis_client, broker_client=None) -> AdmissionController:
+    bucket = None
+    if settings.CHAT_RATE_LIMIT_CAPACITY > 0:
+        bucket = TokenBucket(redis_client, settings.CHAT_RATE_LIMIT_CAPACITY, settings.CHAT_RATE_LIMIT_REFILL_PER_SEC)
+    probe = QueueDepthProbe(broker_client) if broker_client is not None else None
+    return AdmissionController(
+        bucket=bucket,
+        probe=probe,
+        max_queue_depth=settings.CHAT_MAX_QUEUE_DEPTH,
+        retry_after_seconds=settings.CHAT_QUEUE_RETRY_AFTER_SECONDS,
+        fast_queue=settings.CHAT_FAST_QUEUE if settings.CHAT_QUEUE_ROUTING else None,
+        bulk_queue=settings.CHAT_BULK_QUEUE if settings.CHAT_QUEUE_ROUTING else None,
+        fast_max_chars=settings.CHAT_FAST_MAX_CHARS
+    )
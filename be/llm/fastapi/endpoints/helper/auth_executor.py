@@ -0,0 +1,34 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AuthBusyError(Exception):
+    """Không lấy được slot trong thời gian chờ cho phép."""
+
+
+class AuthExecutor:
+    """
+    Chạy các thao tác đồng bộ, tốn CPU của luồng xác thực (bcrypt) trong một
+    thread pool riêng để không chặn event loop; truy vấn DB đã là async
+    (user_store.py).
+
+    `max_concurrency` giới hạn số job đang chạy + đang chờ; request nào không
+    lấy được slot trong `queue_timeout` giây sẽ nhận AuthBusyError.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int, queue_timeout: float):
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="auth")
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, fn, *args):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AuthBusyError()
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
@@ -1,22 +1,124 @@
+import os
+import sys
+from contextlib import asynccontextmanager
 from typing import Optional, Generator
+from sqlalchemy import Index, UniqueConstraint, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, Field, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-DATABASE_URL = "sqlite:///./app.db"
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../../../'))
+from core.config import settings
 
-engine = create_engine(DATABASE_URL, echo=True)
+
+
+def _database_url():
+    url = make_url(settings.DATABASE_URL)
+    # Engine đồng bộ và engine async (tạo sau) phải mở cùng một file dù cwd đổi
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+        url = url.set(database=os.path.abspath(url.database))
+    return url
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL: login (đọc) không bị chặn bởi register hay writer lịch sử (ghi);
+    # synchronous=NORMAL đủ an toàn với WAL và không fsync mỗi commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.DB_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def _create_engine(url, create):
+    options = {"echo": settings.DB_ECHO}
+    # SQLite trong bộ nhớ dùng một kết nối cố định, không có pool_size
+    if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+        options.update(pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW)
+    new_engine = create(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(getattr(new_engine, "sync_engine", new_engine), "connect", _configure_sqlite)
+    return new_engine
+
+
+# Cả hai engine tạo ở lần dùng đầu: import module không đọc settings
+_engine = None
+_async_engine = None
+
+
+def get_engine():
+    """Engine đồng bộ: tạo bảng, writer lịch sử và API lịch sử (chạy trong thread)."""
+    global _engine
+    if _engine is None:
+        _engine = _create_engine(_database_url(), create_engine)
+    return _engine
+
+
+def get_async_engine():
+    """Engine async cho các route chạy trên event loop (user_store.py), tạo ở lần dùng đầu."""
+    global _async_engine
+    if _async_engine is None:
+        url = _database_url()
+        if url.get_backend_name() == "sqlite":
+            url = url.set(drivername="sqlite+aiosqlite")
+        _async_engine = _create_engine(url, create_async_engine)
+    return _async_engine
+
+
+async def dispose_engines() -> None:
+    global _engine, _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(index=True, unique=True, nullable=False)
     password: str  
 
+class Conversation(SQLModel, table=True):
+    # id là conversation_id của Socket.IO room; owner là username khi chat có JWT
+    __table_args__ = (Index("ix_conversation_owner_updated", "owner", "updated_at", "id"),)
+
+    id: str = Field(primary_key=True)
+    owner: Optional[str] = Field(default=None)
+    created_at: float
+    updated_at: float
+
+class ChatMessage(SQLModel, table=True):
+    # Được ghi theo lô bởi HistoryWriter (history_store.py); (conversation_id, id)
+    # là khoá phân trang, (conversation_id, turn_id, role) chống ghi lặp khi
+    # một lô được ghi lại sau sự cố
+    __table_args__ = (
+        Index("ix_chatmessage_conversation_id_id", "conversation_id", "id"),
+        UniqueConstraint("conversation_id", "turn_id", "role", name="uq_chatmessage_turn_role"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: str = Field(foreign_key="conversation.id")
+    turn_id: str
+    role: str
+    content: str
+    status: str = "completed"
+    created_at: float
+
 def init_db() -> None:
-    SQLModel.metadata.create_all(engine)
+    SQLModel.metadata.create_all(get_engine())
 
 def get_session() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
+        yield session
+
+@asynccontextmanager
+async def async_session():
+    """Session async trả kết nối về pool khi ra khỏi khối `async with`."""
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
         yield session
 
 if __name__ == "__main__":
     init_db()
-    print("✅ Database initialized and table User is ready in app.db")
+    print(f"✅ Database initialized and tables User, Conversation, ChatMessage are ready in {settings.DATABASE_URL}")
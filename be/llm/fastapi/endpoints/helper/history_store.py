@@ -0,0 +1,282 @@
+import asyncio
+import base64
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert
+
+from endpoints.helper.db_init import ChatMessage, Conversation
+
+# Chỉ xoá khoá nếu vẫn là của người giữ (tránh xoá lock của writer khác khi hết hạn)
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class HistoryWriter:
+    """
+    Ghi lịch sử hội thoại kiểu write-behind: worker chỉ RPUSH lượt đã xong vào
+    list Redis `queue_key` (core/history.py), writer đọc từng lô tối đa
+    `batch_size` lượt và ghi trong một transaction.
+
+    Lô được đọc bằng LRANGE và chỉ bị LTRIM sau khi commit, nên lỗi DB hay
+    process chết giữa chừng không làm mất lượt nào; lô ghi lại bị bỏ qua nhờ
+    ràng buộc duy nhất (conversation_id, turn_id, role). Nhiều replica API có
+    thể cùng chạy writer: lock Redis đảm bảo mỗi lúc chỉ một writer lấy lô.
+
+    Chủ hội thoại là owner của lượt đầu tiên được ghi và không đổi về sau:
+    lượt mang owner khác (conversation_id do client chọn) bị bỏ qua. Lượt
+    không có owner (ẩn danh, follower của single-flight) vẫn được ghi.
+    """
+
+    def __init__(self, redis_client, engine, queue_key: str, batch_size: int = 500, interval: float = 1.0,
+                 lock_ttl: float = 30.0, owners=None):
+        self.redis_client = redis_client
+        self.engine = engine
+        # ConversationOwners của API: nhớ chủ của các hội thoại vừa ghi
+        self.owners = owners
+        self.queue_key = queue_key
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lock_key = f"{queue_key}:lock"
+        self.lock_ttl_ms = int(lock_ttl * 1000)
+        self.written = 0
+        self.rejected = 0
+        self._release = redis_client.register_script(_RELEASE_LOCK_SCRIPT)
+
+    def write(self, turns: list):
+        table = Conversation.__table__
+        with self.engine.begin() as connection:
+            owners = dict(connection.execute(
+                select(table.c.id, table.c.owner).where(table.c.id.in_(list({turn["conversation_id"] for turn in turns})))
+            ).all())
+            conversations, messages = self._rows(turns, owners)
+            if not conversations:
+                return
+            # Hội thoại đã có chỉ được cập nhật updated_at, không bao giờ đổi chủ
+            upsert = insert(table)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=["id"],
+                set_={"updated_at": func.max(table.c.updated_at, upsert.excluded.updated_at)}
+            )
+            connection.execute(upsert, list(conversations.values()))
+            connection.execute(insert(ChatMessage.__table__).prefix_with("OR IGNORE"), messages)
+        if self.owners is not None:
+            self.owners.remember({cid: owners[cid] for cid in conversations})
+
+    def _rows(self, turns: list, owners: dict) -> tuple:
+        """Dòng conversation/message của các lượt được ghi; `owners` là chủ đã lưu (id -> owner)."""
+        conversations = {}
+        messages = []
+        for turn in turns:
+            cid = turn["conversation_id"]
+            owner = turn.get("owner")
+            if cid not in owners:
+                owners[cid] = owner
+            elif owner is not None and owner != owners[cid]:
+                self.rejected += 1
+                print(f"Skipping history turn of {owner} for conversation {cid} owned by {owners[cid]}")
+                continue
+            conversation = conversations.setdefault(cid, {
+                "id": cid, "owner": owners[cid], "created_at": turn["asked_at"], "updated_at": turn["answered_at"]
+            })
+            conversation["updated_at"] = max(conversation["updated_at"], turn["answered_at"])
+            messages.append({
+                "conversation_id": cid, "turn_id": turn["turn_id"], "role": "user",
+                "content": turn["message"], "status": "completed", "created_at": turn["asked_at"]
+            })
+            messages.append({
+                "conversation_id": cid, "turn_id": turn["turn_id"], "role": "assistant",
+                "content": turn["response"], "status": turn.get("status", "completed"), "created_at": turn["answered_at"]
+            })
+        return conversations, messages
+
+    def drain_once(self) -> int:
+        """Ghi một lô; trả về số lượt đã ghi (0 nếu hàng đợi trống hoặc writer khác đang giữ lock)."""
+        token = uuid.uuid4().hex
+        if not self.redis_client.set(self.lock_key, token, nx=True, px=self.lock_ttl_ms):
+            return 0
+        try:
+            raw = self.redis_client.lrange(self.queue_key, 0, self.batch_size - 1)
+            if not raw:
+                return 0
+            turns = []
+            for item in raw:
+                try:
+                    turns.append(json.loads(item))
+                except ValueError:
+                    print(f"Skipping malformed history record: {item[:200]}")
+            if turns:
+                self.write(turns)
+            self.redis_client.ltrim(self.queue_key, len(raw), -1)
+            self.written += len(turns)
+            return len(raw)
+        finally:
+            self._release(keys=[self.lock_key], args=[token])
+
+    async def run(self):
+        """Vòng lặp nền của API: ghi liên tục khi còn lô đầy, nghỉ `interval` khi đã hết."""
+        while True:
+            try:
+                written = await asyncio.to_thread(self.drain_once)
+            except Exception as e:
+                print(f"Error writing chat history: {e}")
+                written = 0
+            if written < self.batch_size:
+                await asyncio.sleep(self.interval)
+
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Cursor sai định dạng -> ValueError."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+
+
+def get_conversation(connection, conversation_id: str):
+    table = Conversation.__table__
+    return connection.execute(select(table).where(table.c.id == conversation_id)).mappings().first()
+
+
+_MISSING = object()
+
+
+class ConversationOwners:
+    """
+    Chủ đã lưu của các hội thoại, để /api/chat không truy vấn DB mỗi request.
+
+    Chủ không bao giờ đổi (HistoryWriter) nên entry không hết hạn, chỉ bị đẩy
+    ra theo LRU. Entry đến từ HistoryWriter sau mỗi lô và từ các lượt tra DB;
+    hội thoại chưa có trong DB không được nhớ vì writer có thể ghi nó ngay sau
+    đó. Writer chạy trong thread nên có lock.
+    """
+
+    def __init__(self, engine, max_entries: int = 100000):
+        self.engine = engine
+        self.max_entries = max_entries
+        self._owners = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, conversation_id: str):
+        """Chủ đã nhớ (có thể là None = ẩn danh) hoặc _MISSING."""
+        with self._lock:
+            owner = self._owners.get(conversation_id, _MISSING)
+            if owner is not _MISSING:
+                self._owners.move_to_end(conversation_id)
+            return owner
+
+    def remember(self, owners: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            for conversation_id, owner in owners.items():
+                self._owners[conversation_id] = owner
+                self._owners.move_to_end(conversation_id)
+            while len(self._owners) > self.max_entries:
+                self._owners.popitem(last=False)
+
+    def lookup(self, conversation_id: str):
+        """Chủ trong DB (chạy trong thread); _MISSING nếu chưa lưu hoặc chưa có bảng."""
+        try:
+            with self.engine.connect() as connection:
+                conversation = get_conversation(connection, conversation_id)
+        except OperationalError as e:
+            # Bảng lịch sử chưa được tạo (init_db chưa chạy): chưa có gì để bảo vệ
+            print(f"Conversation owner lookup failed: {e}")
+            return _MISSING
+        if conversation is None:
+            return _MISSING
+        self.remember({conversation_id: conversation["owner"]})
+        return conversation["owner"]
+
+    async def owns(self, conversation_id: str, owner: str) -> bool:
+        """
+        False nếu hội thoại đã được lưu với chủ khác `owner` (None = ẩn danh).
+        Hội thoại chưa có trong DB thì ai cũng được bắt đầu.
+        """
+        stored = self.cached(conversation_id)
+        if stored is _MISSING:
+            stored = await asyncio.to_thread(self.lookup, conversation_id)
+        return stored is _MISSING or stored == owner
+
+
+def list_messages(connection, conversation_id: str, limit: int, cursor: str = None) -> dict:
+    """
+    Tin nhắn mới nhất trước, phân trang theo khoá (conversation_id, id): trang
+    sau bắt đầu ngay dưới id cuối của trang trước, không dùng OFFSET nên chi
+    phí mỗi trang không tăng theo độ sâu.
+    """
+    table = ChatMessage.__table__
+    query = select(
+        table.c.id, table.c.role, table.c.content, table.c.status, table.c.created_at
+    ).where(table.c.conversation_id == conversation_id)
+    if cursor:
+        try:
+            (before_id,) = decode_cursor(cursor)
+            before_id = int(before_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError("invalid cursor") from e
+        query = query.where(table.c.id < before_id)
+    rows = connection.execute(query.order_by(table.c.id.desc()).limit(limit + 1)).mappings().all()
+
+    page = [dict(row) for row in rows[:limit]]
+    return {
+        "messages": page,
+        "next_cursor": encode_cursor(page[-1]["id"]) if len(rows) > limit else None,
+    }
+
+
+def list_conversations(connection, owner: str, limit: int, cursor: str = None) -> dict:
+    """Hội thoại của `owner`, cập nhật gần nhất trước, phân trang theo khoá (updated_at, id)."""
+    table = Conversation.__table__
+    query = select(table.c.id, table.c.created_at, table.c.updated_at).where(table.c.owner == owner)
+    if cursor:
+        try:
+            updated_at, conversation_id = decode_cursor(cursor)
+            updated_at, conversation_id = float(updated_at), str(conversation_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError("invalid cursor") from e
+        query = query.where(or_(
+            table.c.updated_at < updated_at,
+            and_(table.c.updated_at == updated_at, table.c.id < conversation_id)
+        ))
+    rows = connection.execute(
+        query.order_by(table.c.updated_at.desc(), table.c.id.desc()).limit(limit + 1)
+    ).mappings().all()
+
+    page = [dict(row) for row in rows[:limit]]
+    return {
+        "conversations": page,
+        "next_cursor": encode_cursor(page[-1]["updated_at"], page[-1]["id"]) if len(rows) > limit else None,
+    }
+
+
+def build_conversation_owners(settings, engine):
+    if not settings.HISTORY_ENABLED:
+        return None
+    return ConversationOwners(engine, settings.HISTORY_OWNER_CACHE_SIZE)
+
+
+def build_history_writer(settings, redis_client, engine, owners=None):
+    if not settings.HISTORY_ENABLED:
+        return None
+    return HistoryWriter(
+        redis_client,
+        engine,
+        settings.HISTORY_QUEUE_KEY,
+        batch_size=settings.HISTORY_BATCH_SIZE,
+        interval=settings.HISTORY_FLUSH_INTERVAL_SECONDS,
+        owners=owners
+    )
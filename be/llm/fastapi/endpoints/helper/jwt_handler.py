@@ -1,6 +1,10 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+import hashlib
 import os
 import sys
+import threading
+import time
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -19,13 +23,75 @@ credentials_exception = HTTPException(
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+
+class TokenCache:
+    """
+    LRU cache các claims đã xác thực, key là sha256 của token (không giữ token
+    gốc trong bộ nhớ). Entry hết hạn cùng lúc với `exp` của token, và không quá
+    `max_ttl_seconds` để thay đổi SECRET_KEY/thu hồi có hiệu lực nhanh.
+    """
+
+    def __init__(self, max_entries: int, max_ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_ttl_seconds = max_ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, key: bytes):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return claims
+
+    def put(self, key: bytes, claims: dict):
+        expires_at = time.time() + self.max_ttl_seconds
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_token_cache = None
+
+
+def get_token_cache() -> TokenCache:
+    """Cache dùng chung của process, tạo ở lần xác thực đầu tiên (không phải lúc import)."""
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_MAX_TTL_SECONDS)
+    return _token_cache
+
+
+def decode_access_token(token: str) -> dict:
+    """Giải mã và xác thực JWT, dùng lại kết quả đã xác thực nếu có; lỗi -> JWTError."""
+    key = TokenCache.digest(token)
+    token_cache = get_token_cache()
+    claims = token_cache.get(key)
+    if claims is None:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        token_cache.put(key, claims)
+    return claims
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     payload = verify_access_token(token)
     user_id: str = payload.get("sub")
     if user_id is None:
         raise credentials_exception
 
-    user = get_user(user_id)
+    user = await get_user(user_id)
 
     return user
 
@@ -38,7 +104,6 @@ def create_access_token(data: dict) -> str:
 
 def verify_access_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload  
+        return decode_access_token(token)
     except JWTError:
         raise credentials_exception
@@ -1,44 +1,66 @@
-import os
-import sys
-from fastapi import FastAPI, Request, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-
-sys.path.append(os.path.join(os.path.dirname(__file__), '../../../..'))
-from core.config import settings
+from fastapi import status
 from fastapi.responses import JSONResponse
+from jose import JWTError
 
-ALLOW_PATH = ['/login', '/register', '/api/login', '/api/register', '/', '/api/chat']
+from endpoints.helper.jwt_handler import decode_access_token
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+ALLOW_PATH = ['/login', '/register', '/api/login', '/api/register', '/', '/api/chat', '/api/chat/stream', '/metrics']
+# Các tiền tố được bỏ qua xác thực (vd. '/docs'); để trống = chỉ khớp chính xác ALLOW_PATH
+ALLOW_PREFIXES = []
 
-def create_middleware(app):
-    @app.middleware("http")
-    async def check_valid_token(request: Request, call_next):
-        if request.method == "OPTIONS":
-            return await call_next(request)
 
-        if request.url.path in ALLOW_PATH:
-            return await call_next(request)
+def unauthorized(detail: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        content={"detail": detail},
+        headers={"WWW-Authenticate": "Bearer"}
+    )
 
-        try:
-            token = await oauth2_scheme(request)
-        except HTTPException as e:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Missing or invalid Authorization header"},
-                headers=e.headers if hasattr(e, 'headers') else {"WWW-Authenticate": "Bearer"}
-            )
+
+def bearer_token(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token.strip()
+            return None
+    return None
+
+
+class AuthMiddleware:
+    """
+    Middleware ASGI thuần kiểm tra Bearer token. Không đi qua BaseHTTPMiddleware
+    nên không bọc lại response (streaming/SSE đi thẳng tới client). Path được
+    khớp bằng set (O(1)) hoặc theo tiền tố; claims đã giải mã được đặt vào
+    `request.state.user`.
+    """
+
+    def __init__(self, app, allow_paths=None, allow_prefixes=None):
+        self.app = app
+        self.allow_paths = frozenset(ALLOW_PATH if allow_paths is None else allow_paths)
+        self.allow_prefixes = tuple(ALLOW_PREFIXES if allow_prefixes is None else allow_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        if path in self.allow_paths or (self.allow_prefixes and path.startswith(self.allow_prefixes)):
+            return await self.app(scope, receive, send)
+
+        token = bearer_token(scope)
+        if not token:
+            return await unauthorized("Missing or invalid Authorization header")(scope, receive, send)
 
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-            request.state.user = payload
+            claims = decode_access_token(token)
         except JWTError:
-            return JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Invalid token"},
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-
-        return await call_next(request)
-    return app
\ No newline at end of file
+            return await unauthorized("Invalid token")(scope, receive, send)
+
+        scope.setdefault("state", {})["user"] = claims
+        return await self.app(scope, receive, send)
+
+
+def create_middleware(app):
+    app.add_middleware(AuthMiddleware)
+    return app
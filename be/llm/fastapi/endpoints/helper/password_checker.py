@@ -1,6 +1,13 @@
+import os
+import sys
+
 from passlib.context import CryptContext
 
-from endpoints.helper.db_init import User, get_session
+from endpoints.helper.db_init import get_async_engine
+from endpoints.helper.user_store import build_user_store
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../../../'))
+from core.config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -11,13 +18,54 @@ def gen_hashed_password(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def get_user(user_id: str) -> dict:
-    session = next(get_session())
-    user = session.query(User).filter(User.username == user_id).first()
-    if user:
-        return {
-            "id": user.id,
-            "username": user.username,
-            "hashed_password": user.password
-        }
-    return None
\ No newline at end of file
+_user_store = None
+_dummy_hash = None
+
+
+def get_user_store():
+    global _user_store
+    if _user_store is None:
+        _user_store = build_user_store(settings, get_async_engine())
+    return _user_store
+
+
+async def get_user(user_id: str) -> dict:
+    return await get_user_store().get(user_id)
+
+
+def dummy_hash() -> str:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = pwd_context.hash("dummy-password-for-timing")
+    return _dummy_hash
+
+
+def verify_dummy_password(password: str) -> bool:
+    return pwd_context.verify(password, dummy_hash())
+
+
+async def authenticate_user(username: str, password: str, run) -> dict:
+    """
+    Kiểm tra username/password. Tra user trên event loop (user_store, có
+    cache), còn bcrypt chạy qua `run` (AuthExecutor.run). Với username không
+    tồn tại vẫn chạy một lần bcrypt với hash giả để thời gian phản hồi không
+    tiết lộ tài khoản nào có thật.
+    """
+    user = await get_user(username)
+    if user is None:
+        await run(verify_dummy_password, password)
+        return None
+    if not await run(verify_password, password, user["hashed_password"]):
+        return None
+    return user
+
+
+async def create_user(username: str, password: str, run) -> dict:
+    """Tạo tài khoản mới (bcrypt qua `run`); trả về None nếu username đã tồn tại."""
+    if await get_user(username):
+        return None
+    hashed_password = await run(gen_hashed_password, password)
+    user = await get_user_store().create(username, hashed_password)
+    if user is None:
+        return None
+    return {"id": user["id"], "username": user["username"]}
@@ -0,0 +1,174 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from endpoints.helper.db_init import User
+
+_MISSING = object()
+
+
+class _TTLCache:
+    """LRU có TTL, chỉ dùng trên event loop nên không cần lock."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+
+class UserStore:
+    """
+    Bảng user qua engine async (truy vấn Core trên User.__table__, nhẹ hơn
+    session ORM), có cache đọc xuyên cho login/register.
+
+    User tìm thấy được nhớ `ttl_seconds`; username không tồn tại được nhớ
+    riêng `negative_ttl_seconds` (cache âm riêng nên dò username ngẫu nhiên
+    không đẩy user thật ra khỏi cache). Các lượt tra cùng một username đang
+    chờ DB dùng chung một truy vấn.
+
+    SQLite chỉ có một writer: thay vì mỗi register một transaction tranh lock
+    (busy handler ngủ tới 100 ms mỗi lần thử lại), các register đang chờ được
+    ghi chung một transaction (group commit); username đã có bị bỏ qua bằng
+    ON CONFLICT DO NOTHING. Register thay entry của username bằng
+    user vừa tạo, nên login ngay sau đó trên cùng process không thấy cache âm
+    cũ; replica khác thấy user mới sau tối đa `negative_ttl_seconds`.
+    """
+
+    def __init__(self, engine, max_entries: int = 10000, ttl_seconds: float = 60.0,
+                 negative_max_entries: int = 10000, negative_ttl_seconds: float = 30.0):
+        self.engine = engine
+        self._users = _TTLCache(max_entries, ttl_seconds)
+        self._unknown = _TTLCache(negative_max_entries, negative_ttl_seconds)
+        self._pending = {}
+        self._writes = []
+        self._writer = None
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    def _cached(self, username: str):
+        user = self._users.get(username)
+        if user is not _MISSING:
+            return user
+        if self._unknown.get(username) is not _MISSING:
+            return None
+        return _MISSING
+
+    def _store(self, username: str, user):
+        if user is None:
+            self._unknown.put(username, True)
+        else:
+            self._unknown.discard(username)
+            self._users.put(username, user)
+
+    async def _fetch(self, username: str):
+        self.queries += 1
+        table = User.__table__
+        query = select(table.c.id, table.c.username, table.c.password).where(table.c.username == username)
+        async with self.engine.connect() as connection:
+            row = (await connection.execute(query)).first()
+        return None if row is None else {"id": row.id, "username": row.username, "hashed_password": row.password}
+
+    def _fetched(self, username: str, task):
+        # Register đã ghi entry mới hơn trong lúc truy vấn này chạy
+        if self._pending.get(username) is not task:
+            return
+        del self._pending[username]
+        if not task.cancelled() and task.exception() is None:
+            self._store(username, task.result())
+
+    async def get(self, username: str):
+        """User dạng dict (id, username, hashed_password) hoặc None nếu không tồn tại."""
+        user = self._cached(username)
+        if user is not _MISSING:
+            self.hits += 1
+            return user
+        self.misses += 1
+        task = self._pending.get(username)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(username))
+            self._pending[username] = task
+            task.add_done_callback(functools.partial(self._fetched, username))
+        # Request bị huỷ không huỷ truy vấn mà các request khác đang chờ
+        return await asyncio.shield(task)
+
+    async def create(self, username: str, hashed_password: str):
+        """Tạo user; trả về None nếu username đã tồn tại."""
+        future = asyncio.get_running_loop().create_future()
+        self._writes.append((username, hashed_password, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write_pending())
+        return await asyncio.shield(future)
+
+    async def _write_pending(self):
+        # Register đến trong lúc một lô đang ghi sẽ vào lô kế tiếp
+        while self._writes:
+            batch, self._writes = self._writes, []
+            try:
+                created = await self._insert(batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for username, hashed_password, future in batch:
+                # Cùng username hai lần trong một lô: chỉ request đầu tiên thành công
+                user_id = created.pop(username, None)
+                if user_id is None:
+                    self._unknown.discard(username)
+                    result = None
+                else:
+                    result = {"id": user_id, "username": username, "hashed_password": hashed_password}
+                    self._pending.pop(username, None)
+                    self._store(username, result)
+                if not future.done():
+                    future.set_result(result)
+
+    async def _insert(self, batch: list) -> dict:
+        """Ghi một lô trong một transaction; trả về {username: id} của các user được tạo."""
+        table = User.__table__
+        statement = insert(table).on_conflict_do_nothing(index_elements=["username"]).returning(table.c.id, table.c.username)
+        async with self.engine.begin() as connection:
+            rows = (await connection.execute(
+                statement, [{"username": username, "password": hashed_password} for username, hashed_password, _ in batch]
+            )).all()
+        return {row.username: row.id for row in rows}
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "queries": self.queries}
+
+
+def build_user_store(settings, engine) -> UserStore:
+    return UserStore(
+        engine,
+        max_entries=settings.AUTH_USER_CACHE_SIZE,
+        ttl_seconds=settings.AUTH_USER_CACHE_TTL_SECONDS,
+        negative_max_entries=settings.AUTH_NEGATIVE_CACHE_SIZE,
+        negative_ttl_seconds=settings.AUTH_NEGATIVE_CACHE_TTL_SECONDS
+    )
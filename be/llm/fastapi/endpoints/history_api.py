@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+
+from fastapi import APIRouter, HTTPException, Request
+
+from endpoints.helper.db_init import get_engine
+from endpoints.helper.history_store import get_conversation, list_conversations, list_messages
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../../'))
+from core.config import settings
+
+router = APIRouter()
+
+
+def page_size(limit: int) -> int:
+    if limit is None:
+        return settings.HISTORY_PAGE_SIZE
+    return max(1, min(limit, settings.HISTORY_MAX_PAGE_SIZE))
+
+
+def current_username(request: Request) -> str:
+    # Middleware đã kiểm tra JWT cho các route này
+    return request.state.user.get("sub")
+
+
+def read_messages(conversation_id: str, username: str, limit: int, cursor: str):
+    with get_engine().connect() as connection:
+        conversation = get_conversation(connection, conversation_id)
+        # Hội thoại của user khác hoặc ẩn danh trả về 404 như không tồn tại
+        if conversation is None or conversation["owner"] != username:
+            return None
+        return list_messages(connection, conversation_id, limit, cursor)
+
+
+def read_conversations(username: str, limit: int, cursor: str):
+    with get_engine().connect() as connection:
+        return list_conversations(connection, username, limit, cursor)
+
+
+@router.get("/conversations")
+async def get_conversations(request: Request, limit: int = None, cursor: str = None):
+    """Hội thoại của user hiện tại, mới cập nhật trước; trang sau dùng `next_cursor`."""
+    try:
+        return await asyncio.to_thread(read_conversations, current_username(request), page_size(limit), cursor)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/conversations/{conversation_id}/messages")
+async def get_conversation_messages(request: Request, conversation_id: str, limit: int = None, cursor: str = None):
+    """
+    Tin nhắn của một hội thoại, mới nhất trước. Lượt vừa xong có thể chưa có
+    ngay (writer ghi theo lô mỗi HISTORY_FLUSH_INTERVAL_SECONDS).
+    """
+    try:
+        page = await asyncio.to_thread(
+            read_messages, conversation_id, current_username(request), page_size(limit), cursor
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if page is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"conversation_id": conversation_id, **page}
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_VOCABULARY = (
+    "the a shop product order price delivery fast cheap quality rating review customer "
+    "category seller discount voucher best popular new stock week month today total sold "
+    "item return refund warranty shipping free size color model brand recommend"
+).split()
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Chat model giả, tất định, dùng cho benchmark/load test mà không tốn quota.
+
+    Câu trả lời được sinh từ hash của prompt + `seed` (cùng prompt -> cùng câu
+    trả lời). Token đầu tiên tới sau `ttft_ms`, các token sau cách nhau
+    1/`tokens_per_sec` giây, dao động ±`jitter` (tỉ lệ). Để giả lập provider
+    thật: tỉ lệ `ttft_tail_rate` request có TTFT `ttft_tail_ms` (đuôi chậm) và
+    tỉ lệ `fail_rate` request lỗi ngay trước token đầu.
+    """
+
+    ttft_ms: float = 200.0
+    tokens_per_sec: float = 50.0
+    jitter: float = 0.2
+    length: int = 200
+    seed: int = 0
+    fail_rate: float = 0.0
+    ttft_tail_rate: float = 0.0
+    ttft_tail_ms: float = 2000.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _rng(self, messages: List[BaseMessage]) -> random.Random:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _delays(self, rng: random.Random) -> Iterator[float]:
+        gap = 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        tail = self.ttft_tail_rate > 0 and random.random() < self.ttft_tail_rate
+        yield (self.ttft_tail_ms if tail else self.ttft_ms) / 1000.0
+        for _ in range(self.length - 1):
+            yield max(0.0, gap * (1 + rng.uniform(-self.jitter, self.jitter)))
+
+    def _maybe_fail(self):
+        if self.fail_rate > 0 and random.random() < self.fail_rate:
+            raise RuntimeError("fake provider error")
+
+    def _tokens(self, rng: random.Random) -> Iterator[str]:
+        for i in range(self.length):
+            yield ("" if i == 0 else " ") + rng.choice(_VOCABULARY)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        rng = self._rng(messages)
+        for index, (delay, token) in enumerate(zip(self._delays(rng), self._tokens(rng))):
+            if delay:
+                time.sleep(delay)
+            if index == 0:
+                self._maybe_fail()
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        rng = self._rng(messages)
+        for index, (delay, token) in enumerate(zip(self._delays(rng), self._tokens(rng))):
+            if delay:
+                await asyncio.sleep(delay)
+            if index == 0:
+                self._maybe_fail()
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in self._stream(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+def build_fake_model(settings, **overrides) -> FakeStreamingChatModel:
+    """Model giả theo các biến FAKE_LLM_*; `overrides` (vd. từ LLM_POOL) ghi đè từng trường."""
+    params = {
+        "ttft_ms": settings.FAKE_LLM_TTFT_MS,
+        "tokens_per_sec": settings.FAKE_LLM_TOKENS_PER_SEC,
+        "jitter": settings.FAKE_LLM_JITTER,
+        "length": settings.FAKE_LLM_LENGTH,
+        "seed": settings.FAKE_LLM_SEED,
+    }
+    params.update(overrides)
+    return FakeStreamingChatModel(**params)
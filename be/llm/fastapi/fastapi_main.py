@@ -1,17 +1,62 @@
+import asyncio
 import json
 import uuid
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Client Redis/broker, writer lịch sử và (STARTUP_WARMUP) Chatbot được tạo
+    khi process bắt đầu phục vụ, không phải lúc import: mỗi process uvicorn
+    (reload, --workers) có kết nối riêng.
+    """
+    global history_writer
+    report = StartupReport("api")
+    with report.step("clients"):
+        chatbot_api.init_resources()
+        authen_api.init_resources()
+    # Tạo bảng (user, lịch sử) và bật WAL cho file SQLite
+    with report.step("init_db"):
+        init_db()
+    # Ghi lịch sử hội thoại từ hàng đợi Redis xuống DB (write-behind)
+    history_writer = build_history_writer(settings, chatbot_api.redis_client, get_engine(), chatbot_api.conversation_owners)
+    if history_writer is not None:
+        task = asyncio.create_task(history_writer.run())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    if settings.STARTUP_WARMUP:
+        await asyncio.to_thread(chatbot_api.warm_up, report)
+    report.done()
+    yield
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await dispose_engines()
+
 
-app = FastAPI(title="Chatbot LLM Backend")
+app = FastAPI(title="Chatbot LLM Backend", lifespan=lifespan)
 
 from endpoints.helper.middleware import create_middleware 
 app = create_middleware(app)
 from fastapi.middleware.cors import CORSMiddleware
 
-from endpoints import chatbot_api, authen_api
+from endpoints import chatbot_api, authen_api, history_api
+from endpoints.helper.db_init import dispose_engines, get_engine, init_db
+from endpoints.helper.history_store import build_history_writer
+from core.config import settings
+from core.metrics import registry, render_redis_metrics
+from core.startup import StartupReport
 app.include_router(chatbot_api.router, prefix="/api", tags=["chat"])
 app.include_router(authen_api.router, prefix="/api", tags=["auth"])
+app.include_router(history_api.router, prefix="/api", tags=["history"])
+
+history_writer = None
+_background_tasks = set()
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +75,15 @@ def read_root():
         "new_conversation_id": new_conversation_id
     })
 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    # Metric của process API + metric các worker Celery đã cộng dồn lên Redis
+    return PlainTextResponse(
+        registry.render() + render_redis_metrics(chatbot_api.redis_client),
+        media_type="text/plain; version=0.0.4"
+    )
+
 if __name__ == "__main__":
     print("Starting FastAPI server...")
     uvicorn.run("fastapi_main:app", host="0.0.0.0", port=8000, log_level="debug", reload=True)
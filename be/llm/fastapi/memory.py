@@ -0,0 +1,164 @@
+import json
+import re
+import threading
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_SUMMARY_PROMPT_TEMPLATE = """Progressively summarize the conversation, adding onto the previous summary.
+Keep names, numbers and decisions; drop pleasantries. Answer with the new summary only, at most {max_tokens} tokens.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự/token), đủ dùng để giới hạn kích thước prompt."""
+    return len(text) // 4 + 1
+
+
+class ConversationState:
+    """Tóm tắt cuốn chiếu + các lượt gần nhất, mỗi lượt là [role, text, tokens]."""
+
+    def __init__(self, summary: str = "", turns: list = None):
+        self.summary = summary
+        self.turns = turns if turns is not None else []
+
+    def is_empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def turn_tokens(self) -> int:
+        return sum(turn[2] for turn in self.turns)
+
+    def dumps(self) -> str:
+        return json.dumps({"s": self.summary, "t": self.turns}, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, raw: str):
+        data = json.loads(raw)
+        return cls(data.get("s", ""), data.get("t", []))
+
+
+class InMemoryStore:
+    """Lưu state trong process; chỉ phù hợp khi có một worker (hoặc cho benchmark)."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str):
+        with self._lock:
+            raw = self._states.get(conversation_id)
+        return ConversationState.loads(raw) if raw else None
+
+    def set(self, conversation_id: str, state: ConversationState):
+        with self._lock:
+            self._states[conversation_id] = state.dumps()
+
+
+class RedisStore:
+    def __init__(self, redis_client, ttl_seconds: int, prefix: str = "memory"):
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, conversation_id: str):
+        raw = self.redis_client.get(f"{self.prefix}:{conversation_id}")
+        return ConversationState.loads(raw) if raw else None
+
+    def set(self, conversation_id: str, state: ConversationState):
+        self.redis_client.set(f"{self.prefix}:{conversation_id}", state.dumps(), ex=self.ttl_seconds)
+
+
+class ExtractiveSummarizer:
+    """Tóm tắt tất định, không gọi LLM: giữ câu đầu của mỗi lượt bị gộp."""
+
+    def summarize(self, summary: str, turns: list, max_tokens: int) -> str:
+        lines = [f"{role}: {_SENTENCE_RE.split(text.strip(), 1)[0]}" for role, text, _ in turns]
+        merged = "\n".join(filter(None, [summary] + lines))
+        max_chars = max_tokens * 4
+        # Giữ phần mới nhất khi tóm tắt vượt ngân sách
+        return merged[-max_chars:] if len(merged) > max_chars else merged
+
+
+class LLMSummarizer:
+    """Gộp các lượt bị đẩy ra vào bản tóm tắt hiện có bằng một lệnh gọi model."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def summarize(self, summary: str, turns: list, max_tokens: int) -> str:
+        prompt = _SUMMARY_PROMPT_TEMPLATE.format(
+            max_tokens=max_tokens,
+            summary=summary or "(empty)",
+            lines="\n".join(f"{role}: {text}" for role, text, _ in turns)
+        )
+        response = self.model.invoke([HumanMessage(content=prompt)])
+        return response.content.strip()
+
+
+class ConversationMemory:
+    """
+    Bộ nhớ hội thoại theo conversation_id với ngân sách token cố định.
+
+    Các lượt gần nhất được giữ nguyên văn cho tới khi vượt `token_budget`; khi đó
+    các lượt cũ nhất bị đẩy ra và gộp vào bản tóm tắt cuốn chiếu. Mỗi lần gộp
+    chỉ xử lý bản tóm tắt cũ + các lượt vừa bị đẩy ra, không tóm tắt lại toàn bộ
+    lịch sử, nên chi phí mỗi lượt không tăng theo độ dài hội thoại.
+    """
+
+    def __init__(self, store, summarizer, token_budget: int, summary_max_tokens: int):
+        self.store = store
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+
+    def load(self, conversation_id: str) -> ConversationState:
+        return self.store.get(conversation_id) or ConversationState()
+
+    def build_messages(self, state: ConversationState, system_message, user_input: str) -> list:
+        messages = [system_message]
+        if state.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{state.summary}"))
+        for role, text, _ in state.turns:
+            messages.append(HumanMessage(content=text) if role == "user" else AIMessage(content=text))
+        messages.append(HumanMessage(content=user_input))
+        return messages
+
+    def record_turn(self, conversation_id: str, state: ConversationState, user_input: str, response: str):
+        state.turns.append(["user", user_input, estimate_tokens(user_input)])
+        state.turns.append(["assistant", response, estimate_tokens(response)])
+
+        total = state.turn_tokens()
+        evicted = []
+        # Đẩy ra theo cặp hỏi-đáp, luôn giữ lại cặp mới nhất
+        while total > self.token_budget and len(state.turns) > 2:
+            for turn in state.turns[:2]:
+                total -= turn[2]
+                evicted.append(turn)
+            del state.turns[:2]
+
+        if evicted:
+            state.summary = self.summarizer.summarize(state.summary, evicted, self.summary_max_tokens)
+        self.store.set(conversation_id, state)
+
+
+def build_memory(settings, redis_client=None, model=None):
+    """Tạo bộ nhớ theo MEMORY_BACKEND ("none" | "memory" | "redis")."""
+    if settings.MEMORY_BACKEND == "memory":
+        store = InMemoryStore()
+    elif settings.MEMORY_BACKEND == "redis" and redis_client is not None:
+        store = RedisStore(redis_client, settings.MEMORY_TTL_SECONDS)
+    else:
+        return None
+    if settings.MEMORY_SUMMARIZER == "llm" and model is not None:
+        summarizer = LLMSummarizer(model)
+    else:
+        summarizer = ExtractiveSummarizer()
+    return ConversationMemory(store, summarizer, settings.MEMORY_TOKEN_BUDGET, settings.MEMORY_SUMMARY_MAX_TOKENS)
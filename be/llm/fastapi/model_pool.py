@@ -0,0 +1,435 @@
+import asyncio
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+
+
+class BackendStats:
+    """
+    Thống kê cuộn của một backend: TTFT của `window` lần gọi gần nhất và tỉ lệ
+    lỗi trên cùng cửa sổ. Cập nhật từ nhiều thread (hedging chạy mỗi backend
+    trên một thread riêng) nên có khoá.
+    """
+
+    def __init__(self, window: int = 50):
+        self.ttfts = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.last_error_at = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, ttft: float):
+        with self._lock:
+            self.ttfts.append(ttft)
+            self.outcomes.append(0)
+
+    def record_slow(self, elapsed: float):
+        # Thua hedge trước token đầu: chỉ biết TTFT >= elapsed, vẫn ghi để
+        # backend chậm tụt xuống cuối thứ tự mà không bị tính là lỗi
+        with self._lock:
+            self.ttfts.append(elapsed)
+
+    def record_error(self):
+        with self._lock:
+            self.outcomes.append(1)
+            self.last_error_at = time.monotonic()
+
+    @property
+    def ttft(self) -> float:
+        """Trung vị TTFT (giây); 0 khi chưa có mẫu để backend mới được thử ngay."""
+        with self._lock:
+            return statistics.median(self.ttfts) if self.ttfts else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "ttft_ms": round(self.ttft * 1000, 1),
+            "error_rate": round(self.error_rate, 3),
+            "samples": len(self.outcomes),
+        }
+
+
+class Backend:
+    def __init__(self, name: str, model, window: int = 50):
+        self.name = name
+        self.model = model
+        self.stats = BackendStats(window)
+
+
+class ModelPool:
+    """
+    Nhiều chat model sau cùng một giao diện `stream`/`astream`/`invoke`, để
+    Chatbot và bộ nhớ hội thoại dùng như một model bình thường.
+
+    - Định tuyến: backend khoẻ có TTFT trung vị thấp nhất được gọi trước.
+      Backend có tỉ lệ lỗi >= `error_threshold` (khi đủ `min_samples`) bị
+      xếp cuối cho tới khi hết `cooldown_seconds` kể từ lỗi gần nhất.
+      Tỉ lệ `explore_rate` lần gọi đưa một backend khoẻ khác lên đầu để TTFT
+      của nó không đứng yên ở vài mẫu chậm cũ.
+    - Fallback: backend lỗi trước token đầu tiên thì chuyển sang backend kế
+      tiếp. Lỗi sau khi đã gửi token thì không thể nối câu trả lời, lỗi được
+      ném tiếp như khi dùng một model.
+    - Hedging (`hedge_after` > 0 giây): sau khoảng đó chưa có token đầu thì
+      gọi thêm backend kế tiếp, giữ luồng nào ra token trước và đóng luồng kia.
+    """
+
+    def __init__(
+        self,
+        backends: list,
+        hedge_after: float = 0.0,
+        error_threshold: float = 0.5,
+        min_samples: int = 5,
+        cooldown_seconds: float = 30.0,
+        explore_rate: float = 0.05
+    ):
+        if not backends:
+            raise ValueError("ModelPool cần ít nhất một backend")
+        self.backends = backends
+        self.hedge_after = hedge_after
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+        self.explore_rate = explore_rate
+        self.fallbacks = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def is_healthy(self, backend: Backend) -> bool:
+        stats = backend.stats
+        if len(stats.outcomes) < self.min_samples or stats.error_rate < self.error_threshold:
+            return True
+        # Hết thời gian nghỉ thì cho thử lại (nếu vẫn lỗi, last_error_at được đẩy lên)
+        return time.monotonic() - stats.last_error_at >= self.cooldown_seconds
+
+    def order(self) -> list:
+        """Backend theo thứ tự gọi: khoẻ trước, trong mỗi nhóm TTFT thấp trước."""
+        ordered = sorted(self.backends, key=lambda b: (not self.is_healthy(b), b.stats.ttft))
+        healthy = sum(1 for b in ordered if self.is_healthy(b))
+        if healthy > 1 and random.random() < self.explore_rate:
+            ordered.insert(0, ordered.pop(random.randrange(1, healthy)))
+        return ordered
+
+    def stats(self) -> dict:
+        return {
+            "backends": {b.name: {**b.stats.snapshot(), "healthy": self.is_healthy(b)} for b in self.backends},
+            "fallbacks": self.fallbacks,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+    # --- Đồng bộ ---------------------------------------------------------
+
+    def invoke(self, messages, **kwargs):
+        """Gọi không stream (tóm tắt hội thoại): chỉ fallback, không hedge."""
+        error = None
+        for attempt, backend in enumerate(self.order()):
+            if attempt:
+                self.fallbacks += 1
+            start = time.monotonic()
+            try:
+                result = backend.model.invoke(messages, **kwargs)
+            except Exception as e:
+                backend.stats.record_error()
+                error = e
+                continue
+            backend.stats.record_success(time.monotonic() - start)
+            return result
+        raise error
+
+    def stream(self, messages, **kwargs):
+        if self.hedge_after > 0 and len(self.backends) > 1:
+            yield from self._hedged_stream(messages, kwargs)
+            return
+
+        error = None
+        for attempt, backend in enumerate(self.order()):
+            if attempt:
+                self.fallbacks += 1
+            start = time.monotonic()
+            chunks = iter(backend.model.stream(messages, **kwargs))
+            try:
+                try:
+                    first = next(chunks)
+                except StopIteration:
+                    backend.stats.record_success(time.monotonic() - start)
+                    return
+                except Exception as e:
+                    backend.stats.record_error()
+                    error = e
+                    continue
+                backend.stats.record_success(time.monotonic() - start)
+                yield first
+                try:
+                    yield from chunks
+                except Exception:
+                    backend.stats.record_error()
+                    raise
+                return
+            finally:
+                chunks.close()
+        raise error
+
+    def _hedged_stream(self, messages, kwargs):
+        # Mỗi backend chạy trên một thread đẩy (racer, kind, payload) vào một
+        # hàng đợi chung; generator này chọn racer ra token đầu tiên
+        events = queue.Queue()
+        candidates = deque(self.order())
+        racers = []
+
+        def launch():
+            racer = _ThreadRacer(candidates.popleft(), messages, kwargs, events)
+            racers.append(racer)
+            racer.start()
+
+        launch()
+        hedged = []
+        winner = first = error = None
+        try:
+            while winner is None:
+                can_hedge = len(racers) == 1 and candidates
+                try:
+                    racer, kind, payload = events.get(timeout=self.hedge_after if can_hedge else None)
+                except queue.Empty:
+                    self.hedges += 1
+                    launch()
+                    hedged.append(racers[-1])
+                    continue
+                if kind == "chunk":
+                    winner, first = racer, payload
+                elif kind == "done":
+                    # Stream rỗng nhưng không lỗi: coi như đã trả lời xong
+                    racer.backend.stats.record_success(time.monotonic() - racer.started_at)
+                    return
+                else:
+                    racer.backend.stats.record_error()
+                    error = payload
+                    racers.remove(racer)
+                    if not racers:
+                        if not candidates:
+                            raise error
+                        self.fallbacks += 1
+                        launch()
+
+            winner.backend.stats.record_success(time.monotonic() - winner.started_at)
+            if winner in hedged:
+                self.hedge_wins += 1
+            for racer in racers:
+                if racer is not winner:
+                    racer.backend.stats.record_slow(time.monotonic() - racer.started_at)
+                    racer.cancel()
+
+            yield first
+            while True:
+                racer, kind, payload = events.get()
+                if racer is not winner:
+                    continue
+                if kind == "done":
+                    return
+                if kind == "error":
+                    winner.backend.stats.record_error()
+                    raise payload
+                yield payload
+        finally:
+            for racer in racers:
+                racer.cancel()
+
+    # --- Async -----------------------------------------------------------
+
+    async def astream(self, messages, **kwargs):
+        if self.hedge_after > 0 and len(self.backends) > 1:
+            async for chunk in self._hedged_astream(messages, kwargs):
+                yield chunk
+            return
+
+        error = None
+        for attempt, backend in enumerate(self.order()):
+            if attempt:
+                self.fallbacks += 1
+            start = time.monotonic()
+            chunks = backend.model.astream(messages, **kwargs)
+            try:
+                try:
+                    first = await chunks.__anext__()
+                except StopAsyncIteration:
+                    backend.stats.record_success(time.monotonic() - start)
+                    return
+                except Exception as e:
+                    backend.stats.record_error()
+                    error = e
+                    continue
+                backend.stats.record_success(time.monotonic() - start)
+                yield first
+                try:
+                    async for chunk in chunks:
+                        yield chunk
+                except Exception:
+                    backend.stats.record_error()
+                    raise
+                return
+            finally:
+                await chunks.aclose()
+        raise error
+
+    async def _hedged_astream(self, messages, kwargs):
+        candidates = deque(self.order())
+        # Mỗi phần tử: (backend, stream, task chờ chunk đầu, thời điểm gọi)
+        racers = []
+
+        def launch():
+            backend = candidates.popleft()
+            chunks = backend.model.astream(messages, **kwargs)
+            racers.append((backend, chunks, asyncio.ensure_future(chunks.__anext__()), time.monotonic()))
+
+        async def close(racer):
+            _, chunks, task, _ = racer
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+            await chunks.aclose()
+
+        launch()
+        hedged = []
+        winner = None
+        try:
+            while winner is None:
+                can_hedge = len(racers) == 1 and candidates
+                done, _ = await asyncio.wait(
+                    [task for _, _, task, _ in racers],
+                    timeout=self.hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.hedges += 1
+                    launch()
+                    hedged.append(racers[-1])
+                    continue
+                for racer in list(racers):
+                    backend, chunks, task, started_at = racer
+                    if task not in done or winner is not None:
+                        continue
+                    if task.exception() is None:
+                        winner = racer
+                    elif isinstance(task.exception(), StopAsyncIteration):
+                        backend.stats.record_success(time.monotonic() - started_at)
+                        return
+                    else:
+                        backend.stats.record_error()
+                        racers.remove(racer)
+                        await chunks.aclose()
+                        if not racers:
+                            if not candidates:
+                                raise task.exception()
+                            self.fallbacks += 1
+                            launch()
+
+            backend, chunks, task, started_at = winner
+            backend.stats.record_success(time.monotonic() - started_at)
+            if winner in hedged:
+                self.hedge_wins += 1
+            for racer in list(racers):
+                if racer is not winner:
+                    racer[0].stats.record_slow(time.monotonic() - racer[3])
+                    racers.remove(racer)
+                    await close(racer)
+
+            yield task.result()
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            except Exception:
+                backend.stats.record_error()
+                raise
+        finally:
+            for racer in racers:
+                await close(racer)
+
+
+class _ThreadRacer(threading.Thread):
+    """Đọc stream đồng bộ của một backend trên thread riêng, dừng khi bị `cancel`."""
+
+    def __init__(self, backend: Backend, messages, kwargs: dict, events: queue.Queue):
+        super().__init__(name=f"model-pool-{backend.name}", daemon=True)
+        self.backend = backend
+        self.messages = messages
+        self.kwargs = kwargs
+        self.events = events
+        self.started_at = time.monotonic()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        # Racer bị huỷ khi đang chờ token đầu vẫn giữ request tới lúc có chunk
+        # tiếp theo: với stream đồng bộ không có cách ngắt an toàn hơn
+        chunks = iter(self.backend.model.stream(self.messages, **self.kwargs))
+        try:
+            for chunk in chunks:
+                if self._cancelled.is_set():
+                    return
+                self.events.put((self, "chunk", chunk))
+            self.events.put((self, "done", None))
+        except Exception as e:
+            self.events.put((self, "error", e))
+        finally:
+            chunks.close()
+
+
+def parse_pool_spec(spec: str) -> list:
+    """
+    "google_genai:gemini-2.0-flash, fake:slow?ttft_ms=800&fail_rate=0.2" ->
+    [(provider, model, params)]. Giá trị params là số khi đọc được như số.
+    """
+    entries = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        target, _, query = item.partition("?")
+        provider, _, model = target.partition(":")
+        params = {}
+        for key, value in parse_qsl(query):
+            try:
+                params[key] = int(value)
+            except ValueError:
+                try:
+                    params[key] = float(value)
+                except ValueError:
+                    params[key] = value
+        entries.append((provider.strip(), model.strip(), params))
+    return entries
+
+
+def build_backend_model(settings, provider: str, model: str, params: dict):
+    if provider == "fake":
+        from llm.fastapi.fake_llm import build_fake_model
+        return build_fake_model(settings, **params)
+    from langchain.chat_models import init_chat_model
+    if provider == "google_genai":
+        params = {"google_api_key": settings.GOOGLE_API_KEY, **params}
+    return init_chat_model(model, model_provider=provider, **params)
+
+
+def build_model_pool(settings) -> ModelPool:
+    backends = []
+    for provider, model, params in parse_pool_spec(settings.LLM_POOL):
+        name = f"{provider}:{model}" if model else provider
+        backends.append(Backend(name, build_backend_model(settings, provider, model, params), settings.LLM_POOL_WINDOW))
+    return ModelPool(
+        backends,
+        hedge_after=settings.LLM_HEDGE_AFTER_MS / 1000,
+        error_threshold=settings.LLM_POOL_ERROR_THRESHOLD,
+        min_samples=settings.LLM_POOL_MIN_SAMPLES,
+        cooldown_seconds=settings.LLM_POOL_COOLDOWN_SECONDS,
+        explore_rate=settings.LLM_POOL_EXPLORE_RATE
+    )
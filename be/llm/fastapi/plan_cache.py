@@ -0,0 +1,325 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from decimal import Decimal
+
+import duckdb
+
+from llm.fastapi.arrow_result import limit_query
+
+# Chuỗi trong ngoặc, số (có thể kèm hậu tố k/m như "14.3k"), hoặc một từ
+_QUESTION_TOKEN_RE = re.compile(
+    r"'(?P<sq>[^']*)'|\"(?P<dq>[^\"]*)\"|“(?P<cq>[^”]*)”"
+    r"|(?P<num>\d+(?:\.\d+)?)(?P<unit>[km]?)(?!\w)"
+    r"|(?P<word>\w+)"
+)
+_SQL_NUMBER_RE = re.compile(r"(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_UNITS = {"": 1, "k": 1000, "m": 1000000}
+
+# Cụm mở đầu/kết thúc không đổi nghĩa câu hỏi ("show me the top 5 ..." = "top 5 ...")
+_LEADING_FILLERS = [
+    phrase.split() for phrase in (
+        "what are the", "what is the", "what are", "what is", "show me the", "show me", "show",
+        "list the", "list", "give me the", "give me", "find the", "find", "tell me",
+        "cho tôi biết", "cho tôi xem", "cho tôi", "hãy liệt kê", "liệt kê", "hãy", "tìm",
+    )
+]
+_TRAILING_FILLERS = {"please", "nhé", "ạ", "vậy"}
+
+NUMBER_SLOT = "{n}"
+DECIMAL_SLOT = "{d}"
+STRING_SLOT = "{s}"
+
+
+def normalize_question(question: str):
+    """
+    Chuẩn hoá câu hỏi thành (shape, values): `shape` là các từ đã chuẩn hoá
+    (NFKC, không phân biệt hoa thường, bỏ dấu câu và cụm mở đầu như "show
+    me"), với mỗi số hoặc chuỗi trong ngoặc thay bằng một slot; `values` là giá
+    trị của các slot theo thứ tự ("top 5 ..." và "top 10 ..." cùng shape).
+    """
+    words, values = [], []
+    for match in _QUESTION_TOKEN_RE.finditer(unicodedata.normalize("NFKC", question)):
+        if match.group("word") is not None:
+            words.append(match.group("word").casefold())
+        elif match.group("num") is not None:
+            value = Decimal(match.group("num")) * _UNITS[match.group("unit")]
+            if value == value.to_integral_value():
+                values.append(int(value))
+                words.append(NUMBER_SLOT)
+            else:
+                values.append(value)
+                words.append(DECIMAL_SLOT)
+        else:
+            values.append(next(group for group in match.group("sq", "dq", "cq") if group is not None))
+            words.append(STRING_SLOT)
+
+    for filler in _LEADING_FILLERS:
+        if words[:len(filler)] == filler:
+            words = words[len(filler):]
+            break
+    while words and words[-1] in _TRAILING_FILLERS:
+        words.pop()
+    return " ".join(words), values
+
+
+def sql_literals(sql: str) -> list:
+    """Các hằng số/chuỗi trong câu SQL: list (start, end, value) theo tokenizer của DuckDB."""
+    literals = []
+    for position, token_type in duckdb.tokenize(sql):
+        if token_type == duckdb.token_type.numeric_const:
+            match = _SQL_NUMBER_RE.match(sql, position)
+            if match:
+                value = Decimal(match.group(0))
+                literals.append((position, match.end(), int(value) if value == value.to_integral_value() else value))
+        elif token_type == duckdb.token_type.string_const:
+            match = _SQL_STRING_RE.match(sql, position)
+            if match:
+                literals.append((position, match.end(), match.group(0)[1:-1].replace("''", "'")))
+    return literals
+
+
+def quote_literal(value) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def parameterize_sql(sql: str, values: list):
+    """
+    Thay các hằng trong SQL đến từ câu hỏi bằng tham số $1, $2, ...; trả về
+    (sql_template, slots) với slots[k] là chỉ số trong `values` của tham số
+    $k+1. Một giá trị chỉ thành tham số khi nó khớp đúng một hằng trong SQL và
+    hằng đó không khớp giá trị nào khác (không đoán khi mơ hồ); chuỗi nằm bên
+    trong hằng lớn hơn (LIKE '%...%') được nối lại bằng ||. Các giá trị còn lại
+    giữ nguyên trong SQL và là một phần của khoá cache.
+    """
+    literals = sql_literals(sql)
+    matches = {}
+    for index, value in enumerate(values):
+        found = [
+            position for position, (_, _, literal) in enumerate(literals)
+            if type(literal) is type(value) and literal == value
+            or isinstance(value, str) and isinstance(literal, str) and value and value in literal
+        ]
+        if len(found) == 1:
+            matches.setdefault(found[0], []).append(index)
+
+    replacements = sorted(
+        (literals[position], indexes[0]) for position, indexes in matches.items() if len(indexes) == 1
+    )
+    slots, parts, cursor = [], [], 0
+    for (start, end, literal), index in replacements:
+        slots.append(index)
+        placeholder = f"${len(slots)}"
+        value = values[index]
+        if isinstance(value, str) and literal != value:
+            prefix, suffix = literal.split(value, 1)
+            placeholder = f"({quote_literal(prefix)} || {placeholder} || {quote_literal(suffix)})"
+        parts.extend([sql[cursor:start], placeholder])
+        cursor = end
+    parts.append(sql[cursor:])
+    return "".join(parts), slots
+
+
+def validate_select(cursor, sql: str) -> str:
+    """
+    Chỉ chấp nhận đúng một câu SELECT; trả về câu đó (bỏ dấu ; cuối). Dùng
+    cursor của thread: `duckdb.extract_statements` đi qua connection mặc định
+    dùng chung và bị kẹt khi nhiều thread gọi cùng lúc.
+    """
+    statements = cursor.extract_statements(sql)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError("Truy vấn phải là đúng một câu SELECT.")
+    return statements[0].query.strip().rstrip(";").strip()
+
+
+def schema_fingerprint(cursor) -> str:
+    rows = cursor.execute(
+        "SELECT table_schema, table_name, column_name, data_type FROM information_schema.columns ORDER BY ALL"
+    ).fetchall()
+    return hashlib.sha1(repr(rows).encode("utf-8")).hexdigest()[:16]
+
+
+class PlanCache:
+    """
+    Cache kế hoạch truy vấn của DataChatbot, theo dạng chuẩn hoá của câu hỏi
+    (`normalize_question`). SQL của LLM được kiểm tra (một câu SELECT, PREPARE
+    được trên schema hiện tại) và tham số hoá, nên câu hỏi cùng dạng khác số
+    liệu ("top 5 ..." / "top 10 ...") dùng lại kế hoạch mà không gọi LLM.
+
+    Mỗi kế hoạch DuckDB là một prepared statement, PREPARE một lần trên cursor
+    của từng thread (prepared statement của DuckDB gắn với connection) rồi
+    EXECUTE với giá trị của câu hỏi. Cache gắn với phiên bản schema (hash
+    information_schema, kiểm tra lại mỗi `schema_check_interval` giây): schema
+    đổi thì mọi kế hoạch bị bỏ. Kế hoạch Neo4j chỉ được cache theo đúng giá trị.
+    """
+
+    def __init__(self, conn, max_entries: int = 1000, schema_check_interval: float = 5.0):
+        self.conn = conn
+        self.max_entries = max_entries
+        self.schema_check_interval = schema_check_interval
+        # shape -> list entry; mỗi entry giữ giá trị của các slot không được tham số hoá
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_version = None
+        self._schema_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def cursor(self):
+        """Cursor riêng của thread hiện tại (DuckDB connection không dùng chung giữa các thread)."""
+        local = self._local
+        if getattr(local, "cursor", None) is None:
+            local.cursor = self.conn.cursor()
+            local.prepared = set()
+            local.schema_version = None
+        return local.cursor
+
+    def schema_version(self) -> str:
+        now = time.monotonic()
+        if self._schema_version is None or now - self._schema_checked_at >= self.schema_check_interval:
+            version = schema_fingerprint(self.cursor())
+            with self._lock:
+                if self._schema_version is not None and version != self._schema_version:
+                    print(f"Schema changed ({self._schema_version} -> {version}), dropping {len(self._entries)} cached plans")
+                    self._entries.clear()
+                    self.invalidations += 1
+                self._schema_version = version
+                self._schema_checked_at = now
+        return self._schema_version
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._schema_version = None
+            self.invalidations += 1
+
+    def lookup(self, question: str):
+        """Kế hoạch đã cache cho câu hỏi (đã gắn giá trị), hoặc None."""
+        shape, values = normalize_question(question)
+        version = self.schema_version()
+        with self._lock:
+            for entry in self._entries.get(shape, ()):
+                if entry["schema_version"] == version and all(values[i] == v for i, v in entry["fixed"].items()):
+                    self._entries.move_to_end(shape)
+                    self.hits += 1
+                    return self._bind(entry, values, cached=True)
+            self.misses += 1
+        return None
+
+    def store(self, question: str, plan: dict) -> dict:
+        """
+        Kiểm tra và cache kế hoạch LLM vừa sinh; trả về kế hoạch đã gắn giá trị
+        để thực thi. SQL không hợp lệ -> ValueError (không cache, không chạy).
+        """
+        shape, values = normalize_question(question)
+        version = self.schema_version()
+        entry = {
+            "database": plan.get("database"),
+            "query": plan.get("query"),
+            "explanation": plan.get("explanation"),
+            "schema_version": version,
+            "slots": [],
+            "fixed": dict(enumerate(values)),
+        }
+        if entry["database"] == "duckdb":
+            query = validate_select(self.cursor(), plan.get("query") or "")
+            template, slots = parameterize_sql(query, values)
+            try:
+                self._prepare(self._statement_name(version, template), template)
+            except duckdb.Error:
+                # Tham số hoá làm hỏng kiểu (vd. $1 trong biểu thức không suy ra được) -> giữ nguyên giá trị
+                template, slots = query, []
+                self._prepare(self._statement_name(version, template), template)
+            entry.update(
+                query=template,
+                slots=slots,
+                fixed={i: v for i, v in enumerate(values) if i not in slots},
+                statement=self._statement_name(version, template),
+            )
+
+        with self._lock:
+            entries = [
+                e for e in self._entries.pop(shape, []) if e["schema_version"] == version and e["fixed"] != entry["fixed"]
+            ]
+            # Kế hoạch mới nhất được thử trước
+            self._entries[shape] = [entry] + entries
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return self._bind(entry, values, cached=False)
+
+    def execute(self, plan: dict, max_rows: int = None):
+        """
+        Chạy kế hoạch DuckDB đã gắn giá trị trên cursor của thread; trả về
+        cursor để đọc kết quả. `max_rows` giới hạn số dòng ngay trong prepared
+        statement (mỗi giới hạn là một statement riêng).
+        """
+        statement, query = plan["statement"], plan["query"]
+        if max_rows is not None:
+            statement, query = f"{statement}_{int(max_rows)}", limit_query(query, max_rows)
+        cursor = self._prepare(statement, query)
+        args = ", ".join(quote_literal(value) for value in plan["args"])
+        # EXECUTE không nhận tham số bind từ Python, giá trị được đưa vào dạng hằng đã escape
+        return cursor.execute(f"EXECUTE {statement}({args})" if args else f"EXECUTE {statement}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "shapes": len(self._entries),
+                "plans": sum(len(entries) for entries in self._entries.values()),
+                "schema_version": self._schema_version,
+            }
+
+    @staticmethod
+    def _statement_name(version: str, template: str) -> str:
+        return "plan_" + hashlib.sha1(f"{version}:{template}".encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _bind(entry: dict, values: list, cached: bool) -> dict:
+        plan = {
+            "database": entry["database"],
+            "query": entry["query"],
+            "explanation": entry["explanation"],
+            "cached": cached,
+        }
+        if "statement" in entry:
+            plan["statement"] = entry["statement"]
+            plan["args"] = [values[i] for i in entry["slots"]]
+        return plan
+
+    def _prepare(self, name: str, query: str):
+        cursor = self.cursor()
+        local = self._local
+        if local.schema_version != self._schema_version:
+            # Schema đổi: bỏ các prepared statement cũ của thread này
+            for old in local.prepared:
+                try:
+                    cursor.execute(f"DEALLOCATE {old}")
+                except duckdb.Error:
+                    pass
+            local.prepared = set()
+            local.schema_version = self._schema_version
+        if name not in local.prepared:
+            cursor.execute(f"PREPARE {name} AS {query}")
+            local.prepared.add(name)
+        return cursor
+
+
+def build_plan_cache(settings, conn):
+    if not settings.PLAN_CACHE_ENABLED:
+        return None
+    return PlanCache(
+        conn,
+        max_entries=settings.PLAN_CACHE_MAX_ENTRIES,
+        schema_check_interval=settings.PLAN_CACHE_SCHEMA_CHECK_SECONDS
+    )
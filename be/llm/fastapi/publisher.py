@@ -0,0 +1,238 @@
+import inspect
+import json
+import time
+
+from .single_flight import flight_member
+
+
+class FlushPolicy:
+    """Quyết định khi nào cần đẩy các chunk đang chờ lên Redis."""
+
+    def __init__(self, interval_ms: int, max_bytes: int):
+        self.interval = interval_ms / 1000.0
+        self.max_bytes = max_bytes
+
+    def should_flush(self, pending_bytes: int, elapsed: float) -> bool:
+        return pending_bytes >= self.max_bytes or elapsed >= self.interval
+
+
+class TokenPublisher:
+    """
+    Gom các chunk token thành lô và publish qua Redis pipeline.
+
+    Chunk đầu tiên luôn được đẩy ngay để giữ time-to-first-token thấp; các chunk
+    sau được nối lại thành một sự kiện `gen_token` cho tới khi hết cửa sổ thời
+    gian hoặc vượt ngưỡng byte. Các sự kiện điều khiển (`processing`,
+    `completed`, `error`) đi chung round trip với lô token còn lại.
+
+    Nếu có `event_log`, mỗi sự kiện còn được ghi vào Redis Stream để client
+    có thể replay khi join muộn hoặc reconnect.
+
+    `publish_latency` (histogram, tuỳ chọn) ghi thời gian mỗi round trip tới Redis.
+
+    Nếu có `cancel_key`, mỗi lần flush đọc kèm khoá này trong cùng pipeline
+    (không thêm round trip); `cancelled` thành True khi tín hiệu huỷ được đặt
+    sau `cancel_since` (xem core/cancellation.py).
+
+    `codec` (core/wire.py) quyết định định dạng sự kiện trên Redis; None là
+    envelope JSON v1. Mỗi sự kiện được đánh `seq` tăng dần trong lượt sinh.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        channel_name: str,
+        policy: FlushPolicy,
+        event_log=None,
+        publish_latency=None,
+        cancel_key: str = None,
+        cancel_since: float = 0.0,
+        codec=None
+    ):
+        self.redis_client = redis_client
+        self.channel_name = channel_name
+        self.policy = policy
+        self.event_log = event_log
+        self.publish_latency = publish_latency
+        self.cancel_key = cancel_key
+        self.cancel_since = cancel_since
+        self.cancelled = False
+        self.codec = codec
+        self.seq = 0
+        self._pipeline = redis_client.pipeline(transaction=False)
+        self._pending = []
+        self._pending_bytes = 0
+        self._parts = []
+        self._last_flush = 0.0
+        self._streaming = False
+        # Kết quả của lần execute pipeline gần nhất
+        self.results = []
+
+    @property
+    def response(self) -> str:
+        return "".join(self._parts)
+
+    def _encode(self, event_type: str, data: dict) -> str:
+        self.seq += 1
+        if self.codec is None:
+            return json.dumps({
+                "type": event_type,
+                "data": data
+            })
+        return self.codec.encode(event_type, self.seq, data)
+
+    def _queue(self, event_type: str, data: dict):
+        payload = self._encode(event_type, data)
+        if self.event_log is not None:
+            return self.event_log.append(self._pipeline, self.channel_name, payload)
+        return self._pipeline.publish(self.channel_name, payload)
+
+    def _queue_pending(self):
+        if self._pending:
+            queued = self._queue("gen_token", {"data": "".join(self._pending)})
+            self._pending.clear()
+            self._pending_bytes = 0
+            return queued
+        return None
+
+    def _append_chunk(self, chunk_content: str) -> bool:
+        """Thêm chunk vào lô chờ; trả về True nếu cần flush ngay."""
+        self._parts.append(chunk_content)
+        self._pending.append(chunk_content)
+        self._pending_bytes += len(chunk_content.encode("utf-8"))
+
+        if not self._streaming:
+            self._streaming = True
+            return True
+        return self.policy.should_flush(self._pending_bytes, time.monotonic() - self._last_flush)
+
+    def _queue_cancel_check(self):
+        if self.cancel_key is not None:
+            self._pipeline.get(self.cancel_key)
+
+    def _read_cancel(self, results: list):
+        if self.cancel_key is not None:
+            value = results.pop()
+            self.cancelled = value is not None and float(value) >= self.cancel_since
+
+    def _record_results(self, results: list, start: float):
+        self._read_cancel(results)
+        self.results = results
+        self._last_flush = time.monotonic()
+        if self.publish_latency is not None:
+            self.publish_latency.observe(self._last_flush - start)
+
+    def _execute(self):
+        start = time.monotonic()
+        self._queue_cancel_check()
+        self._record_results(self._pipeline.execute(), start)
+
+    def publish(self, event_type: str, data: dict):
+        """Gửi ngay một sự kiện, kèm theo các token đang chờ (nếu có)."""
+        self._queue_pending()
+        self._queue(event_type, data)
+        self._execute()
+
+    def add(self, chunk_content: str):
+        if self._append_chunk(chunk_content):
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._queue_pending()
+            self._execute()
+
+
+async def _await_queued(queued):
+    # Script của EventLog trên client async trả về coroutine; lệnh publish của
+    # pipeline async chỉ xếp hàng (trả về chính pipeline) nên không cần await
+    if inspect.iscoroutine(queued):
+        await queued
+
+
+class AsyncTokenPublisher(TokenPublisher):
+    """Bản async của TokenPublisher, dùng với client `redis.asyncio` trên event loop."""
+
+    async def _execute(self):
+        start = time.monotonic()
+        self._queue_cancel_check()
+        self._record_results(await self._pipeline.execute(), start)
+
+    async def publish(self, event_type: str, data: dict):
+        await _await_queued(self._queue_pending())
+        await _await_queued(self._queue(event_type, data))
+        await self._execute()
+
+    async def add(self, chunk_content: str):
+        if self._append_chunk(chunk_content):
+            await self.flush()
+
+    async def flush(self):
+        if self._pending:
+            await _await_queued(self._queue_pending())
+            await self._execute()
+
+
+def _decode(channel) -> str:
+    return channel.decode("utf-8") if isinstance(channel, bytes) else channel
+
+
+class _FlightMixin:
+    """
+    Thay việc publish lên channel của mình bằng fan-out qua SingleFlight
+    (single_flight.py) tới channel của mọi conversation đang chờ cùng câu trả lời.
+
+    Tín hiệu huỷ (`cancel_key`/`cancel_since`) được script fan-out kiểm tra cho
+    từng conversation: conversation đã huỷ bị bỏ khỏi flight và nhận sự kiện
+    `cancelled` ở lần gửi sau (`dropped` giữ câu trả lời tới lúc huỷ);
+    `cancelled` chỉ thành True khi không còn conversation nào chờ.
+    """
+
+    def __init__(self, single_flight, flight_key: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.single_flight = single_flight
+        self.flight_key = flight_key
+        self.member = flight_member(self.cancel_key, self.cancel_since) if self.cancel_key is not None else ""
+        self.dropped = {}
+        self._notices = []
+        self._own_notified = False
+
+    def _queue(self, event_type: str, data: dict):
+        payload = self._encode(event_type, data)
+        chunk = data.get("data", "") if event_type == "gen_token" else ""
+        notices, self._notices = self._notices, []
+        return self.single_flight.fanout(
+            self._pipeline, self.flight_key, self.channel_name, self.member, event_type, payload, chunk,
+            notices, self._own_notified
+        )
+
+    def _queue_cancel_check(self):
+        # Khoá huỷ được đọc trong script fan-out
+        pass
+
+    def _read_cancel(self, results: list):
+        for live, _, dropped in results:
+            if not live:
+                self.cancelled = True
+            for channel in map(_decode, dropped):
+                self.dropped[channel] = self.response
+                # Khi cả flight đã huỷ, task tự gửi `cancelled` về channel của mình
+                if channel == self.channel_name:
+                    if self.cancelled:
+                        continue
+                    self._own_notified = True
+                self._notices.append((channel, self._encode("cancelled", {"response": self.response})))
+
+    @property
+    def subscribers(self) -> list:
+        """Các channel đã nhận sự kiện gần nhất (sau sự kiện kết thúc: đã nhận câu trả lời)."""
+        channels = self.results[-1][1] if self.results else []
+        return [_decode(channel) for channel in channels]
+
+
+class FlightPublisher(_FlightMixin, TokenPublisher):
+    pass
+
+
+class AsyncFlightPublisher(_FlightMixin, AsyncTokenPublisher):
+    pass
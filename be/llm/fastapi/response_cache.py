@@ -0,0 +1,171 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WORD_RE = re.compile(r"\S+\s*|\s+")
+
+
+def response_cache_counters(prefix: str = "chat_response_cache") -> tuple:
+    """
+    Tên counter của ResponseCache.register_metrics: (khớp chính xác, ngữ nghĩa,
+    miss). Worker dùng tiền tố mặc định (đẩy lên Redis), process API dùng tiền
+    tố riêng để /metrics không có hai metric trùng tên.
+    """
+    return (f"{prefix}_hits_total", f"{prefix}_semantic_hits_total", f"{prefix}_misses_total")
+
+
+def normalize_input(user_input: str) -> str:
+    """Chuẩn hoá câu hỏi: bỏ khoảng trắng thừa và không phân biệt hoa thường."""
+    return " ".join(user_input.split()).casefold()
+
+
+def cache_key(model_name: str, system_prompt: str, user_input: str) -> str:
+    raw = json.dumps([model_name, system_prompt, normalize_input(user_input)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def replay_chunks(text: str, chunk_chars: int):
+    """Cắt câu trả lời đã cache thành các chunk theo ranh giới từ, giống stream thật."""
+    buffer = []
+    size = 0
+    for match in _WORD_RE.finditer(text):
+        word = match.group(0)
+        if buffer and size + len(word) > chunk_chars:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+        buffer.append(word)
+        size += len(word)
+    if buffer:
+        yield "".join(buffer)
+
+
+class LRUBackend:
+    """Cache trong process, giới hạn số entry (LRU) và hết hạn theo TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisBackend:
+    """
+    Cache dùng chung giữa các worker/replica. Mỗi entry là một key có TTL; một
+    sorted set theo thời điểm ghi giữ kích thước cache trong `max_entries`.
+    `redis_client` cần được tạo với decode_responses=True.
+    """
+
+    def __init__(self, redis_client, max_entries: int, ttl_seconds: int, prefix: str = "resp_cache"):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._index_key = f"{prefix}:index"
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: str):
+        return self.redis_client.get(self._entry_key(key))
+
+    def set(self, key: str, value: str):
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.set(self._entry_key(key), value, ex=self.ttl_seconds)
+        pipe.zadd(self._index_key, {key: time.time()})
+        pipe.zcard(self._index_key)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        if overflow > 0:
+            evicted = [member for member, _ in self.redis_client.zpopmin(self._index_key, overflow)]
+            if evicted:
+                self.redis_client.delete(*(self._entry_key(member) for member in evicted))
+
+
+class ResponseCache:
+    """
+    Cache câu trả lời khớp chính xác theo (model, system prompt, câu hỏi đã chuẩn hoá).
+    Khi miss và có `semantic_cache`, thử tiếp câu hỏi tương đồng về ngữ nghĩa.
+    """
+
+    def __init__(self, backend, replay_chunk_chars: int = 40, semantic_cache=None):
+        self.backend = backend
+        self.replay_chunk_chars = replay_chunk_chars
+        self.semantic_cache = semantic_cache
+        # Counter do register_metrics gán; None = không đếm
+        self.exact_hits = None
+        self.semantic_hits = None
+        self.misses = None
+
+    def register_metrics(self, registry, prefix: str = "chat_response_cache"):
+        """Đếm kết quả tra cache vào `registry` (của worker thì được đẩy lên Redis)."""
+        exact_hits, semantic_hits, misses = response_cache_counters(prefix)
+        self.exact_hits = registry.counter(exact_hits, "Lookups answered by the exact-match response cache")
+        self.semantic_hits = registry.counter(semantic_hits, "Lookups answered by the semantic cache")
+        self.misses = registry.counter(misses, "Lookups answered by neither cache")
+
+    def lookup(self, model_name: str, system_prompt: str, user_input: str):
+        if self.backend is not None:
+            cached = self.backend.get(cache_key(model_name, system_prompt, user_input))
+            if cached is not None:
+                self._count(self.exact_hits)
+                return cached
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.lookup(f"{model_name}\n{system_prompt}", user_input)
+            if cached is not None:
+                self._count(self.semantic_hits)
+                return cached
+        self._count(self.misses)
+        return None
+
+    @staticmethod
+    def _count(counter):
+        if counter is not None:
+            counter.inc()
+
+    def store(self, model_name: str, system_prompt: str, user_input: str, response: str):
+        if not response:
+            return
+        if self.backend is not None:
+            self.backend.set(cache_key(model_name, system_prompt, user_input), response)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(f"{model_name}\n{system_prompt}", user_input, response)
+
+    def replay(self, response: str):
+        return replay_chunks(response, self.replay_chunk_chars)
+
+
+def build_response_cache(settings, redis_client=None, semantic_cache=None):
+    """Tạo cache theo RESPONSE_CACHE_BACKEND ("none" | "memory" | "redis")."""
+    backend_name = settings.RESPONSE_CACHE_BACKEND
+    if backend_name == "memory":
+        backend = LRUBackend(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS)
+    elif backend_name == "redis" and redis_client is not None:
+        backend = RedisBackend(redis_client, settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS)
+    elif semantic_cache is not None:
+        backend = None
+    else:
+        return None
+    return ResponseCache(backend, settings.RESPONSE_CACHE_REPLAY_CHUNK_CHARS, semantic_cache)
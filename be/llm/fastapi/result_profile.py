@@ -0,0 +1,223 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from llm.fastapi.memory import estimate_tokens
+
+_QUANTILE_NAMES = {0.05: "p5", 0.25: "p25", 0.5: "median", 0.75: "p75", 0.95: "p95"}
+
+
+def _is_numeric(data_type) -> bool:
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type) or pa.types.is_decimal(data_type)
+
+
+def _is_categorical(data_type) -> bool:
+    return (
+        pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+        or pa.types.is_boolean(data_type) or pa.types.is_dictionary(data_type)
+    )
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def _text(value, max_chars: int) -> str:
+    text = "" if value is None else str(value).replace("\n", " ").replace("|", "/")
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+def _rows_at(table, positions) -> list:
+    """Các dòng ở `positions` dạng dict; slice không sao chép dữ liệu, table.take trên hàng nghìn batch thì chậm."""
+    return pa.concat_tables([table.slice(int(position), 1) for position in positions]).to_pylist()
+
+
+def _block_sample(table, rows: int, block_rows: int = 1024):
+    """Mẫu hệ thống: các khối `block_rows` dòng liên tiếp rải đều trên bảng, tổng cộng ~`rows` dòng."""
+    starts = np.linspace(0, table.num_rows - block_rows, max(1, rows // block_rows)).astype(int)
+    return pa.concat_tables([table.slice(int(start), block_rows) for start in starts])
+
+
+class ResultProfiler:
+    """
+    Tóm tắt thống kê kết quả truy vấn (ArrowResult hoặc pyarrow.Table) cho
+    prompt tóm tắt của DataChatbot, thay cho việc gửi nguyên các dòng đầu.
+
+    Mỗi cột: số giá trị, null, min/max (tính vector hoá trên toàn bộ kết quả);
+    cột số thêm mean và các phân vị, cột chuỗi/bool thêm số giá trị khác nhau và
+    top-k giá trị. Với kết quả hơn `sample_limit` dòng, phân vị và top-k tính
+    trên mẫu ~`sample_limit` dòng gồm các khối liên tiếp rải đều (đánh dấu "~",
+    không sao chép dữ liệu). Kèm tối đa
+    `sample_rows` dòng mẫu phân tầng: mỗi giá trị của một cột phân loại ít giá
+    trị một dòng, các dòng đầu, phần còn lại rải đều tới dòng cuối.
+
+    `render` co dần dòng mẫu, top-k, độ dài chuỗi, phân vị rồi tới số cột cho
+    tới khi vừa `token_budget` token.
+    """
+
+    def __init__(
+        self,
+        top_k: int = 5,
+        sample_rows: int = 12,
+        token_budget: int = 600,
+        sample_limit: int = 200000,
+        quantiles: tuple = (0.25, 0.5, 0.75)
+    ):
+        self.top_k = top_k
+        self.sample_rows = sample_rows
+        self.token_budget = token_budget
+        self.sample_limit = sample_limit
+        self.quantiles = tuple(quantiles)
+
+    def profile(self, result) -> dict:
+        table = result.table if hasattr(result, "batches") else result
+        rows = table.num_rows
+        sampled = None
+        if rows > self.sample_limit:
+            sampled = _block_sample(table, self.sample_limit)
+        columns = [
+            self._profile_column(name, table.column(name), None if sampled is None else sampled.column(name))
+            for name in table.column_names
+        ]
+        return {
+            "rows": rows,
+            "truncated": bool(getattr(result, "truncated", False)),
+            "approximate": sampled is not None,
+            "columns": columns,
+            "sample": self._stratified_sample(table, columns),
+        }
+
+    def _profile_column(self, name: str, column, sampled) -> dict:
+        data_type = column.type
+        stats = {"name": name, "type": str(data_type), "count": len(column) - column.null_count, "nulls": column.null_count}
+        if not stats["count"] or pa.types.is_nested(data_type):
+            return stats
+        subset = column if sampled is None else sampled
+        if _is_numeric(data_type):
+            if pa.types.is_decimal(data_type):
+                column, subset = column.cast(pa.float64()), subset.cast(pa.float64())
+            extremes = pc.min_max(column).as_py()
+            stats.update(min=extremes["min"], max=extremes["max"], mean=pc.mean(column).as_py())
+            if self.quantiles and subset.null_count < len(subset):
+                values = pc.quantile(subset, q=list(self.quantiles), interpolation="nearest").to_pylist()
+                stats["quantiles"] = dict(zip(self.quantiles, values))
+        elif _is_categorical(data_type):
+            counts = pc.value_counts(subset.drop_null())
+            order = pc.array_sort_indices(counts.field("counts"), order="descending")[:self.top_k]
+            top = counts.take(order)
+            stats["distinct"] = len(counts)
+            stats["top"] = list(zip(top.field("values").to_pylist(), top.field("counts").to_pylist()))
+            stats["top_total"] = len(subset) - subset.null_count
+        elif pa.types.is_temporal(data_type):
+            extremes = pc.min_max(column).as_py()
+            stats.update(min=extremes["min"], max=extremes["max"])
+        return stats
+
+    def _stratified_sample(self, table, columns: list) -> dict:
+        rows = table.num_rows
+        if rows <= self.sample_rows:
+            return {"strata": None, "positions": list(range(rows)), "rows": table.to_pylist()}
+
+        positions, strata = set(), None
+        # Cột phân loại có ít giá trị nhất (2..sample_rows/2): mỗi giá trị lấy dòng đầu tiên của nó
+        candidates = [c for c in columns if 2 <= c.get("distinct", 0) <= self.sample_rows // 2 and len(c["top"]) == c["distinct"]]
+        if candidates:
+            strata = min(candidates, key=lambda c: c["distinct"])["name"]
+            encoded = pc.dictionary_encode(table.column(strata)).combine_chunks()
+            indices = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+            _, first = np.unique(indices, return_index=True)
+            positions.update(int(i) for i in first)
+        # Kết quả thường đã sắp xếp (top-N): 1/3 mẫu là các dòng đầu, phần còn
+        # lại rải đều theo vị trí tới dòng cuối
+        head = range(self.sample_rows // 3)
+        spread = np.linspace(0, rows - 1, self.sample_rows).round().astype(int)
+        for position in [*head, *spread[::-1]]:
+            if len(positions) >= self.sample_rows:
+                break
+            positions.add(int(position))
+        positions = sorted(positions)
+        return {"strata": strata, "positions": positions, "rows": _rows_at(table, positions)}
+
+    def _render(self, profile: dict, sample_rows: int, top_k: int, max_chars: int, quantiles: bool, max_columns: int) -> str:
+        approx = "~" if profile["approximate"] else ""
+        rows = profile["rows"]
+        lines = [f"Rows: {rows}" + (f" (first {rows} rows of a larger result)" if profile["truncated"] else "")]
+        columns = profile["columns"]
+        lines.append("Columns:")
+        for column in columns[:max_columns]:
+            parts = []
+            if "min" in column:
+                parts.append(f"min {_text(_number(column['min']), max_chars)}")
+            if quantiles and column.get("quantiles"):
+                parts += [f"{approx}{_QUANTILE_NAMES.get(q, f'q{q:g}')} {_number(v)}" for q, v in column["quantiles"].items()]
+            if "max" in column:
+                parts.append(f"max {_text(_number(column['max']), max_chars)}")
+            if column.get("mean") is not None:
+                parts.append(f"mean {_number(column['mean'])}")
+            if "distinct" in column:
+                distinct = f"≥{column['distinct']}" if profile["approximate"] else str(column["distinct"])
+                parts.append(f"{distinct} distinct")
+                # Mọi giá trị chỉ xuất hiện một lần (vd. tên sản phẩm): top-k không có thông tin
+                if top_k and column["top"] and column["top"][0][1] > 1:
+                    if profile["approximate"]:
+                        top = [f'"{_text(v, max_chars)}" ~{100 * c / column["top_total"]:.2g}%' for v, c in column["top"][:top_k]]
+                    else:
+                        top = [f'"{_text(v, max_chars)}" ×{c}' for v, c in column["top"][:top_k]]
+                    parts.append("top " + ", ".join(top))
+            if not parts:
+                parts.append(f"{column['count']} values")
+            if column["nulls"]:
+                parts.append(f"{column['nulls']} null")
+            lines.append(f"- {column['name']} ({column['type']}): " + ", ".join(parts))
+        if len(columns) > max_columns:
+            lines.append(f"- ... {len(columns) - max_columns} more columns: " + ", ".join(c["name"] for c in columns[max_columns:]))
+
+        sample = profile["sample"]
+        if sample_rows and sample["rows"]:
+            picked = sample["rows"]
+            if len(picked) > sample_rows:
+                picked = [picked[int(i)] for i in np.linspace(0, len(picked) - 1, sample_rows).round()]
+            how = "all rows" if len(picked) == rows else f"{len(picked)} of {rows}: first rows, then spread over the result"
+            if sample["strata"] and len(picked) < rows:
+                how += f", one per {sample['strata']}"
+            names = [c["name"] for c in columns[:max_columns]]
+            lines.append(f"Sample rows ({how}):")
+            lines.append(" | ".join(names))
+            lines += [" | ".join(_text(row[name], max_chars) for name in names) for row in picked]
+        return "\n".join(lines)
+
+    def render(self, profile: dict, token_budget: int = None) -> str:
+        """Văn bản gọn cho prompt, không quá `token_budget` token (ước lượng ~4 ký tự/token)."""
+        budget = token_budget or self.token_budget
+        columns = len(profile["columns"])
+        levels = [
+            (self.sample_rows, self.top_k, 60, True),
+            (self.sample_rows // 2, self.top_k, 40, True),
+            (self.sample_rows // 4, min(self.top_k, 3), 30, True),
+            (2, 1, 20, False),
+            (0, 1, 20, False),
+        ]
+        for sample_rows, top_k, max_chars, quantiles in levels:
+            text = self._render(profile, sample_rows, top_k, max_chars, quantiles, columns)
+            if estimate_tokens(text) <= budget:
+                return text
+        # Quá nhiều cột: chỉ liệt kê tên các cột cuối
+        for max_columns in range(columns - 1, 0, -1):
+            text = self._render(profile, 0, 1, 20, False, max_columns)
+            if estimate_tokens(text) <= budget:
+                return text
+        return text[:(budget - 1) * 4]
+
+    def summarize(self, result, token_budget: int = None) -> str:
+        return self.render(self.profile(result), token_budget)
+
+
+def build_result_profiler(settings):
+    return ResultProfiler(
+        top_k=settings.DATA_PROFILE_TOP_K,
+        sample_rows=settings.DATA_SUMMARY_ROWS,
+        token_budget=settings.DATA_SUMMARY_TOKEN_BUDGET,
+        sample_limit=settings.DATA_PROFILE_SAMPLE_LIMIT
+    )
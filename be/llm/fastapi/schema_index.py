@@ -0,0 +1,254 @@
+import json
+import math
+import re
+from collections import defaultdict
+
+import numpy as np
+
+from llm.fastapi.memory import estimate_tokens
+from llm.fastapi.plan_cache import schema_fingerprint
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Từ chức năng không giúp chọn bảng
+_STOPWORDS = set("""
+a an the and or of in on at to for with by from per each is are was be do does did have has
+what which who whom how many much there their this that these those me show list give find tell
+và của có các những nào là trong cho với theo được bao nhiêu không hãy tôi xem
+""".split())
+
+_PROMPT_HEADER = """You are an expert data analyst writing {languages} for Shopee e-commerce data.
+Use ONLY the tables, columns and relationships listed below.
+"""
+
+_PROMPT_FOOTER = """
+Respond with ONLY a single JSON object, no other text:
+{{"database": {databases}, "query": "<one executable query>", "explanation": "<one sentence>"}}
+"""
+
+
+def keywords(text: str) -> list:
+    """
+    Từ khoá để tra: chữ thường, tách cả tên định danh theo "_", bỏ số nhiều
+    tiếng Anh đơn giản ("categories" -> "category", "products" -> "product").
+    """
+    tokens = []
+    for word in _WORD_RE.findall(text.casefold()):
+        if word in _STOPWORDS:
+            continue
+        parts = [word] + (word.split("_") if "_" in word else [])
+        for part in parts:
+            if len(part) > 4 and part.endswith("ies"):
+                part = part[:-3] + "y"
+            elif len(part) > 3 and part.endswith("s") and not part.endswith("ss"):
+                part = part[:-1]
+            if part:
+                tokens.append(part)
+    return tokens
+
+
+def _referenced_table(column: str, tables: set):
+    """Bảng mà cột `<tên>_id` trỏ tới: "shop_id" -> shops, "category_id" -> categories."""
+    if not column.endswith("_id"):
+        return None
+    stem = column[:-3]
+    for candidate in (stem, stem + "s", stem[:-1] + "ies" if stem.endswith("y") else None):
+        if candidate in tables:
+            return candidate
+    return None
+
+
+class SchemaIndex:
+    """
+    Chỉ mục schema cho prompt sinh truy vấn của DataChatbot: mỗi bảng DuckDB,
+    mỗi phần schema Neo4j và mỗi ví dụ (câu hỏi -> kế hoạch) là một tài liệu,
+    gồm mô tả, posting list từ khoá (trọng số idf) và embedding.
+
+    Với mỗi câu hỏi, điểm của tài liệu = tổng idf của từ khoá trùng (trùng tên
+    bảng được nhân NAME_WEIGHT) + cosine embedding; prompt chỉ gồm tối đa
+    `top_tables` tài liệu schema điểm cao nhất cùng phủ các từ khoá của câu
+    hỏi (thêm các bảng nối giữa chúng) và tối đa `example_count` ví dụ gần
+    nhất (không dưới `min_ratio` lần điểm ví dụ tốt nhất), nên kích thước
+    prompt không tăng theo số bảng của DB.
+    """
+
+    NAME_WEIGHT = 3.0
+
+    def __init__(
+        self,
+        docs: list,
+        examples: list,
+        embedder,
+        top_tables: int = 4,
+        example_count: int = 2,
+        min_ratio: float = 0.35,
+        version: str = None
+    ):
+        self.docs = docs
+        self.examples = examples
+        self.embedder = embedder
+        self.top_tables = top_tables
+        self.example_count = example_count
+        self.min_ratio = min_ratio
+        self.version = version
+        self.by_name = {doc["name"]: doc for doc in docs}
+        self.source = {}
+
+        # Từ khoá trùng tên bảng nặng gấp NAME_WEIGHT lần từ khoá trong cột/mô tả
+        self._doc_keywords, self._name_keywords = [], []
+        self._postings = defaultdict(dict)
+        for index, doc in enumerate(docs):
+            name_keywords = set(keywords(doc["name"]))
+            doc_keywords = set(keywords(doc["text"])) | name_keywords
+            self._doc_keywords.append(doc_keywords)
+            self._name_keywords.append(name_keywords)
+            for token in doc_keywords:
+                self._postings[token][index] = self.NAME_WEIGHT if token in name_keywords else 1.0
+        self._idf = {token: math.log(1 + len(docs) / len(postings)) for token, postings in self._postings.items()}
+        self._doc_vectors = self._embed_all([doc["text"] for doc in docs])
+        self._example_vectors = self._embed_all([example["question"] for example in examples])
+
+    def _embed_all(self, texts: list):
+        if self.embedder is None or not texts:
+            return None
+        return np.stack([self.embedder.embed(text) for text in texts])
+
+    @classmethod
+    def from_duckdb(cls, cursor, descriptions: dict = None, graph_docs: list = None, examples: list = None, embedder=None, **kwargs):
+        """
+        Tạo tài liệu cho mỗi bảng từ information_schema của DuckDB, kèm mô tả
+        trong `descriptions` ({"bảng": "...", "bảng.cột": "..."}); quan hệ khoá
+        ngoại suy ra từ các cột `<tên>_id`.
+        """
+        descriptions = descriptions or {}
+        columns = defaultdict(list)
+        for table, column, data_type in cursor.execute(
+            "SELECT table_name, column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = 'main' ORDER BY table_name, ordinal_position"
+        ).fetchall():
+            columns[table].append((column, data_type))
+
+        names = set(columns)
+        docs = []
+        for table, table_columns in columns.items():
+            references = {}
+            for column, _ in table_columns:
+                target = _referenced_table(column, names)
+                if target and target != table:
+                    references[column] = target
+            notes = [descriptions[table]] if table in descriptions else []
+            notes += [f"`{column}`: {descriptions[f'{table}.{column}']}" for column, _ in table_columns if f"{table}.{column}" in descriptions]
+            notes += [f"`{column}` -> `{target}.id`" for column, target in references.items()]
+            line = f"- `{table}({', '.join(column for column, _ in table_columns)})`"
+            if notes:
+                line += " -- " + "; ".join(notes)
+            docs.append({
+                "name": table,
+                "database": "duckdb",
+                "line": line,
+                "text": " ".join([table, *(column for column, _ in table_columns), *notes]),
+                "references": sorted(set(references.values())),
+                # Bảng nối: chỉ gồm id và khoá ngoại (vd. product_categories)
+                "bridge": len(references) >= 2 and all(column == "id" or column in references for column, _ in table_columns),
+            })
+        for doc in graph_docs or []:
+            docs.append({"database": "neo4j", "references": [], "bridge": False, **doc})
+        index = cls(docs, examples or [], embedder, version=schema_fingerprint(cursor), **kwargs)
+        index.source = {"descriptions": descriptions, "graph_docs": graph_docs}
+        return index
+
+    def refreshed(self, cursor):
+        """Chỉ mục dựng lại từ schema hiện tại, cùng mô tả, ví dụ và cấu hình."""
+        return SchemaIndex.from_duckdb(
+            cursor,
+            examples=self.examples,
+            embedder=self.embedder,
+            top_tables=self.top_tables,
+            example_count=self.example_count,
+            min_ratio=self.min_ratio,
+            **self.source
+        )
+
+    def _doc_scores(self, question: str) -> np.ndarray:
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for token in set(keywords(question)):
+            for index, weight in self._postings.get(token, {}).items():
+                scores[index] += self._idf[token] * weight
+        if self._doc_vectors is not None:
+            scores += self._doc_vectors @ self.embedder.embed(question)
+        return scores
+
+    def retrieve(self, question: str):
+        """(tài liệu schema, ví dụ) liên quan tới câu hỏi."""
+        scores = self._doc_scores(question)
+        ranked = [int(i) for i in np.argsort(-scores, kind="stable")]
+        # Chọn tham lam theo điểm: tài liệu chỉ được lấy nếu nó có thêm từ khoá
+        # của câu hỏi mà các tài liệu đã chọn chưa có, hoặc tên của nó khớp một
+        # từ khoá chưa khớp tên bảng nào ("shops" vẫn được chọn dù "products"
+        # điểm cao hơn nhiều và có cột shop_id)
+        question_keywords = set(keywords(question))
+        selected, covered, named = [], set(), set()
+        for i in ranked:
+            if selected and (len(selected) >= self.top_tables or scores[i] <= 0):
+                break
+            new_keywords = (question_keywords & self._doc_keywords[i]) - covered
+            new_names = (question_keywords & self._name_keywords[i]) - named
+            if not selected or new_keywords or new_names:
+                selected.append(self.docs[i])
+                covered |= question_keywords & self._doc_keywords[i]
+                named |= question_keywords & self._name_keywords[i]
+
+        names = {doc["name"] for doc in selected}
+        for doc in list(selected):
+            # Bảng nối cần cả các bảng nó trỏ tới
+            if doc["bridge"]:
+                selected += [self.by_name[name] for name in doc["references"] if name not in names]
+                names.update(doc["references"])
+        for doc in self.docs:
+            # Hai bảng đã chọn cùng được nối qua một bảng nối -> thêm bảng nối
+            if doc["bridge"] and doc["name"] not in names and sum(name in names for name in doc["references"]) >= 2:
+                selected.append(doc)
+                names.add(doc["name"])
+
+        examples = []
+        if self.examples and self.example_count:
+            example_scores = np.zeros(len(self.examples), dtype=np.float32)
+            for index, example in enumerate(self.examples):
+                example_scores[index] = len(question_keywords & set(keywords(example["question"])))
+            if self._example_vectors is not None:
+                example_scores += self._example_vectors @ self.embedder.embed(question)
+            ranked = np.argsort(-example_scores, kind="stable")[:self.example_count]
+            cutoff = example_scores[ranked[0]] * self.min_ratio
+            examples = [self.examples[int(i)] for i in ranked if example_scores[i] >= cutoff]
+        return selected, examples
+
+    def render(self, docs: list, examples: list, question: str) -> str:
+        databases = sorted({doc["database"] for doc in docs})
+        parts = [_PROMPT_HEADER.format(languages=" or ".join("SQL (DuckDB)" if db == "duckdb" else "Cypher (Neo4j)" for db in databases))]
+        if "duckdb" in databases:
+            parts.append("**DuckDB tables:**")
+            parts += [doc["line"] for doc in docs if doc["database"] == "duckdb"]
+        if "neo4j" in databases:
+            parts.append("**Neo4j graph:**")
+            parts += [doc["line"] for doc in docs if doc["database"] == "neo4j"]
+        parts.append(_PROMPT_FOOTER.format(databases=" | ".join(f'"{db}"' for db in databases)))
+        for example in examples:
+            parts.append(f"User Question: {example['question']}\n{json.dumps(example['plan'], ensure_ascii=False)}\n")
+        parts.append("User Question: " + question)
+        return "\n".join(parts)
+
+    def prompt(self, question: str) -> str:
+        """Prompt tối giản: chỉ schema và ví dụ liên quan tới câu hỏi."""
+        return self.render(*self.retrieve(question), question)
+
+    def full_prompt(self, question: str) -> str:
+        """Prompt với toàn bộ schema và ví dụ (để so sánh)."""
+        return self.render(self.docs, self.examples, question)
+
+    def stats(self, question: str) -> dict:
+        docs, examples = self.retrieve(question)
+        return {
+            "tables": [doc["name"] for doc in docs],
+            "examples": len(examples),
+            "prompt_tokens": estimate_tokens(self.render(docs, examples, question)),
+            "full_prompt_tokens": estimate_tokens(self.full_prompt(question)),
+        }
@@ -0,0 +1,279 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khoá file, chỉ còn rename nguyên tử
+    fcntl = None
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def scope_id(scope: str) -> int:
+    """ID ổn định (không phụ thuộc PYTHONHASHSEED) để lưu được xuống file."""
+    return zlib.crc32(scope.encode("utf-8"))
+
+
+class HashingEmbedder:
+    """
+    Embedder cục bộ, tất định: băm từ và trigram ký tự vào `dim` chiều (có dấu)
+    rồi chuẩn hoá L2. Không cần mạng nên dùng được cho test và benchmark.
+    """
+
+    def __init__(self, dim: int = 128):
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = _TOKEN_RE.findall(text.casefold())
+        for word in words:
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+        for left, right in zip(words, words[1:]):
+            yield f"{left} {right}", 0.5
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class LangChainEmbedder:
+    """Bọc một `langchain` Embeddings bất kỳ (vd. GoogleGenerativeAIEmbeddings)."""
+
+    def __init__(self, embeddings, dim: int):
+        self.embeddings = embeddings
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Cache câu trả lời theo độ tương đồng ngữ nghĩa của câu hỏi.
+
+    Các vector (đã chuẩn hoá L2) nằm trong một ma trận float32 liên tục được cấp
+    phát sẵn `capacity` dòng, nên tìm kiếm là một phép nhân ma trận-vector (cosine)
+    cộng argmax. Khi đầy, entry lâu không được dùng nhất bị ghi đè (LRU).
+    Mỗi entry gắn với một `scope` (model + system prompt) để không trả lời chéo.
+    """
+
+    _LATENCY_WINDOW = 1024
+
+    def __init__(self, embedder, capacity: int, threshold: float):
+        self.embedder = embedder
+        self.capacity = capacity
+        self.threshold = threshold
+        self._vectors = np.zeros((capacity, embedder.dim), dtype=np.float32)
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._questions = [None] * capacity
+        self._answers = [None] * capacity
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self._latencies = np.zeros(self._LATENCY_WINDOW, dtype=np.float64)
+        self._lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+
+    def __len__(self):
+        return self._size
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def lookup(self, scope: str, user_input: str):
+        """Trả về câu trả lời của câu hỏi gần nhất nếu cosine >= threshold, ngược lại None."""
+        vector = self.embedder.embed(user_input)
+        with self._lock:
+            start = time.perf_counter()
+            answer = None
+            if self._size:
+                sims = self._vectors[:self._size] @ vector
+                sims[self._scopes[:self._size] != scope_id(scope)] = -1.0
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._last_used[best] = self._tick()
+                    answer = self._answers[best]
+            self._latencies[self._lookups % self._LATENCY_WINDOW] = time.perf_counter() - start
+            self._lookups += 1
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return answer
+
+    def add(self, scope: str, user_input: str, answer: str):
+        vector = self.embedder.embed(user_input)
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope_id(scope)
+            self._last_used[slot] = self._tick()
+            self._questions[slot] = user_input
+            self._answers[slot] = answer
+            self.dirty = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            window = self._latencies[:min(self._lookups, self._LATENCY_WINDOW)] * 1000
+            p50, p99 = np.percentile(window, [50, 99]) if window.size else (0.0, 0.0)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": self._size,
+                "lookup_ms_p50": float(p50),
+                "lookup_ms_p99": float(p99),
+            }
+
+    def _read(self, path: str):
+        """
+        (vectors, scopes, last_used, questions, answers) trong file, sắp theo
+        thời điểm dùng tăng dần; None nếu số chiều không khớp với embedder.
+        """
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            if vectors.ndim != 2 or vectors.shape[1] != self.embedder.dim:
+                return None
+            questions, answers = json.loads(data["texts"].tobytes().decode("utf-8"))
+            order = np.argsort(data["last_used"], kind="stable")
+            return (
+                vectors[order],
+                data["scopes"][order],
+                data["last_used"][order],
+                [questions[i] for i in order],
+                [answers[i] for i in order],
+            )
+
+    def save(self, path: str):
+        """
+        Ghi cache ra file .npz (không dùng pickle), gộp với các entry đã có trong
+        file: mỗi process worker giữ một bản riêng nên ghi đè sẽ làm mất entry
+        của process khác. Khoá file `<path>.lock` giữ đọc-gộp-ghi tuần tự giữa
+        các process; file tạm riêng từng process rồi rename.
+        """
+        with open(f"{path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            on_disk = None
+            if os.path.exists(path):
+                try:
+                    on_disk = self._read(path)
+                except (OSError, ValueError, KeyError):
+                    # File hỏng: ghi đè bằng bản trong bộ nhớ
+                    on_disk = None
+            with self._lock:
+                n = self._size
+                order = np.argsort(self._last_used[:n], kind="stable")
+                vectors = self._vectors[:n][order]
+                scopes = self._scopes[:n][order]
+                questions = [self._questions[i] for i in order]
+                answers = [self._answers[i] for i in order]
+            if on_disk is not None:
+                # Entry của process này mới hơn; entry chỉ có trong file xếp
+                # trước, bỏ các câu hỏi trùng (cùng scope)
+                known = set(zip(scopes.tolist(), questions))
+                disk_vectors, disk_scopes, _, disk_questions, disk_answers = on_disk
+                extra = [
+                    i for i, key in enumerate(zip(disk_scopes.tolist(), disk_questions))
+                    if key not in known
+                ]
+                vectors = np.concatenate([disk_vectors[extra], vectors])
+                scopes = np.concatenate([disk_scopes[extra], scopes])
+                questions = [disk_questions[i] for i in extra] + questions
+                answers = [disk_answers[i] for i in extra] + answers
+            # Chỉ giữ `capacity` entry mới nhất, giống khi load
+            keep = slice(max(len(questions) - self.capacity, 0), None)
+            vectors, scopes = vectors[keep], scopes[keep]
+            questions, answers = questions[keep], answers[keep]
+            texts = json.dumps([questions, answers], ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(
+                        f,
+                        vectors=vectors,
+                        scopes=scopes,
+                        last_used=np.arange(1, len(questions) + 1, dtype=np.int64),
+                        texts=np.frombuffer(texts.encode("utf-8"), dtype=np.uint8),
+                    )
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self.dirty = False
+
+    def load(self, path: str) -> bool:
+        """Nạp lại cache đã lưu; False (bỏ qua file) nếu số chiều không khớp với embedder."""
+        entries = self._read(path)
+        if entries is None:
+            return False
+        vectors, scopes, _, questions, answers = entries
+        # Giữ lại các entry mới dùng gần nhất nếu file lớn hơn capacity
+        keep = slice(max(len(questions) - self.capacity, 0), None)
+        questions, answers = questions[keep], answers[keep]
+        n = len(questions)
+        with self._lock:
+            self._vectors[:n] = vectors[keep]
+            self._scopes[:n] = scopes[keep]
+            self._last_used[:n] = np.arange(1, n + 1)
+            self._questions[:n] = questions
+            self._answers[:n] = answers
+            self._size = n
+            self._clock = n
+        return True
+
+
+def build_embedder(settings, name: str = None, dim: int = None):
+    """Embedder theo tên ("hashing" | "google"), mặc định theo SEMANTIC_CACHE_*."""
+    name = name or settings.SEMANTIC_CACHE_EMBEDDER
+    if name == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        embeddings = GoogleGenerativeAIEmbeddings(
+            model="models/text-embedding-004",
+            google_api_key=settings.GOOGLE_API_KEY
+        )
+        return LangChainEmbedder(embeddings, dim=768)
+    return HashingEmbedder(dim or settings.SEMANTIC_CACHE_DIM)
+
+
+def build_semantic_cache(settings, log):
+    """
+    Tạo semantic cache nếu SEMANTIC_CACHE_ENABLED, nạp lại từ SEMANTIC_CACHE_PATH
+    nếu có. `log` là SampledLog của process.
+    """
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+    cache = SemanticCache(
+        build_embedder(settings),
+        capacity=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+        threshold=settings.SEMANTIC_CACHE_THRESHOLD
+    )
+    path = settings.SEMANTIC_CACHE_PATH
+    if path and os.path.exists(path):
+        if cache.load(path):
+            log("semantic_cache_loaded", force=True, path=path, entries=len(cache))
+        else:
+            log("semantic_cache_dim_mismatch", force=True, path=path, expected_dim=cache.embedder.dim)
+    return cache
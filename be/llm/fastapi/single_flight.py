@@ -0,0 +1,202 @@
+# Ghi một envelope (hoặc frame v2, xem core/wire.py) lên channel; khi có MAXLEN
+# (EVENT_BACKEND="streams") thì ghi thêm vào stream `log:{channel}` và gắn ID
+# của stream, giống EventLog
+_EMIT = """
+local maxlen = tonumber(ARGV[#ARGV - 1])
+local stream_ttl = ARGV[#ARGV]
+local function emit(channel, payload)
+  if maxlen > 0 then
+    local log_key = 'log:' .. channel
+    local id = redis.call('XADD', log_key, 'MAXLEN', '~', maxlen, '*', 'event', payload)
+    redis.call('EXPIRE', log_key, stream_ttl)
+    if string.sub(payload, 1, 2) == '2|' then
+      redis.call('PUBLISH', channel, '2|' .. id .. string.sub(payload, 3))
+    else
+      redis.call('PUBLISH', channel, '{"id":"' .. id .. '",' .. string.sub(payload, 2))
+    end
+  else
+    redis.call('PUBLISH', channel, payload)
+  end
+end
+"""
+
+# Thành viên của flight: hash channel -> "since|cancel_key". Conversation bị
+# huỷ khi khoá huỷ của nó chứa timestamp >= since (xem core/cancellation.py)
+_CANCELLED = """
+local function cancelled(member)
+  local since, key = string.match(member, '^([^|]*)|(.+)$')
+  if not key then
+    return false
+  end
+  local at = redis.call('GET', key)
+  return at and tonumber(at) >= tonumber(since)
+end
+"""
+
+# KEYS: flight, subscribers, text | ARGV: channel, ttl, wire_version, member, maxlen, stream_ttl
+# Trả về 1 nếu người gọi là leader. Follower được thêm vào danh sách nhận và
+# nhận ngay phần câu trả lời đã sinh, trong cùng một lệnh nguyên tử nên không
+# hụt hay lặp chunk nào so với các sự kiện leader gửi sau đó.
+_JOIN_SCRIPT = _EMIT + """
+local compact = ARGV[3] == '2'
+if compact then
+  emit(ARGV[1], '2||0|p|{}')
+else
+  emit(ARGV[1], '{"type":"processing","data":{}}')
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+  redis.call('DEL', KEYS[2], KEYS[3])
+  redis.call('HSET', KEYS[2], ARGV[1], ARGV[4])
+  redis.call('EXPIRE', KEYS[2], ARGV[2])
+  return 1
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[4])
+local text = redis.call('GET', KEYS[3])
+if text and #text > 0 then
+  if compact then
+    emit(ARGV[1], '2||0|t|' .. text)
+  else
+    emit(ARGV[1], cjson.encode({type = 'gen_token', data = {data = text}}))
+  end
+end
+return 0
+"""
+
+# KEYS: flight, subscribers, text
+# ARGV: payload, chunk, final, ttl, channel, member, skip_own, [notice_channel, notice_payload]..., maxlen, stream_ttl
+# Gửi trước các thông báo huỷ leader đã chuẩn bị (notice), rồi gửi sự kiện tới
+# mọi conversation đang chờ câu trả lời và gia hạn flight (lượt sinh dài hơn
+# `ttl` không làm mất danh sách nhận). Sau đó conversation đã huỷ bị bỏ khỏi
+# danh sách (đã nhận đủ mọi sự kiện tới đây); khi không còn ai, flight bị xoá.
+# Nếu flight đã hết hạn hoặc thuộc leader khác (leader treo quá `ttl`), chỉ gửi
+# về channel của leader (trừ khi skip_own: channel đó đã nhận sự kiện huỷ) và
+# không đụng tới flight mới. Trả về {còn người nhận (0/1), channel đã nhận,
+# channel vừa huỷ}; với sự kiện kết thúc, flight bị xoá.
+_FANOUT_SCRIPT = _EMIT + _CANCELLED + """
+for i = 8, #ARGV - 3, 2 do
+  emit(ARGV[i], ARGV[i + 1])
+end
+if redis.call('GET', KEYS[1]) ~= ARGV[5] then
+  local live = cancelled(ARGV[6]) and 0 or 1
+  if ARGV[7] == '1' then
+    return {live, {}, {}}
+  end
+  emit(ARGV[5], ARGV[1])
+  return {live, {ARGV[5]}, {}}
+end
+if #ARGV[2] > 0 then
+  redis.call('APPEND', KEYS[3], ARGV[2])
+end
+local members = redis.call('HGETALL', KEYS[2])
+local channels = {}
+for i = 1, #members, 2 do
+  emit(members[i], ARGV[1])
+  table.insert(channels, members[i])
+end
+if ARGV[3] == '1' then
+  redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+  return {1, channels, {}}
+end
+local dropped = {}
+for i = 1, #members, 2 do
+  if cancelled(members[i + 1]) then
+    redis.call('HDEL', KEYS[2], members[i])
+    table.insert(dropped, members[i])
+  end
+end
+if #dropped * 2 == #members then
+  redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+  return {0, channels, dropped}
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+return {1, channels, dropped}
+"""
+
+FINAL_EVENTS = {"completed", "error", "cancelled"}
+
+
+class SingleFlight:
+    """
+    Gộp các câu hỏi giống hệt nhau đang được sinh cùng lúc (kể cả từ các
+    conversation khác nhau, trên các worker khác nhau) thành một lần gọi LLM.
+
+    Task đầu tiên với một khoá trở thành leader và sinh câu trả lời; các task
+    sau (follower) chỉ đăng ký channel của mình và kết thúc ngay. Mọi sự kiện
+    của leader được script Lua gửi tới channel của tất cả các conversation.
+    Mỗi sự kiện của leader gia hạn flight; nếu leader chết, flight tự hết hạn
+    sau `ttl_seconds` kể từ sự kiện cuối.
+
+    Mỗi lần gửi, script bỏ các conversation đã huỷ (stop, rời room) khỏi danh
+    sách nhận; leader gửi cho chúng sự kiện `cancelled` và chỉ dừng sinh khi
+    không còn conversation nào chờ.
+
+    `wire_version` (1 hoặc 2) là định dạng của các sự kiện do script tự tạo,
+    phải khớp với codec của publisher.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        ttl_seconds: int,
+        stream_maxlen: int = 0,
+        stream_ttl_seconds: int = 0,
+        prefix: str = "flight",
+        wire_version: int = 1
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.wire_version = wire_version
+        self.stream_maxlen = stream_maxlen
+        self.stream_ttl_seconds = stream_ttl_seconds
+        self.prefix = prefix
+        self._join = redis_client.register_script(_JOIN_SCRIPT)
+        self._fanout = redis_client.register_script(_FANOUT_SCRIPT)
+
+    def keys(self, key: str) -> list:
+        return [f"{self.prefix}:{key}", f"{self.prefix}:{key}:subs", f"{self.prefix}:{key}:text"]
+
+    def join(self, key: str, channel_name: str, member: str = ""):
+        """
+        Đăng ký `channel_name` cho flight `key` và gửi `processing` tới nó.
+        `member` (flight_member) cho biết khi nào conversation bị huỷ. Trả về 1
+        nếu là leader (coroutine với client redis.asyncio).
+        """
+        return self._join(
+            keys=self.keys(key),
+            args=[channel_name, self.ttl_seconds, self.wire_version, member, self.stream_maxlen, self.stream_ttl_seconds]
+        )
+
+    def fanout(
+        self, pipeline, key: str, channel_name: str, member: str, event_type: str, payload: str,
+        chunk: str = "", notices=(), skip_own: bool = False
+    ):
+        """
+        Gửi sự kiện của leader (`channel_name`/`member` là của leader khi join);
+        `notices` là các cặp (channel, payload) gửi trước sự kiện.
+        """
+        args = [
+            payload, chunk, "1" if event_type in FINAL_EVENTS else "0",
+            self.ttl_seconds, channel_name, member, "1" if skip_own else "0"
+        ]
+        for channel, notice in notices:
+            args.extend((channel, notice))
+        args.extend((self.stream_maxlen, self.stream_ttl_seconds))
+        return self._fanout(keys=self.keys(key), args=args, client=pipeline)
+
+
+def flight_member(cancel_key: str, since: float) -> str:
+    return f"{since}|{cancel_key}"
+
+
+def build_single_flight(settings, redis_client):
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return None
+    streams = settings.EVENT_BACKEND == "streams"
+    return SingleFlight(
+        redis_client,
+        settings.SINGLE_FLIGHT_TTL_SECONDS,
+        stream_maxlen=settings.EVENT_STREAM_MAXLEN if streams else 0,
+        stream_ttl_seconds=settings.EVENT_STREAM_TTL_SECONDS if streams else 0,
+        wire_version=2 if settings.WIRE_PROTOCOL == "compact" else 1
+    )
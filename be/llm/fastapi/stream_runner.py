@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+
+class StreamRunner:
+    """
+    Chạy nhiều luồng sinh câu trả lời đồng thời trên một event loop riêng
+    (thread nền) của mỗi process worker.
+
+    `submit` được gọi từ thread của task Celery: nó chờ tới khi còn slot
+    (tối đa `max_in_flight` luồng đang chạy) rồi giao coroutine cho loop và trả
+    về ngay. Vì vậy slot Celery chỉ bị giữ khi process đã đầy, và chính việc
+    chờ slot là cơ chế backpressure với broker.
+
+    Loop được tạo lười ở lần `submit` đầu tiên để không bị chia sẻ qua fork.
+    """
+
+    def __init__(self, handler, max_in_flight: int):
+        self.handler = handler
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="stream-runner", daemon=True)
+            thread.start()
+            self._loop, self._thread = loop, thread
+
+    async def _run(self, args):
+        try:
+            return await self.handler(*args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def submit(self, *args):
+        """Giao một luồng cho loop; trả về concurrent.futures.Future của handler."""
+        self._ensure_started()
+        self._slots.acquire()
+        with self._lock:
+            self._in_flight += 1
+        return asyncio.run_coroutine_threadsafe(self._run(args), self._loop)
+
+    def drain(self, timeout: float = None) -> bool:
+        """Chờ các luồng đang chạy kết thúc (dùng khi worker tắt); True nếu đã xong."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        acquired = 0
+        try:
+            for _ in range(self.max_in_flight):
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not self._slots.acquire(timeout=remaining):
+                    return False
+                acquired += 1
+            return True
+        finally:
+            for _ in range(acquired):
+                self._slots.release()
@@ -1,67 +1,373 @@
+import asyncio
 import os
 import sys
+import threading
+import time
 from celery import shared_task
 import redis
-from .chatbot import Chatbot
-import json
-import time
+from redis import asyncio as aioredis
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+from .chatbot import Chatbot, extract_content_from_chunk, preload_chat_model
+from .memory import build_memory, estimate_tokens
+from .publisher import AsyncFlightPublisher, AsyncTokenPublisher, FlightPublisher, FlushPolicy, TokenPublisher
+from .response_cache import build_response_cache
+from .semantic_cache import build_semantic_cache
+from .single_flight import build_single_flight, flight_member
+from .stream_runner import StreamRunner
 import traceback
     
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from core.config import settings 
+from core.cancellation import cancel_key
+from core.event_log import EventLog
+from core.history import enqueue_turns, turn_record
+from core.metrics import RATE_BUCKETS, Registry, RedisMetricsPusher, SampledLog
+from core.startup import StartupReport
+from core.wire import build_wire_codec
+
+# Client Redis, Chatbot (model) và các thành phần dùng chúng được tạo trong
+# init_worker_resources: sau fork ở worker_process_init (prefork), hoặc ở task
+# đầu tiên với pool solo/threads. Import module này không mở kết nối nào nên
+# process cha của worker không chia sẻ socket/channel cho các process con.
+redis_client = None
+semantic_cache = None
+chatbot = None
+event_log = None
+single_flight = None
+metrics_pusher = None
+flush_policy = None
+wire_codec = None
+log_sampled = None
+stream_runner = None
+_init_lock = threading.Lock()
+
+# Registry riêng của worker: toàn bộ được đẩy lên Redis và render ở /metrics của API
+registry = Registry()
+queue_wait = registry.histogram("chat_queue_wait_seconds", "Time from send_task to the worker starting the task")
+llm_ttft = registry.histogram("chat_llm_ttft_seconds", "Time from calling the model to its first chunk")
+llm_tokens_per_sec = registry.histogram(
+    "chat_llm_tokens_per_second", "Estimated generation speed per task after the first chunk", RATE_BUCKETS
+)
+task_duration = registry.histogram("chat_task_duration_seconds", "Total worker time per chat task")
+publish_latency = registry.histogram("chat_publish_seconds", "Redis round trip per publisher flush")
+task_errors = registry.counter("chat_task_errors_total", "Chat tasks that ended with an error event")
+cancelled_tasks = registry.counter("chat_cancelled_total", "Chat generations stopped by a cancel signal")
+coalesced_tasks = registry.counter("chat_coalesced_total", "Chat tasks served by another task's in-flight generation")
+
+
+def init_worker_resources(client=None):
+    """
+    Dựng client và Chatbot của process (một lần; gọi lại không làm gì). `client`
+    thay cho client Redis từ REDIS_URL (benchmark dùng fakeredis).
+    """
+    global redis_client, semantic_cache, chatbot, event_log, single_flight, metrics_pusher
+    global flush_policy, wire_codec, log_sampled, stream_runner
+    if chatbot is not None:
+        return
+    with _init_lock:
+        if chatbot is not None:
+            return
+        report = StartupReport("worker")
+        flush_policy = FlushPolicy(settings.TOKEN_FLUSH_INTERVAL_MS, settings.TOKEN_FLUSH_MAX_BYTES)
+        wire_codec = build_wire_codec(settings)
+        log_sampled = SampledLog(settings.LOG_SAMPLE_RATE)
+        # Loop của StreamRunner chỉ được tạo ở lần submit đầu tiên
+        stream_runner = StreamRunner(stream_chatbot_request, settings.WORKER_MAX_IN_FLIGHT)
+        with report.step("redis"):
+            redis_client = client if client is not None else redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        with report.step("semantic_cache"):
+            semantic_cache = build_semantic_cache(settings, log_sampled)
+        with report.step("chatbot"):
+            bot = Chatbot(response_cache=build_response_cache(settings, redis_client, semantic_cache))
+            if bot.response_cache is not None:
+                bot.response_cache.register_metrics(registry)
+            bot.memory = build_memory(settings, redis_client, bot.model)
+        event_log = (
+            EventLog(redis_client, settings.EVENT_STREAM_MAXLEN, settings.EVENT_STREAM_TTL_SECONDS)
+            if settings.EVENT_BACKEND == "streams" else None
+        )
+        single_flight = build_single_flight(settings, redis_client)
+        metrics_pusher = RedisMetricsPusher(registry, redis_client, interval=settings.METRICS_PUSH_INTERVAL_SECONDS)
+        if settings.STARTUP_WARMUP:
+            report.warm_up("redis", redis_client.ping)
+            if semantic_cache is not None:
+                report.warm_up("embedder", semantic_cache.embedder.embed, "warm up")
+            report.warm_up("model", bot.warm_up, settings.STARTUP_WARMUP_PROMPT)
+        # Gán cuối cùng: các thread khác chỉ thấy chatbot khi mọi thứ đã sẵn sàng
+        chatbot = bot
+        report.done()
+
+
+@worker_init.connect
+def preload_worker(**kwargs):
+    # Process cha của worker (trước fork): chỉ import thư viện, không tạo client
+    if settings.WORKER_PRELOAD_IMPORTS:
+        preload_chat_model()
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # Process con sau fork: tạo client riêng trước khi nhận task đầu tiên
+    init_worker_resources()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def save_semantic_cache(**kwargs):
+    # Chỉ process có thêm entry mới mới ghi file; save gộp với bản trong file
+    # nên các process con không ghi đè entry của nhau
+    if semantic_cache is not None and semantic_cache.dirty and settings.SEMANTIC_CACHE_PATH:
+        semantic_cache.save(settings.SEMANTIC_CACHE_PATH)
+
+@worker_process_shutdown.connect
+def flush_metrics(**kwargs):
+    # Chờ các luồng async đang chạy xong để không cắt ngang câu trả lời
+    if stream_runner is not None and stream_runner.in_flight:
+        stream_runner.drain(timeout=settings.WORKER_DRAIN_TIMEOUT_SECONDS)
+    if metrics_pusher is None:
+        return
+    try:
+        metrics_pusher.flush()
+    except Exception as e:
+        print(f"Error flushing worker metrics: {e}")
+
+def record_completion(conversation_id: str, started_at: float, enqueued_at, model_start: float, first_chunk_at, response: str):
+    if first_chunk_at is not None:
+        generation_seconds = time.monotonic() - first_chunk_at
+        if generation_seconds > 0:
+            llm_tokens_per_sec.observe(estimate_tokens(response) / generation_seconds)
+    duration = time.time() - started_at
+    task_duration.observe(duration)
+    metrics_pusher.maybe_flush()
+    log_sampled(
+        "chat_task_completed",
+        conversation_id=conversation_id,
+        queue_wait_ms=round((started_at - enqueued_at) * 1000, 1) if enqueued_at else None,
+        ttft_ms=round((first_chunk_at - model_start) * 1000, 1) if first_chunk_at else None,
+        duration_ms=round(duration * 1000, 1),
+        response_chars=len(response)
+    )
+
+
+def answered_conversations(publisher, conversation_id: str) -> set:
+    """
+    Conversation của task và của mọi follower đã nhận sự kiện kết thúc; với
+    single-flight, conversation đã huỷ giữa chừng không có trong đó.
+    """
+    if isinstance(publisher, (FlightPublisher, AsyncFlightPublisher)):
+        return {channel.split(":", 1)[1] for channel in publisher.subscribers}
+    return {conversation_id}
+
+
+def remember_all(publisher, message: str, conversation_id: str, response: str):
+    """Ghi bộ nhớ cho conversation của task và của mọi follower đã nhận câu trả lời."""
+    for subscriber_id in answered_conversations(publisher, conversation_id):
+        chatbot.remember(subscriber_id, message, response)
+
+
+def persist_turn(publisher, message: str, conversation_id: str, status: str, turn_id: str = None, owner: str = None, asked_at: float = None):
+    """
+    Xếp lượt vào hàng đợi lịch sử (HistoryWriter của API ghi xuống DB theo lô),
+    cho cả các follower; chỉ conversation của task mới mang `owner`. Trả về
+    coroutine nếu publisher dùng client redis.asyncio.
+    """
+    response = publisher.response
+    answered = answered_conversations(publisher, conversation_id)
+    records = [
+        turn_record(
+            subscriber_id, message, response, status, turn_id,
+            owner if subscriber_id == conversation_id else None, asked_at
+        )
+        for subscriber_id in answered
+    ]
+    # Conversation đã rời flight khi huỷ: câu trả lời tới lúc huỷ
+    for channel, partial in getattr(publisher, "dropped", {}).items():
+        subscriber_id = channel.split(":", 1)[1]
+        if subscriber_id not in answered:
+            records.append(turn_record(
+                subscriber_id, message, partial, "cancelled", turn_id,
+                owner if subscriber_id == conversation_id else None, asked_at
+            ))
+    return enqueue_turns(publisher.redis_client, settings.HISTORY_QUEUE_KEY, records)
+
+
+_async_redis_client = None
+_async_event_log = None
+_async_single_flight = None
 
-redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
-chatbot = Chatbot()
-
-def extract_content_from_chunk(chunk):
-    """Extract text content from different types of LangChain chunks"""
-    if hasattr(chunk, 'content') and chunk.content:
-        return chunk.content
-    elif hasattr(chunk, 'text') and chunk.text:
-        return chunk.text
-    elif hasattr(chunk, 'delta') and hasattr(chunk.delta, 'content') and chunk.delta.content:
-        return chunk.delta.content
-    elif isinstance(chunk, str):
-        return chunk
+
+def get_async_redis():
+    """Client redis.asyncio của loop StreamRunner (tạo trong loop, mỗi process một client)."""
+    global _async_redis_client, _async_event_log, _async_single_flight
+    if _async_redis_client is None:
+        _async_redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        if settings.EVENT_BACKEND == "streams":
+            _async_event_log = EventLog(_async_redis_client, settings.EVENT_STREAM_MAXLEN, settings.EVENT_STREAM_TTL_SECONDS)
+        _async_single_flight = build_single_flight(settings, _async_redis_client)
+    return _async_redis_client
+
+
+async def stream_chatbot_request(message: str, conversation_id: str, enqueued_at=None, task_id: str = None, owner: str = None):
+    """Bản async của process_chatbot_request, chạy trên loop của StreamRunner."""
+    init_worker_resources()
+    channel_name = f"chat:{conversation_id}"
+    started_at = time.time()
+    async_redis = get_async_redis()
+    flight_key = await chatbot.acoalescing_key(message, conversation_id) if _async_single_flight is not None else None
+
+    cancel_since = enqueued_at or started_at
+    if flight_key is not None:
+        member = flight_member(cancel_key(conversation_id), cancel_since)
+        if not await _async_single_flight.join(flight_key, channel_name, member):
+            coalesced_tasks.inc()
+            return
+        publisher = AsyncFlightPublisher(
+            _async_single_flight, flight_key, async_redis, channel_name, flush_policy, publish_latency=publish_latency,
+            cancel_key=cancel_key(conversation_id), cancel_since=cancel_since, codec=wire_codec
+        )
     else:
-        chunk_str = str(chunk)
-        print(f"Unknown chunk type: {type(chunk)}, content: {chunk_str}")
-        return ""
+        publisher = AsyncTokenPublisher(
+            async_redis, channel_name, flush_policy, _async_event_log, publish_latency,
+            cancel_key=cancel_key(conversation_id), cancel_since=cancel_since,
+            codec=wire_codec
+        )
+
+    try:
+        if flight_key is None:
+            await publisher.publish("processing", {})
+
+        model_start = time.monotonic()
+        first_chunk_at = None
+        stream = chatbot.astream(message, conversation_id)
+        try:
+            # Đã huỷ khi task còn trong hàng đợi thì không gọi model
+            if not publisher.cancelled:
+                async for chunk in stream:
+                    chunk_content = extract_content_from_chunk(chunk)
+                    if chunk_content:
+                        if first_chunk_at is None:
+                            first_chunk_at = time.monotonic()
+                            llm_ttft.observe(first_chunk_at - model_start)
+                        await publisher.add(chunk_content)
+                    if publisher.cancelled:
+                        break
+                    # Nhường loop sau mỗi chunk: chunk đã nằm sẵn trong buffer của
+                    # model không được để một luồng chiếm loop của các luồng khác
+                    await asyncio.sleep(0)
+        finally:
+            await stream.aclose()
+
+        if publisher.cancelled:
+            cancelled_tasks.inc()
+            await publisher.publish("cancelled", {"response": publisher.response})
+            if settings.HISTORY_ENABLED:
+                await persist_turn(publisher, message, conversation_id, "cancelled", task_id, owner, enqueued_at or started_at)
+            return
+
+        complete_response = publisher.response
+        await publisher.publish("completed", {"response": complete_response})
+        if settings.HISTORY_ENABLED:
+            await persist_turn(publisher, message, conversation_id, "completed", task_id, owner, enqueued_at or started_at)
+        # Tóm tắt hội thoại có thể gọi LLM đồng bộ, không chạy trên loop
+        await asyncio.to_thread(remember_all, publisher, message, conversation_id, complete_response)
+        record_completion(conversation_id, started_at, enqueued_at, model_start, first_chunk_at, complete_response)
+
+    except Exception as e:
+        error_message = str(e)
+        print(f"Error in stream_chatbot_request: {error_message}")
+        traceback.print_exc()
+        task_errors.inc()
+        await publisher.publish("error", {"error": error_message})
+
 
 @shared_task(bind=True)
 def process_chatbot_request(self, message: str, conversation_id: str):
+    init_worker_resources()
     channel_name = f"chat:{conversation_id}"
-    print('celery received task:', message, conversation_id)
+    started_at = time.time()
+    # `enqueued_at` là header do API gắn khi send_task
+    enqueued_at = getattr(self.request, 'enqueued_at', None)
+    # `owner` (header, username khi chat có JWT) được ghi vào lịch sử hội thoại
+    owner = getattr(self.request, 'owner', None)
+    if enqueued_at:
+        queue_wait.observe(max(0.0, started_at - enqueued_at))
+
+    if settings.WORKER_MODE == "async":
+        # Task kết thúc ngay khi luồng đã được nhận; kết quả đi qua Redis như bình thường
+        stream_runner.submit(message, conversation_id, enqueued_at, self.request.id, owner)
+        return {
+            "status": "accepted",
+            "conversation_id": conversation_id
+        }
+
+    flight_key = chatbot.coalescing_key(message, conversation_id) if single_flight is not None else None
+    # Tín hiệu huỷ được đọc kèm mỗi lần flush; luồng single-flight chỉ dừng khi
+    # mọi conversation đang chờ đều đã huỷ (xem _FlightMixin)
+    cancel_since = enqueued_at or started_at
+    if flight_key is not None:
+        # Câu hỏi giống hệt đang được task khác sinh: chỉ đăng ký nhận sự kiện
+        if not single_flight.join(flight_key, channel_name, flight_member(cancel_key(conversation_id), cancel_since)):
+            coalesced_tasks.inc()
+            return {
+                "status": "coalesced",
+                "conversation_id": conversation_id
+            }
+        publisher = FlightPublisher(
+            single_flight, flight_key, redis_client, channel_name, flush_policy, publish_latency=publish_latency,
+            cancel_key=cancel_key(conversation_id), cancel_since=cancel_since, codec=wire_codec
+        )
+    else:
+        publisher = TokenPublisher(
+            redis_client, channel_name, flush_policy, event_log, publish_latency,
+            cancel_key=cancel_key(conversation_id), cancel_since=cancel_since,
+            codec=wire_codec
+        )
 
     try:
-        redis_client.publish(channel_name, json.dumps({
-            "type": "processing",
-            "data": {} 
-        }))
-
-        complete_response = ""
-
-        for chunk in chatbot.ask(message):
-            chunk_content = extract_content_from_chunk(chunk)
-            
-            if chunk_content:
-                complete_response += chunk_content
-
-                redis_client.publish(channel_name, json.dumps({
-                    "type": "gen_token", 
-                    "data": {"data": chunk_content} 
-                }))
-            
-            time.sleep(0.02)
-
-        redis_client.publish(channel_name, json.dumps({
-            "type": "completed",
-            "data": {"response": complete_response}
-        }))
+        if flight_key is None:
+            publisher.publish("processing", {})
+
+        model_start = time.monotonic()
+        first_chunk_at = None
+        stream = chatbot.ask(message, conversation_id)
+        try:
+            # Đã huỷ khi task còn trong hàng đợi thì không gọi model
+            if not publisher.cancelled:
+                for chunk in stream:
+                    chunk_content = extract_content_from_chunk(chunk)
+                    
+                    if chunk_content:
+                        if first_chunk_at is None:
+                            first_chunk_at = time.monotonic()
+                            llm_ttft.observe(first_chunk_at - model_start)
+                        publisher.add(chunk_content)
+                    if publisher.cancelled:
+                        break
+        finally:
+            # Đóng generator để đóng luôn stream HTTP tới model
+            stream.close()
+
+        if publisher.cancelled:
+            cancelled_tasks.inc()
+            publisher.publish("cancelled", {"response": publisher.response})
+            if settings.HISTORY_ENABLED:
+                persist_turn(publisher, message, conversation_id, "cancelled", self.request.id, owner, enqueued_at or started_at)
+            return {
+                "status": "cancelled",
+                "conversation_id": conversation_id
+            }
+
+        complete_response = publisher.response
+        publisher.publish("completed", {"response": complete_response})
+        if settings.HISTORY_ENABLED:
+            persist_turn(publisher, message, conversation_id, "completed", self.request.id, owner, enqueued_at or started_at)
+        remember_all(publisher, message, conversation_id, complete_response)
+        record_completion(conversation_id, started_at, enqueued_at, model_start, first_chunk_at, complete_response)
         
+        # Câu trả lời đã nằm trong lịch sử hội thoại, không lưu lại trong result backend
         return {
             "status": "success",
-            "response": complete_response,
+            "response_chars": len(complete_response),
             "conversation_id": conversation_id
         }
         
@@ -69,10 +375,9 @@ def process_chatbot_request(self, message: str, conversation_id: str):
         error_message = str(e)
         print(f"Error in process_chatbot_request: {error_message}")
         traceback.print_exc()
+        task_errors.inc()
+        metrics_pusher.maybe_flush()
         
-        redis_client.publish(channel_name, json.dumps({
-            "type": "error",
-            "data": {"error": error_message} 
-        }))
+        publisher.publish("error", {"error": error_message})
         
         raise
\ No newline at end of file
@@ -0,0 +1,328 @@
+import asyncio
+import time
+import zlib
+from collections import deque
+
+from core.wire import FRAME_EVENT, Frame, is_frame, loads, parse_frame
+
+# Các sự kiện có thể gộp khi client đọc chậm: client chỉ nối chuỗi `data`
+MERGEABLE_EVENTS = {'gen_token'}
+# Sự kiện kết thúc lượt, không bao giờ bị bỏ khi bộ đệm đầy
+FINAL_EVENTS = {'completed', 'error', 'cancelled'}
+
+
+def event_payload(event_data: dict) -> dict:
+    """Lấy payload để emit; gắn kèm `event_id` khi sự kiện đến từ Redis Stream."""
+    payload = event_data.get('data', {})
+    if 'id' in event_data:
+        payload = {**payload, 'event_id': event_data['id']}
+    return payload
+
+
+def decode_event(data, event_id: str = None) -> tuple:
+    """
+    (event_name, payload) từ một bản tin Redis. Frame v2 chỉ được tách header,
+    payload là `Frame` giữ nguyên body; envelope JSON v1 được decode thành dict.
+    `event_id` (khi replay từ stream) thay cho ID gắn trong bản tin.
+    """
+    if is_frame(data):
+        frame = parse_frame(data, event_id)
+        return frame.event_name, frame
+    event_data = loads(data)
+    if event_id is not None:
+        event_data['id'] = event_id
+    return event_data.get('type'), event_payload(event_data)
+
+
+def payload_event_id(payload):
+    """ID stream của sự kiện (None nếu EVENT_BACKEND="pubsub")."""
+    if isinstance(payload, Frame):
+        return payload.event_id or None
+    return payload.get('event_id')
+
+
+def stream_id_key(event_id: str) -> tuple:
+    """ID của Redis Stream "<ms>-<seq>" thành tuple để so sánh thứ tự."""
+    ms, _, seq = str(event_id).partition('-')
+    return int(ms), int(seq or 0)
+
+
+def merge_payloads(last_payload, payload):
+    if isinstance(payload, Frame):
+        return Frame(payload.event_id, payload.seq, payload.code, last_payload.body + payload.body)
+    return {**payload, 'data': last_payload.get('data', '') + payload.get('data', '')}
+
+
+class FanoutStats:
+    """Số liệu của listener: lag (nhận từ Redis -> emit xong), số sự kiện gộp/bỏ."""
+
+    def __init__(self):
+        # Histogram (core.metrics) được gắn qua Fanout.register_metrics
+        self.lag_histogram = None
+        self.emit_histogram = None
+        self.received = 0
+        self.emitted = 0
+        self.merged = 0
+        self.dropped = 0
+        self.lag_ms_avg = 0.0
+        self.lag_ms_max = 0.0
+        self.emit_ms_avg = 0.0
+
+    def observe_emit(self, lag_seconds: float, emit_seconds: float):
+        self.emitted += 1
+        lag_ms = lag_seconds * 1000
+        # Trung bình trượt mũ, đủ rẻ để cập nhật cho từng sự kiện
+        self.lag_ms_avg += (lag_ms - self.lag_ms_avg) * 0.05
+        self.emit_ms_avg += (emit_seconds * 1000 - self.emit_ms_avg) * 0.05
+        self.lag_ms_max = max(self.lag_ms_max, lag_ms)
+        if self.lag_histogram is not None:
+            self.lag_histogram.observe(lag_seconds)
+            self.emit_histogram.observe(emit_seconds)
+
+    def snapshot(self, queue_depth: int, clients: int) -> dict:
+        snapshot = {
+            'received': self.received,
+            'emitted': self.emitted,
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'lag_ms_avg': round(self.lag_ms_avg, 3),
+            'lag_ms_max': round(self.lag_ms_max, 3),
+            'emit_ms_avg': round(self.emit_ms_avg, 3),
+            'queue_depth': queue_depth,
+            'clients': clients,
+        }
+        self.lag_ms_max = 0.0
+        return snapshot
+
+
+class ClientSender:
+    """
+    Bộ đệm gửi riêng cho một client, có task emit riêng nên một client chậm
+    không chặn các client/room khác.
+
+    Khi client chưa kịp nhận, các `gen_token` liên tiếp của cùng room được gộp
+    thành một sự kiện. Nếu bộ đệm vẫn đầy, `gen_token` của cùng room được gộp
+    dù không liền nhau; nếu không gộp được thì bỏ `gen_token` v1 cũ nhất
+    (`completed` v1 mang cả câu trả lời), rồi tới sự kiện không phải token và
+    không phải sự kiện kết thúc. Token dạng frame và sự kiện kết thúc không bao
+    giờ bị bỏ, khi đó bộ đệm được phép vượt giới hạn.
+
+    Client `compact` nhận frame v2 nguyên vẹn qua sự kiện `FRAME_EVENT`; client
+    khác nhận sự kiện v1 (frame được decode khi emit).
+
+    Trong lúc replay một room (`hold` -> `release`), sự kiện live của room đó
+    được giữ riêng và chỉ vào bộ đệm sau toàn bộ phần replay.
+    """
+
+    def __init__(self, sio, sid: str, max_buffered: int, stats: FanoutStats, compact: bool = False):
+        self.sio = sio
+        self.sid = sid
+        self.compact = compact
+        self.max_buffered = max_buffered
+        self.stats = stats
+        self._buffer = deque()
+        # Room đang replay -> sự kiện live đến trong lúc đó
+        self._held = {}
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def hold(self, room: str):
+        self._held.setdefault(room, [])
+
+    def release(self, room: str, last_event_id: str = None):
+        """Đưa sự kiện live đã giữ vào bộ đệm, bỏ các sự kiện đã gửi trong replay (ID <= `last_event_id`)."""
+        replayed_until = stream_id_key(last_event_id) if last_event_id else None
+        for event_name, payload, received_at in self._held.pop(room, ()):
+            event_id = payload_event_id(payload)
+            if replayed_until is not None and event_id and stream_id_key(event_id) <= replayed_until:
+                continue
+            self.push(room, event_name, payload, received_at)
+
+    def push(self, room: str, event_name: str, payload: dict, received_at: float, replay: bool = False):
+        held = self._held.get(room)
+        if held is not None and not replay:
+            held.append((event_name, payload, received_at))
+            return
+        if event_name in MERGEABLE_EVENTS and self._buffer:
+            last_room, last_event, last_payload, last_received_at = self._buffer[-1]
+            if last_room == room and last_event == event_name:
+                merged = merge_payloads(last_payload, payload)
+                self._buffer[-1] = (room, event_name, merged, last_received_at)
+                self.stats.merged += 1
+                return
+
+        if len(self._buffer) >= self.max_buffered:
+            self._drop_one()
+        self._buffer.append((room, event_name, payload, received_at))
+        self._ready.set()
+
+    def _drop_one(self):
+        if self._coalesce_one():
+            return
+        for index, item in enumerate(self._buffer):
+            if item[1] in MERGEABLE_EVENTS and not isinstance(item[2], Frame):
+                del self._buffer[index]
+                break
+        else:
+            # Token dạng frame không được bỏ: `completed` v2 chỉ mang độ dài +
+            # CRC32 nên client không khôi phục được phần đã mất
+            for index, item in enumerate(self._buffer):
+                if item[1] not in MERGEABLE_EVENTS and item[1] not in FINAL_EVENTS:
+                    del self._buffer[index]
+                    break
+            else:
+                return
+        self.stats.dropped += 1
+
+    def _coalesce_one(self) -> bool:
+        """
+        Gộp `gen_token` cũ nhất vào `gen_token` kế tiếp của cùng room (không có
+        sự kiện nào khác của room đó ở giữa) để giải phóng một chỗ mà không mất
+        text. False nếu không có cặp nào gộp được.
+        """
+        pending = {}
+        for index, (room, event_name, payload, _) in enumerate(self._buffer):
+            if event_name not in MERGEABLE_EVENTS:
+                pending.pop(room, None)
+                continue
+            first = pending.get(room)
+            if first is None:
+                pending[room] = index
+                continue
+            _, _, first_payload, first_received_at = self._buffer[first]
+            self._buffer[index] = (room, event_name, merge_payloads(first_payload, payload), first_received_at)
+            del self._buffer[first]
+            self.stats.merged += 1
+            return True
+        return False
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            while self._buffer:
+                room, event_name, payload, received_at = self._buffer.popleft()
+                start = time.monotonic()
+                # Client luôn nối vào node này: ignore_queue để không đi vòng qua
+                # Redis khi bật SOCKET_REDIS_MANAGER
+                try:
+                    if not isinstance(payload, Frame):
+                        await self.sio.emit(event_name, payload, to=self.sid, ignore_queue=True)
+                    elif self.compact:
+                        await self.sio.emit(FRAME_EVENT, payload.encode(), to=self.sid, ignore_queue=True)
+                    else:
+                        await self.sio.emit(event_name, payload.legacy_payload(), to=self.sid, ignore_queue=True)
+                except Exception as e:
+                    print(f"Error emitting {event_name} to {self.sid} ({room}): {e}")
+                self.stats.observe_emit(start - received_at, time.monotonic() - start)
+            self._ready.clear()
+
+    def close(self):
+        self._task.cancel()
+
+
+class Fanout:
+    """
+    Phân phối sự kiện từ Redis tới client qua các shard theo room.
+
+    Mỗi room luôn rơi vào cùng một shard (giữ thứ tự sự kiện trong room); mỗi
+    shard có hàng đợi giới hạn và một worker giải mã rồi đẩy sự kiện vào bộ đệm
+    của từng client trong room. Frame v2 chỉ được tách header, không decode.
+    """
+
+    def __init__(self, sio, shards: int, queue_size: int, client_buffer: int):
+        self.sio = sio
+        self.client_buffer = client_buffer
+        self.stats = FanoutStats()
+        self._queues = [asyncio.Queue(maxsize=queue_size) for _ in range(shards)]
+        self._senders = {}
+        self._compact_clients = set()
+        self._workers = []
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._shard_worker(queue)) for queue in self._queues]
+
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def snapshot(self) -> dict:
+        return self.stats.snapshot(self.queue_depth(), len(self._senders))
+
+    def register_metrics(self, registry):
+        self.stats.lag_histogram = registry.histogram(
+            "socket_listener_lag_seconds", "Time from receiving a Redis message to starting its emit"
+        )
+        self.stats.emit_histogram = registry.histogram("socket_emit_seconds", "Duration of a single sio.emit")
+        registry.counter("socket_events_received_total", "Events received from Redis", lambda: self.stats.received)
+        registry.counter("socket_events_merged_total", "gen_token events merged for slow clients", lambda: self.stats.merged)
+        registry.counter("socket_events_dropped_total", "Events dropped because a client buffer was full", lambda: self.stats.dropped)
+        registry.gauge("socket_fanout_queue_depth", "Messages waiting in the shard queues", self.queue_depth)
+
+    def _sender(self, sid: str):
+        """
+        Bộ gửi của `sid`; None nếu client đang ngắt kết nối. Handler disconnect
+        chạy trước khi manager bỏ sid khỏi các room, nên shard worker vẫn có thể
+        thấy sid sau remove_client và không được tạo lại sender cho nó.
+        """
+        sender = self._senders.get(sid)
+        if sender is None:
+            if not self.sio.manager.is_connected(sid, '/'):
+                return None
+            sender = self._senders[sid] = ClientSender(
+                self.sio, sid, self.client_buffer, self.stats, compact=sid in self._compact_clients
+            )
+        return sender
+
+    def set_client_wire(self, sid: str, version: int):
+        """Ghi nhận phiên bản giao thức client báo khi connect (2 = nhận frame)."""
+        if version >= 2:
+            self._compact_clients.add(sid)
+
+    def remove_client(self, sid: str):
+        self._compact_clients.discard(sid)
+        sender = self._senders.pop(sid, None)
+        if sender is not None:
+            sender.close()
+
+    def hold(self, sid: str, room: str):
+        """Giữ lại sự kiện live của `room` gửi tới `sid` cho tới khi `replay` xong."""
+        sender = self._sender(sid)
+        if sender is not None:
+            sender.hold(room)
+
+    def replay(self, sid: str, room: str, events: list):
+        """
+        Gửi các sự kiện replay (id, data) tới `sid`, sau đó mới tới các sự kiện
+        live đã giữ từ `hold` (trừ sự kiện đã có trong phần replay).
+        """
+        sender = self._sender(sid)
+        if sender is None:
+            return
+        last_event_id = None
+        for event_id, data in events:
+            event_name, payload = decode_event(data, event_id)
+            if event_name:
+                sender.push(room, event_name, payload, time.monotonic(), replay=True)
+            last_event_id = event_id
+        sender.release(room, last_event_id)
+
+    async def publish(self, room: str, data: bytes):
+        self.stats.received += 1
+        queue = self._queues[zlib.crc32(room.encode('utf-8')) % len(self._queues)]
+        await queue.put((room, data, time.monotonic()))
+
+    async def _shard_worker(self, queue: asyncio.Queue):
+        while True:
+            room, data, received_at = await queue.get()
+            try:
+                event_name, payload = decode_event(data)
+                if not event_name:
+                    print(f"Warning: Received message without a 'type' on {room}")
+                    continue
+                for sid, _ in self.sio.manager.get_participants('/', room):
+                    sender = self._sender(sid)
+                    if sender is not None:
+                        sender.push(room, event_name, payload, received_at)
+            except ValueError:
+                print(f"Error decoding message on {room}: {data}")
+            except Exception as e:
+                print(f"Error processing message from {room}: {e}")
@@ -7,12 +7,132 @@ from redis import asyncio as aioredis
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 from core.config import settings 
+from core.cancellation import request_cancel
+from core.event_log import replay_events
+from core.metrics import SampledLog, registry
+from core.wire import OrjsonModule
+from fanout import Fanout
+from subscriptions import RoomSubscriptions
 
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+
+def use_redis_manager():
+    """
+    Thay manager trong process của `sio` bằng AsyncRedisManager (nhiều node,
+    SOCKET_REDIS_MANAGER). Chỉ gọi trước client đầu tiên: manager được
+    initialize ở lần connect đầu. Client Redis của manager chỉ kết nối lúc đó.
+    """
+    manager = socketio.AsyncRedisManager(settings.REDIS_URL)
+    manager.set_server(sio)
+    sio.manager = manager
+
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', json=OrjsonModule)
+# Tạo trong init_redis (main() của socketio_main), không phải lúc import
+redis_conn = None
+fanout = None
+log_sampled = None
+# RoomSubscriptions khi SOCKET_SUBSCRIPTION_MODE="rooms", cũng tạo trong init_redis
+subscriptions = None
+connected_clients = registry.gauge("socket_connected_clients", "Connected Socket.IO clients")
+registry.gauge(
+    "socket_active_rooms",
+    "Chat rooms with at least one client",
+    lambda: sum(1 for room in sio.manager.rooms.get('/', {}) if room and room.startswith('chat:'))
+)
+# Room -> task chờ hết grace period rồi huỷ lượt sinh (bị huỷ nếu có client join lại)
+pending_cancels = {}
+
+
+def init_redis(client=None):
+    """
+    Client Redis, fanout và manager Socket.IO của process (một lần); `client`
+    thay cho client từ REDIS_URL.
+    """
+    global redis_conn, subscriptions, fanout, log_sampled
+    if redis_conn is None:
+        if settings.SOCKET_REDIS_MANAGER:
+            use_redis_manager()
+        log_sampled = SampledLog(settings.LOG_SAMPLE_RATE)
+        fanout = Fanout(
+            sio,
+            shards=settings.SOCKET_FANOUT_SHARDS,
+            queue_size=settings.SOCKET_FANOUT_QUEUE_SIZE,
+            client_buffer=settings.SOCKET_CLIENT_BUFFER_SIZE
+        )
+        fanout.register_metrics(registry)
+        redis_conn = client if client is not None else aioredis.from_url(settings.REDIS_URL)
+        if settings.SOCKET_SUBSCRIPTION_MODE == "rooms":
+            subscriptions = RoomSubscriptions(redis_conn, fanout, settings.SOCKET_SUBSCRIBE_TIMEOUT_SECONDS)
+            subscriptions.register_metrics(registry)
+    return redis_conn
+
+
+def room_is_empty(room_name: str) -> bool:
+    """Room không còn client trên node này."""
+    return next(iter(sio.manager.get_participants('/', room_name)), None) is None
+
+
+async def room_is_abandoned(room_name: str) -> bool:
+    """
+    Room không còn client trên toàn cụm. Ở chế độ "rooms" node nào có client
+    của room thì subscribe kênh của room, nên client reconnect sang node khác
+    trong grace period không bị huỷ lượt sinh; chế độ "pattern" chỉ biết client
+    của node này (đủ khi chạy một node).
+    """
+    if not room_is_empty(room_name):
+        return False
+    if subscriptions is not None:
+        return not await subscriptions.subscribed_elsewhere(room_name)
+    return True
+
+
+async def cancel_when_abandoned(room_name: str):
+    try:
+        await asyncio.sleep(settings.CANCEL_GRACE_SECONDS)
+        if await room_is_abandoned(room_name):
+            await request_cancel(redis_conn, room_name.split(':', 1)[1], settings.CANCEL_SIGNAL_TTL_SECONDS)
+            log_sampled("socket_cancel_requested", room=room_name, reason="abandoned")
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"Error requesting cancel for {room_name}: {e}")
+    finally:
+        if pending_cancels.get(room_name) is asyncio.current_task():
+            del pending_cancels[room_name]
+
+
+def schedule_cancel(room_name: str):
+    if room_name not in pending_cancels:
+        pending_cancels[room_name] = asyncio.create_task(cancel_when_abandoned(room_name))
+
+
+def abort_pending_cancel(room_name: str):
+    task = pending_cancels.pop(room_name, None)
+    if task is not None:
+        task.cancel()
+
+def parse_conversation_id(conversation):
+    """Client gửi conversation dạng dict, chuỗi JSON {new_conversation_id|conversation_id} hoặc chính ID."""
+    # convert conversation to json object 
+    if isinstance(conversation, str):
+        try:
+            conversation = json.loads(conversation)
+        except json.JSONDecodeError:
+            return conversation.strip() or None
+    if not isinstance(conversation, dict):
+        return None
+    return conversation.get('new_conversation_id') or conversation.get('conversation_id')
 
 @sio.event
-async def connect(sid, environ):
-    print(f"Client connected: {sid}")
+async def connect(sid, environ, auth=None):
+    # Client hỗ trợ frame v2 (core/wire.py) gửi auth {"wire": 2} khi connect
+    if isinstance(auth, dict):
+        try:
+            fanout.set_client_wire(sid, int(auth.get('wire', 1)))
+        except (TypeError, ValueError):
+            pass
+    connected_clients.inc()
+    log_sampled("socket_connected", sid=sid)
     await sio.emit('status', {'status': 'connected'}, room=sid) 
 
 # @sio.on('join_room-{id}')
@@ -27,74 +147,104 @@ async def connect(sid, environ):
 @sio.event
 async def join_room(sid, data):
     """Handle client joining a specific conversation room"""
-    conversation = data.get('conversation_id')
-    # convert conversation to json object 
-    if isinstance(conversation, str):
-        try:
-            conversation = json.loads(conversation)
-        except json.JSONDecodeError:
-            conversation = {}
-    conversation_id = conversation.get('new_conversation_id') or conversation.get('conversation_id')
+    conversation_id = parse_conversation_id(data.get('conversation_id'))
     if conversation_id:
         room_name = f"chat:{conversation_id}"
-        await sio.enter_room(sid, room_name)
-        print(f"Client {sid} joined room: {room_name}")
-        await sio.emit('room_joined', {
-            'conversation_id': conversation_id,
-            'message': f'Joined conversation {conversation_id}'
-        }, room=sid)
+        # Replay các sự kiện client đã bỏ lỡ (reconnect với last_event_id). Sự
+        # kiện live tới client này được giữ lại từ trước khi join cho tới khi
+        # replay xong, nên client nhận phần đã lỡ trước rồi mới tới live; sự
+        # kiện live đã có trong phần replay bị bỏ theo ID của stream.
+        last_event_id = data.get('last_event_id')
+        replay = settings.EVENT_BACKEND == "streams" and last_event_id is not None
+        if replay:
+            fanout.hold(sid, room_name)
+        events = []
+        try:
+            await sio.enter_room(sid, room_name)
+            abort_pending_cancel(room_name)
+            if subscriptions is not None:
+                # room_joined chỉ được gửi khi node đã nhận sự kiện của room
+                await subscriptions.join(sid, room_name)
+            log_sampled("socket_joined_room", sid=sid, room=room_name)
+            await sio.emit('room_joined', {
+                'conversation_id': conversation_id,
+                'message': f'Joined conversation {conversation_id}'
+            }, room=sid)
+            if replay:
+                events = await replay_events(redis_conn, room_name, str(last_event_id))
+        finally:
+            if replay:
+                fanout.replay(sid, room_name, events)
     else:
         await sio.emit('error', {'message': 'conversation_id is required'}, room=sid)
 
 @sio.event
 async def leave_room(sid, data):
     """Handle client leaving a specific conversation room"""
-    conversation_id = data.get('conversation_id')
+    conversation_id = parse_conversation_id(data.get('conversation_id'))
     if conversation_id:
         room_name = f"chat:{conversation_id}"
         await sio.leave_room(sid, room_name)
-        print(f"Client {sid} left room: {room_name}")
+        if subscriptions is not None:
+            await subscriptions.leave(sid, room_name)
+        log_sampled("socket_left_room", sid=sid, room=room_name)
+        if room_is_empty(room_name):
+            schedule_cancel(room_name)
+
+@sio.event
+async def stop_generation(sid, data):
+    """Client bấm dừng: huỷ ngay lượt sinh đang chạy của conversation."""
+    conversation_id = parse_conversation_id(data.get('conversation_id'))
+    if conversation_id:
+        await request_cancel(redis_conn, conversation_id, settings.CANCEL_SIGNAL_TTL_SECONDS)
+        log_sampled("socket_cancel_requested", sid=sid, room=f"chat:{conversation_id}", reason="stop")
 
 @sio.event
 async def disconnect(sid):
-    print(f"Client disconnected: {sid}")
+    # Client vẫn còn trong các room lúc này; kiểm tra room trống sau grace period
+    for room_name in sio.rooms(sid):
+        if room_name.startswith('chat:'):
+            schedule_cancel(room_name)
+            if subscriptions is not None:
+                await subscriptions.leave(sid, room_name)
+    fanout.remove_client(sid)
+    connected_clients.dec()
+    log_sampled("socket_disconnected", sid=sid)
+
+async def report_listener_stats(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        stats = fanout.snapshot()
+        if stats['received']:
+            print(f"Redis listener stats: {json.dumps(stats)}")
 
 async def redis_listener(sio_app):
     """
-    Lắng nghe các kênh chat:* trên Redis và emit sự kiện tới client.
+    Lắng nghe các kênh chat:* trên Redis và chuyển sự kiện cho `fanout`
+    (sio_app phải là instance `sio` mà `fanout` đang dùng). Ở chế độ "rooms"
+    chỉ nghe kênh của các room có client trên node này.
     """
-    redis_conn = aioredis.from_url(settings.REDIS_URL)
-    pubsub = redis_conn.pubsub()
-    await pubsub.psubscribe("chat:*")
-    print("Redis listener started...")
+    init_redis()
+    fanout.start()
+    asyncio.create_task(report_listener_stats(settings.SOCKET_STATS_INTERVAL_SECONDS))
+
+    if subscriptions is not None:
+        print("Redis room listener started...")
+        await subscriptions.run()
+        return
 
     while True:
         try:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-            if not message or message['type'] != 'pmessage':
-                await asyncio.sleep(0.01)
-                continue
-
-            room_name = message['channel'].decode('utf-8')
-            print(room_name)
-            
-            try:
-                event_data = json.loads(message['data'])
-                event_name = event_data.get('type')
-                payload = event_data.get('data', {})
-
-                if not event_name:
-                    print(f"Warning: Received message without a 'type' on {room_name}")
-                    continue
-                await sio_app.emit(event_name, payload, room=room_name)
-                print(f"Emitted {event_name} to room {room_name}")
+            pubsub = redis_conn.pubsub()
+            await pubsub.psubscribe("chat:*")
+            print("Redis listener started...")
 
-            except json.JSONDecodeError:
-                print(f"Error decoding JSON from message on {room_name}: {message['data']}")
-            except Exception as e:
-                print(f"Error processing message from {room_name}: {e}")
+            async for message in pubsub.listen():
+                if message['type'] != 'pmessage':
+                    continue
+                await fanout.publish(message['channel'].decode('utf-8'), message['data'])
 
         except Exception as e:
             print(f"Redis listener main loop error: {e}")
             # Đợi một chút trước khi thử lại để tránh vòng lặp lỗi nóng
-            await asyncio.sleep(1)
\ No newline at end of file
+            await asyncio.sleep(1)
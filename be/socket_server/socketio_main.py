@@ -1,12 +1,23 @@
 # socketio_main.py
 import uvicorn
 import asyncio
-from server import sio, redis_listener
+from server import sio, init_redis, redis_listener
 from socketio import ASGIApp
+from core.config import settings
+from core.metrics import make_metrics_app, registry
+from core.startup import StartupReport
 
-sio_asgi_app = ASGIApp(sio)
+# Các path không phải /socket.io (vd. GET /metrics) được chuyển cho app metrics
+sio_asgi_app = ASGIApp(sio, other_asgi_app=make_metrics_app(registry.render))
 
 async def main():
+    # Client Redis được tạo trong loop của process này, không phải lúc import
+    report = StartupReport("socket")
+    with report.step("redis"):
+        redis_conn = init_redis()
+    if settings.STARTUP_WARMUP:
+        await report.awarm_up("redis", redis_conn.ping)
+    report.done()
     listener_task = asyncio.create_task(redis_listener(sio))
     
     config = uvicorn.Config(sio_asgi_app, host="0.0.0.0", port=9000, log_level="info")
@@ -0,0 +1,146 @@
+import asyncio
+from collections import deque
+
+
+class RoomSubscriptions:
+    """
+    SUBSCRIBE theo room cho SOCKET_SUBSCRIPTION_MODE="rooms": mỗi node chỉ nhận
+    sự kiện của các room có client nối vào chính nó, nên khi thêm node thì lưu
+    lượng Redis mỗi node nhận không tăng theo (khác PSUBSCRIBE chat:*, nơi mọi
+    node nhận và giải mã mọi sự kiện rồi bỏ đi phần lớn).
+
+    Kênh được SUBSCRIBE khi client đầu tiên của node join room và UNSUBSCRIBE
+    khi client cuối cùng rời room hoặc ngắt kết nối. `join` chỉ trả về khi Redis
+    đã xác nhận SUBSCRIBE, nên client nhận room_joined rồi thì không lỡ sự kiện
+    live nào publish sau đó. Chỉ dùng trên event loop nên không cần lock.
+    """
+
+    def __init__(self, redis_conn, fanout, subscribe_timeout: float = 2.0):
+        self.redis_conn = redis_conn
+        self.fanout = fanout
+        self.subscribe_timeout = subscribe_timeout
+        self.pubsub = redis_conn.pubsub()
+        self._members = {}
+        # Room -> các future chờ xác nhận, một future cho mỗi SUBSCRIBE đã gửi
+        self._confirmations = {}
+        self._active = asyncio.Event()
+        self.subscribes = 0
+        self.unsubscribes = 0
+
+    def rooms(self) -> int:
+        return len(self._members)
+
+    def register_metrics(self, registry):
+        registry.gauge("socket_subscribed_rooms", "Redis channels this node is subscribed to", self.rooms)
+        registry.counter("socket_room_subscribes_total", "SUBSCRIBE sent for rooms", lambda: self.subscribes)
+        registry.counter("socket_room_unsubscribes_total", "UNSUBSCRIBE sent for rooms", lambda: self.unsubscribes)
+
+    async def join(self, sid: str, room: str):
+        members = self._members.setdefault(room, set())
+        first = not members
+        members.add(sid)
+        if first:
+            try:
+                await self._subscribe(room)
+            except Exception as e:
+                # run() sẽ subscribe lại mọi room khi kết nối Redis hồi phục
+                print(f"Error subscribing to {room}: {e}")
+                return
+        confirmations = self._confirmations.get(room)
+        if confirmations:
+            # Client thứ hai join trong lúc chờ xác nhận cũng chờ cùng future đó
+            try:
+                await asyncio.wait_for(asyncio.shield(confirmations[-1]), self.subscribe_timeout)
+            except asyncio.TimeoutError:
+                print(f"Timed out waiting for Redis to confirm SUBSCRIBE {room}")
+
+    async def _subscribe(self, room: str):
+        # Ghi future trước khi gửi: xác nhận có thể được đọc trước khi subscribe() trả về
+        future = asyncio.get_running_loop().create_future()
+        self._confirmations.setdefault(room, deque()).append(future)
+        self.subscribes += 1
+        try:
+            await self.pubsub.subscribe(room)
+        except Exception:
+            self._confirmations[room].remove(future)
+            raise
+        self._active.set()
+
+    async def leave(self, sid: str, room: str):
+        members = self._members.get(room)
+        if not members or sid not in members:
+            return
+        members.discard(sid)
+        if members:
+            return
+        del self._members[room]
+        self.unsubscribes += 1
+        try:
+            await self.pubsub.unsubscribe(room)
+        except Exception as e:
+            print(f"Error unsubscribing from {room}: {e}")
+
+    async def subscribed_elsewhere(self, room: str) -> bool:
+        """
+        Có node khác đang subscribe kênh của room (tức là có client của room ở
+        node đó). Node này đã UNSUBSCRIBE khi room trống tại chỗ nên không tự đếm mình.
+        """
+        if room in self._members:
+            return True
+        counts = await self.redis_conn.pubsub_numsub(room)
+        return bool(counts and counts[0][1])
+
+    def _confirmed(self, room: str):
+        confirmations = self._confirmations.get(room)
+        # Xác nhận do redis-py tự subscribe lại sau reconnect thì không có future
+        if not confirmations:
+            return
+        future = confirmations.popleft()
+        if not confirmations:
+            del self._confirmations[room]
+        if not future.done():
+            future.set_result(None)
+
+    async def _resubscribe(self):
+        """Tạo pubsub mới và subscribe lại mọi room còn client sau lỗi kết nối."""
+        try:
+            await self.pubsub.aclose()
+        except Exception:
+            pass
+        # Join đang chờ xác nhận của kết nối cũ không đợi hết timeout
+        for confirmations in self._confirmations.values():
+            for future in confirmations:
+                if not future.done():
+                    future.set_result(None)
+        self._confirmations.clear()
+        self.pubsub = self.redis_conn.pubsub()
+        if not self._members:
+            self._active.clear()
+            return
+        try:
+            await self.pubsub.subscribe(*self._members)
+            print(f"Redis room listener resubscribed {len(self._members)} rooms")
+        except Exception as e:
+            print(f"Error resubscribing rooms: {e}")
+
+    async def run(self):
+        """Đọc bản tin của các kênh đã subscribe và chuyển cho `fanout`."""
+        while True:
+            # Pubsub chưa subscribe kênh nào thì không có kết nối để đọc
+            await self._active.wait()
+            try:
+                message = await self.pubsub.get_message(timeout=None)
+                if message is None:
+                    continue
+                kind = message['type']
+                if kind == 'message':
+                    await self.fanout.publish(message['channel'].decode('utf-8'), message['data'])
+                elif kind == 'subscribe':
+                    self._confirmed(message['channel'].decode('utf-8'))
+                elif kind == 'unsubscribe' and not self.pubsub.subscribed:
+                    self._active.clear()
+            except Exception as e:
+                print(f"Redis room listener error: {e}")
+                # Đợi một chút trước khi thử lại để tránh vòng lặp lỗi nóng
+                await asyncio.sleep(1)
+                await self._resubscribe()
@@ -30,6 +30,9 @@ export default function Home() {
     isLoading, 
     error, 
     sendMessage, 
+    retryMessage, 
+    canRetry, 
+    stopGeneration, 
     clearMessages, 
     streamingState 
   } = useChat(socket, conversationId);
@@ -118,7 +121,7 @@ export default function Home() {
       <Header onClearChat={handleClearChat} onLogout={handleLogout} />
       
       {error && (
-        <ErrorMessage message={error} onDismiss={() => { /* logic xóa lỗi */ }} />
+        <ErrorMessage message={error} onRetry={canRetry ? retryMessage : undefined} onDismiss={() => { /* logic xóa lỗi */ }} />
       )}
       
       <ChatHistory 
@@ -129,6 +132,7 @@ export default function Home() {
       
       <ChatInput 
         onSendMessage={sendMessage}
+        onStop={stopGeneration}
         isLoading={isLoading || streamingState.isProcessing || !!streamingState.currentToken}
       />
     </div>
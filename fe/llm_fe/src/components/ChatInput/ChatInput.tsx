@@ -4,9 +4,11 @@ import styles from './ChatInput.module.css';
 interface ChatInputProps {
   onSendMessage: (message: string) => void;
   isLoading: boolean;
+  // Khi có onStop, nút gửi thành nút dừng trong lúc đang sinh câu trả lời
+  onStop?: () => void;
 }
 
-export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, isLoading }) => {
+export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, isLoading, onStop }) => {
   const [message, setMessage] = useState('');
 
   const handleSend = () => {
@@ -16,6 +18,8 @@ export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, isLoading }
     }
   };
 
+  const canStop = isLoading && !!onStop;
+
   const handleKeyPress = (e: KeyboardEvent<HTMLTextAreaElement>) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -61,12 +65,17 @@ export const ChatInput: React.FC<ChatInputProps> = ({ onSendMessage, isLoading }
           />
           
           <button
-            className={`${styles.sendButton} ${message.trim() && !isLoading ? styles.active : ''}`}
-            onClick={handleSend}
-            disabled={!message.trim() || isLoading}
+            className={`${styles.sendButton} ${(message.trim() && !isLoading) || canStop ? styles.active : ''}`}
+            onClick={canStop ? onStop : handleSend}
+            disabled={!canStop && (!message.trim() || isLoading)}
             type="button"
+            title={canStop ? 'Stop generating' : undefined}
           >
-            {isLoading ? (
+            {canStop ? (
+              <svg width="20" height="20" viewBox="0 0 24 24" fill="none" className={styles.stopIcon}>
+                <rect x="6" y="6" width="12" height="12" rx="2" fill="currentColor" />
+              </svg>
+            ) : isLoading ? (
               <div className={styles.loadingSpinner}>
                 <svg width="20" height="20" viewBox="0 0 24 24">
                   <circle cx="12" cy="12" r="3" fill="currentColor" opacity="0.3">
@@ -4,9 +4,10 @@ import styles from './ErrorMessage.module.css';
 interface ErrorMessageProps {
   message: string;
   onDismiss?: () => void;
+  onRetry?: () => void;
 }
 
-export const ErrorMessage: React.FC<ErrorMessageProps> = ({ message, onDismiss }) => {
+export const ErrorMessage: React.FC<ErrorMessageProps> = ({ message, onDismiss, onRetry }) => {
   return (
     <div className={styles.errorContainer}>
       <div className={styles.errorMessage}>
@@ -14,6 +15,15 @@ export const ErrorMessage: React.FC<ErrorMessageProps> = ({ message, onDismiss }
         <div className={styles.errorContent}>
           <span className={styles.errorText}>{message}</span>
         </div>
+        {onRetry && (
+          <button 
+            className={styles.retryButton}
+            onClick={onRetry}
+            title="Retry"
+          >
+            Retry
+          </button>
+        )}
         {onDismiss && (
           <button 
             className={styles.dismissButton}
@@ -3,6 +3,7 @@
 
 import React, { createContext, useContext, useEffect, useState } from 'react';
 import io, { Socket } from 'socket.io-client';
+import { WIRE_VERSION } from '@/services/wire';
 
 const SOCKET_URL = process.env.NEXT_PUBLIC_SOCKET_URL || 'http://localhost:9000';
 
@@ -28,6 +29,7 @@ export const SocketProvider = ({ children }: { children: React.ReactNode }) => {
     const newSocket = io(SOCKET_URL, {
       reconnection: true,
       transports: ['websocket'], // Ưu tiên websocket
+      auth: { wire: WIRE_VERSION }, // Nhận sự kiện dạng frame v2 (services/wire.ts)
     });
 
     // Listener debug "bắt tất cả" sự kiện
@@ -164,10 +164,11 @@
 
 // hooks/useChat.ts
 
-import { useState, useCallback, useEffect } from 'react';
+import { useState, useCallback, useEffect, useRef } from 'react';
 import { Socket } from 'socket.io-client';
 import { Message, StreamingState } from '@/types/chat'; // Giả sử bạn có file types này
 import { ChatService } from '@/services/chatService';
+import { FRAME_EVENT, completionSummary, parseFrame } from '@/services/wire';
 
 export const useChat = (socket: Socket | null, conversationId: string) => {
   const [messages, setMessages] = useState<Message[]>([]);
@@ -177,6 +178,20 @@ export const useChat = (socket: Socket | null, conversationId: string) => {
     isProcessing: false,
     currentToken: '',
   });
+  // Câu trả lời đã stream của lượt hiện tại và seq frame cuối cùng đã xử lý
+  const streamedRef = useRef('');
+  const lastSeqRef = useRef(0);
+  // ID stream của sự kiện cuối đã nhận (EVENT_BACKEND="streams"), gửi kèm khi
+  // join lại sau reconnect để server replay phần đã lỡ
+  const lastEventIdRef = useRef<string | null>(null);
+  // Tin nhắn gửi lỗi gần nhất, giữ lại để gửi lại với cùng Idempotency-Key
+  const pendingRef = useRef<{ conversationId: string; message: Message } | null>(null);
+  const [canRetry, setCanRetry] = useState(false);
+
+  // ID stream thuộc về từng conversation
+  useEffect(() => {
+    lastEventIdRef.current = null;
+  }, [conversationId]);
 
   // ========== ĐĂNG KÝ CÁC EVENT LISTENER CỦA SOCKET ==========
   useEffect(() => {
@@ -187,17 +202,27 @@ export const useChat = (socket: Socket | null, conversationId: string) => {
 
     console.log(`[useChat] Attaching listeners to socket id: ${socket.id}`);
 
+    const rememberEventId = (eventId?: string) => {
+      if (eventId) {
+        lastEventIdRef.current = eventId;
+      }
+    };
+
     // Handler khi backend bắt đầu xử lý
-    const handleProcessing = () => {
+    const handleProcessing = (payload?: { event_id?: string }) => {
       console.log('[HANDLER] Received event: processing');
+      rememberEventId(payload?.event_id);
+      streamedRef.current = '';
       setStreamingState({ isProcessing: true, currentToken: '' });
     };
 
     // Handler khi nhận được một token mới
-    const handleGenToken = (payload: { data: string }) => {
+    const handleGenToken = (payload: { data: string; event_id?: string }) => {
       console.log('[HANDLER] Received event: gen_token with payload:', payload);
+      rememberEventId(payload.event_id);
       // Đảm bảo payload có cấu trúc đúng
       if (typeof payload.data === 'string') {
+        streamedRef.current += payload.data;
         setStreamingState(prev => ({
           ...prev,
           isProcessing: false, // Không còn processing nữa vì đã có token
@@ -206,13 +231,26 @@ export const useChat = (socket: Socket | null, conversationId: string) => {
       }
     };
 
+    // Frame v2 có thể chỉ mang độ dài + CRC32 thay vì cả câu trả lời: dùng
+    // phần đã stream và cảnh báo nếu không khớp (mất token giữa chừng)
+    const finalResponse = (payload: { response?: string; length?: number; crc32?: string }) => {
+      if (typeof payload.response === 'string') {
+        return payload.response;
+      }
+      const summary = completionSummary(streamedRef.current);
+      if (payload.crc32 !== undefined && (summary.crc32 !== payload.crc32 || summary.length !== payload.length)) {
+        console.warn('[HANDLER] Streamed response does not match completion digest', payload, summary);
+      }
+      return streamedRef.current;
+    };
+
     // Handler khi luồng trả về hoàn tất
-    const handleCompleted = (payload: { response: string }) => {
+    const handleCompleted = (payload: { response?: string; length?: number; crc32?: string; event_id?: string }) => {
       console.log('[HANDLER] Received event: completed with payload:', payload);
-      // Khi hoàn thành, ta không cần dựa vào currentToken nữa, vì backend đã gửi về câu trả lời hoàn chỉnh
+      rememberEventId(payload.event_id);
       const assistantMessage: Message = {
         id: Date.now().toString(),
-        content: payload.response, // Lấy response cuối cùng từ backend
+        content: finalResponse(payload),
         role: 'assistant',
         timestamp: new Date(),
       };
@@ -223,66 +261,171 @@ export const useChat = (socket: Socket | null, conversationId: string) => {
       setIsLoading(false); // Kết thúc loading
     };
 
+    // Handler khi lượt sinh bị huỷ (người dùng bấm dừng): giữ lại phần đã sinh
+    const handleCancelled = (payload: { response?: string; length?: number; crc32?: string; event_id?: string }) => {
+      console.log('[HANDLER] Received event: cancelled with payload:', payload);
+      rememberEventId(payload.event_id);
+      const response = finalResponse(payload);
+      if (response) {
+        const partialMessage: Message = {
+          id: Date.now().toString(),
+          content: response,
+          role: 'assistant',
+          timestamp: new Date(),
+        };
+        setMessages(prev => [...prev, partialMessage]);
+      }
+      setStreamingState({ isProcessing: false, currentToken: '' });
+      setIsLoading(false);
+    };
+
     // Handler khi có lỗi từ backend
-    const handleError = (payload: { error: string }) => {
+    const handleError = (payload: { error: string; event_id?: string }) => {
       console.error('[HANDLER] Received event: error with payload:', payload);
+      rememberEventId(payload.event_id);
       setError(payload.error || 'An unknown error occurred.');
       setStreamingState({ isProcessing: false, currentToken: '' });
       setIsLoading(false);
     };
 
+    // Frame v2: chuyển về các handler ở trên; seq trùng (replay + live) bị bỏ qua
+    const handleFrame = (raw: string) => {
+      const frame = parseFrame(raw);
+      if (!frame) {
+        console.warn('[HANDLER] Invalid frame:', raw);
+        return;
+      }
+      if (frame.code === 'p') {
+        lastSeqRef.current = 0;
+      }
+      if (frame.seq > 0) {
+        if (frame.seq <= lastSeqRef.current) return;
+        lastSeqRef.current = frame.seq;
+      }
+      rememberEventId(frame.eventId);
+      switch (frame.code) {
+        case 'p':
+          handleProcessing();
+          break;
+        case 't':
+          handleGenToken({ data: frame.body });
+          break;
+        case 'c':
+          handleCompleted(JSON.parse(frame.body));
+          break;
+        case 'x':
+          handleCancelled(JSON.parse(frame.body));
+          break;
+        case 'e':
+          handleError(JSON.parse(frame.body));
+          break;
+      }
+    };
+
+    // Sau reconnect socket có sid mới và không còn trong room: join lại kèm
+    // last_event_id để nhận các sự kiện đã lỡ trước rồi mới tới sự kiện live
+    const handleReconnect = () => {
+      if (!conversationId) return;
+      socket.emit('join_room', {
+        conversation_id: conversationId,
+        ...(lastEventIdRef.current ? { last_event_id: lastEventIdRef.current } : {}),
+      });
+    };
+
     // Đăng ký các listeners
+    socket.io.on('reconnect', handleReconnect);
+    socket.on(FRAME_EVENT, handleFrame);
     socket.on('processing', handleProcessing);
     socket.on('gen_token', handleGenToken);
     socket.on('completed', handleCompleted);
+    socket.on('cancelled', handleCancelled);
     socket.on('error', handleError);
 
     // Hàm dọn dẹp: Hủy đăng ký các listeners khi component unmount hoặc socket thay đổi
     return () => {
       console.log(`[useChat] Cleaning up listeners for socket id: ${socket.id}`);
+      socket.io.off('reconnect', handleReconnect);
+      socket.off(FRAME_EVENT, handleFrame);
       socket.off('processing', handleProcessing);
       socket.off('gen_token', handleGenToken);
       socket.off('completed', handleCompleted);
+      socket.off('cancelled', handleCancelled);
       socket.off('error', handleError);
     };
-  }, [socket]); // Chỉ re-run effect nếu instance socket thay đổi
+  }, [socket, conversationId]); // Re-run khi instance socket hoặc conversation thay đổi
 
   // ========== HÀM GỬI TIN NHẮN ==========
-  const sendMessage = useCallback(async (content: string) => {
-    if (!content.trim() || isLoading) return;
-
-    // Reset các state trước khi gửi
+  // Gửi (hoặc gửi lại) một tin nhắn đã có trong danh sách. ID của tin nhắn là
+  // Idempotency-Key nên mọi lần gửi lại đều dùng cùng key: server trả về task
+  // cũ nếu lần trước thực ra đã tới nơi
+  const deliverMessage = useCallback(async (userMessage: Message) => {
     setIsLoading(true);
     setError(null);
+    setCanRetry(false);
     setStreamingState({ isProcessing: false, currentToken: '' });
-
-    const userMessage: Message = {
-      id: Date.now().toString(),
-      content,
-      role: 'user',
-      timestamp: new Date(),
-    };
-
-    setMessages(prev => [...prev, userMessage]);
+    pendingRef.current = { conversationId, message: userMessage };
 
     try {
       // Gửi request tới API Server để kích hoạt Celery task
       await ChatService.sendMessage({
-        message: content,
+        message: userMessage.content,
         conversation: conversationId,
-      });
+      }, userMessage.id);
+      pendingRef.current = null;
       // Không cần làm gì với response ở đây, vì mọi cập nhật sẽ đến qua Socket.IO
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Failed to send message.';
       console.error(errorMessage);
       setError(errorMessage);
+      setCanRetry(true);
       setIsLoading(false); // Dừng loading nếu API call thất bại
     }
-  }, [conversationId, isLoading]);
+  }, [conversationId]);
+
+  const sendMessage = useCallback(async (content: string) => {
+    if (!content.trim() || isLoading) return;
+
+    // Gõ lại đúng tin nhắn vừa gửi lỗi là gửi lại chính nó (cùng key), không
+    // thêm tin nhắn trùng
+    const pending = pendingRef.current;
+    if (pending && pending.conversationId === conversationId && pending.message.content === content) {
+      await deliverMessage(pending.message);
+      return;
+    }
+
+    // ID riêng của tin nhắn, cũng là Idempotency-Key: chỉ lần gửi lặp của
+    // chính tin nhắn này bị server gộp, câu hỏi trùng nội dung vẫn được trả lời
+    const userMessage: Message = {
+      id: `${Date.now()}-${Math.random().toString(36).slice(2, 10)}`,
+      content,
+      role: 'user',
+      timestamp: new Date(),
+    };
+
+    setMessages(prev => [...prev, userMessage]);
+    await deliverMessage(userMessage);
+  }, [conversationId, isLoading, deliverMessage]);
+
+  // ========== HÀM GỬI LẠI TIN NHẮN LỖI ==========
+  const retryMessage = useCallback(async () => {
+    const pending = pendingRef.current;
+    if (!pending || pending.conversationId !== conversationId || isLoading) return;
+    await deliverMessage(pending.message);
+  }, [conversationId, isLoading, deliverMessage]);
+
+  // ========== HÀM DỪNG SINH CÂU TRẢ LỜI ==========
+  const stopGeneration = useCallback(() => {
+    if (socket && isLoading) {
+      // Backend sẽ gửi lại sự kiện 'cancelled' kèm phần câu trả lời đã sinh
+      socket.emit('stop_generation', { conversation_id: conversationId });
+    }
+  }, [socket, conversationId, isLoading]);
 
   // ========== HÀM XÓA TIN NHẮN ==========
   const clearMessages = useCallback(() => {
     setMessages([]);
+    pendingRef.current = null;
+    setCanRetry(false);
     setError(null);
     setStreamingState({ isProcessing: false, currentToken: '' });
     // Có thể thêm logic gọi API để xóa conversation trên server ở đây
@@ -293,6 +436,9 @@ export const useChat = (socket: Socket | null, conversationId: string) => {
     isLoading,
     error,
     sendMessage,
+    retryMessage,
+    canRetry,
+    stopGeneration,
     clearMessages,
     streamingState,
   };
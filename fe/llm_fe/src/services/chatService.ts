@@ -30,7 +30,9 @@ export class ChatService {
     }
   }
 
-  static async sendMessage(request: ChatRequest): Promise<ChatResponse> {
+  // `idempotencyKey` giống nhau cho mọi lần gửi lại cùng một tin nhắn: server
+  // trả về task_id cũ thay vì sinh câu trả lời lần nữa
+  static async sendMessage(request: ChatRequest, idempotencyKey?: string): Promise<ChatResponse> {
     try {
       console.log('Sending message to API:', request);
       console.log('API endpoint:', `${API_BASE_URL}/api/chat`);
@@ -39,6 +41,7 @@ export class ChatService {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
         },
         body: JSON.stringify(request),
       });
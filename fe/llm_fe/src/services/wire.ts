@@ -0,0 +1,48 @@
+// Frame v2 của socket server (be/core/wire.py): "2|<event_id>|<seq>|<code>|<body>"
+// gửi qua sự kiện 'f' khi client connect với auth { wire: 2 }.
+
+export const WIRE_VERSION = 2;
+export const FRAME_EVENT = 'f';
+
+export interface Frame {
+  eventId: string;
+  seq: number;
+  code: string;
+  body: string;
+}
+
+export const parseFrame = (raw: string): Frame | null => {
+  // Body là phần còn lại sau dấu '|' thứ tư, có thể chứa '|'
+  const parts: string[] = [];
+  let start = 0;
+  for (let i = 0; i < 4; i++) {
+    const end = raw.indexOf('|', start);
+    if (end < 0) return null;
+    parts.push(raw.slice(start, end));
+    start = end + 1;
+  }
+  if (parts[0] !== String(WIRE_VERSION)) return null;
+  return { eventId: parts[1], seq: Number(parts[2]), code: parts[3], body: raw.slice(start) };
+};
+
+const CRC_TABLE = (() => {
+  const table = new Uint32Array(256);
+  for (let n = 0; n < 256; n++) {
+    let c = n;
+    for (let k = 0; k < 8; k++) {
+      c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+    }
+    table[n] = c >>> 0;
+  }
+  return table;
+})();
+
+// Độ dài (byte UTF-8) và CRC32 của câu trả lời, giống completion_summary ở backend
+export const completionSummary = (text: string): { length: number; crc32: string } => {
+  const bytes = new TextEncoder().encode(text);
+  let crc = 0xffffffff;
+  for (let i = 0; i < bytes.length; i++) {
+    crc = CRC_TABLE[(crc ^ bytes[i]) & 0xff] ^ (crc >>> 8);
+  }
+  return { length: bytes.length, crc32: ((crc ^ 0xffffffff) >>> 0).toString(16).padStart(8, '0') };
+};